@@ -0,0 +1,180 @@
+import os, time, argparse
+from datetime import datetime
+import cv2
+import numpy as np
+
+from config import config
+from columnar_store import ColumnarStore
+
+### CLOTHING COLOUR ATTRIBUTES
+
+# Pixels are classed into 12 hue bins plus 3 achromatic bins.
+HUE_BINS = 12
+BLACK, GRAY, WHITE = HUE_BINS, HUE_BINS + 1, HUE_BINS + 2
+NUM_BINS = HUE_BINS + 3
+PATCH_SIZE = 16  # Regions are resized to PATCH_SIZE x PATCH_SIZE before binning
+
+# Hue bins are 30 degrees wide, starting at 345 degrees so red is centred
+COLOR_BINS = {
+    "red": [0],
+    "orange": [1],
+    "yellow": [2],
+    "green": [3, 4, 5],
+    "cyan": [6],
+    "blue": [7, 8],
+    "purple": [9, 10],
+    "pink": [11],
+    "black": [BLACK],
+    "gray": [GRAY],
+    "white": [WHITE],
+}
+
+REGIONS = {"upper": 0, "lower": 1}
+
+def clothing_regions(face_box, frame_height, frame_width):
+    """
+    Estimate upper- and lower-garment boxes from a face box: the torso spans
+    1.5 face heights below the chin, the legs the next 2.5 face heights.
+    Returns a list of (region, (x1, y1, x2, y2)) clipped to the frame.
+    """
+    x1, y1, x2, y2 = map(int, face_box)
+    face_h = max(y2 - y1, 1)
+    face_w = max(x2 - x1, 1)
+    left = max(x1 - face_w // 2, 0)
+    right = min(x2 + face_w // 2, frame_width)
+    upper = (left, max(y2, 0), right, min(y2 + int(face_h * 1.5), frame_height))
+    lower = (left, upper[3], right, min(upper[3] + int(face_h * 2.5), frame_height))
+    return [(REGIONS[name], box) for name, box in (("upper", upper), ("lower", lower))
+            if box[2] > box[0] and box[3] > box[1]]
+
+def colour_histograms(patches):
+    """
+    Vectorized HSV histograms for a stack of (R, P, P, 3) RGB patches.
+    Returns (R, NUM_BINS) uint8 histograms scaled so each row sums to ~255.
+    """
+    num = len(patches)
+    if num == 0:
+        return np.zeros((0, NUM_BINS), dtype=np.uint8)
+    # One colour conversion over the whole batch
+    hsv = cv2.cvtColor(patches.reshape(num * PATCH_SIZE, PATCH_SIZE, 3), cv2.COLOR_RGB2HSV)
+    hsv = hsv.reshape(num, -1, 3).astype(np.int32)
+    hue, sat, val = hsv[..., 0] * 2, hsv[..., 1], hsv[..., 2]  # OpenCV hue is 0-179
+
+    bins = ((hue + 15) % 360) // 30
+    bins = np.where(sat < 50, np.where(val > 200, WHITE, GRAY), bins)
+    bins = np.where(val < 50, BLACK, bins)
+
+    offsets = np.arange(num)[:, None] * NUM_BINS
+    counts = np.bincount((bins + offsets).ravel(), minlength=num * NUM_BINS).reshape(num, NUM_BINS)
+    return np.round(counts * 255.0 / counts.sum(axis=1, keepdims=True)).astype(np.uint8)
+
+def extract_attributes(face_meta):
+    """
+    Compute clothing histograms for every detected person in a batch.
+    `face_meta` holds (frame_idx, fps, orig_rgb, face_box) per face, as produced by detect_faces.
+    Returns (frame_idx, fps, region, box) rows and their (R, NUM_BINS) histograms.
+    """
+    rows, patches = [], []
+    for frame_idx, fps, orig_rgb, face_box in face_meta:
+        height, width = orig_rgb.shape[:2]
+        for region, (x1, y1, x2, y2) in clothing_regions(face_box, height, width):
+            patches.append(cv2.resize(orig_rgb[y1:y2, x1:x2], (PATCH_SIZE, PATCH_SIZE), interpolation=cv2.INTER_AREA))
+            rows.append((frame_idx, fps, region, (x1, y1, x2, y2)))
+    if not patches:
+        return rows, np.zeros((0, NUM_BINS), dtype=np.uint8)
+    return rows, colour_histograms(np.stack(patches))
+
+
+### COLUMNAR ATTRIBUTE STORE
+
+class AttributeStore(ColumnarStore):
+    """
+    Append-only columnar store of clothing-colour rows (see ColumnarStore).
+    Queries skip segments using the manifest and scan the rest with
+    vectorized masks over memory-mapped columns, so no video is re-decoded.
+    """
+    columns = {
+        "camera": np.int32,
+        "video": np.int32,
+        "timestamp": np.float64,   # Wall-clock seconds since the epoch
+        "frame_idx": np.int64,
+        "region": np.uint8,
+        "box": np.int32,           # (R, 4)
+        "hist": np.uint8,          # (R, NUM_BINS)
+    }
+
+    def __init__(self, store_dir=None, flush_rows=50000):
+        super().__init__(store_dir or os.path.join(config.INDEX_DIR, "attributes"), flush_rows)
+
+    def add(self, camera, video, video_start, rows, hists):
+        """Buffer rows from extract_attributes for one video"""
+        if not rows:
+            return
+        self.append(camera, video, {
+            "timestamp": [video_start + frame_idx / (fps or 30.0) for frame_idx, fps, _, _ in rows],
+            "frame_idx": [frame_idx for frame_idx, _, _, _ in rows],
+            "region": [region for _, _, region, _ in rows],
+            "box": [box for _, _, _, box in rows],
+            "hist": list(hists),
+        })
+
+    def query(self, color, region="upper", camera=None, start=None, end=None, min_fraction=0.3, limit=100):
+        """
+        Find sightings whose `region` garment is mostly `color`.
+        `start`/`end` are epoch seconds or datetimes. Returns dicts sorted by
+        colour fraction, strongest first.
+        """
+        bins = COLOR_BINS[color]
+        region_id = REGIONS[region]
+        start = start.timestamp() if isinstance(start, datetime) else start
+        end = end.timestamp() if isinstance(end, datetime) else end
+        camera_id = None
+        if camera is not None:
+            camera_id = self.camera_id(camera)
+            if camera_id is None:
+                return []
+        threshold = min_fraction * 255
+
+        results = []
+        for _, cols, mask in self.segments(camera_id, start, end):
+            idx = np.nonzero(mask & (cols["region"] == region_id))[0]
+            if not len(idx):
+                continue
+            fraction = cols["hist"][idx][:, bins].sum(axis=1, dtype=np.int32)
+            hit = fraction >= threshold
+            for i, frac in zip(idx[hit], fraction[hit]):
+                results.append({
+                    "camera": self.manifest["cameras"][cols["camera"][i]],
+                    "video": self.manifest["videos"][cols["video"][i]],
+                    "timestamp": float(cols["timestamp"][i]),
+                    "frame_idx": int(cols["frame_idx"][i]),
+                    "box": tuple(int(v) for v in cols["box"][i]),
+                    "fraction": float(frac) / 255.0,
+                })
+
+        results.sort(key=lambda r: r["fraction"], reverse=True)
+        return results[:limit]
+
+
+def _parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M").timestamp() if value else None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search indexed clothing colours")
+    parser.add_argument("--color", required=True, choices=sorted(COLOR_BINS))
+    parser.add_argument("--region", default="upper", choices=sorted(REGIONS))
+    parser.add_argument("--camera")
+    parser.add_argument("--start", help='e.g. "2024-05-01 14:00"')
+    parser.add_argument("--end", help='e.g. "2024-05-01 16:00"')
+    parser.add_argument("--min-fraction", type=float, default=0.3)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    store = AttributeStore()
+    t0 = time.time()
+    hits = store.query(args.color, args.region, args.camera, _parse_time(args.start), _parse_time(args.end),
+                       args.min_fraction, args.limit)
+    print(f"{len(hits)} matches in {(time.time() - t0) * 1000:.1f} ms")
+    for hit in hits:
+        when = datetime.fromtimestamp(hit["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{when}  {hit['camera']:<15} {hit['video']:<30} frame {hit['frame_idx']:<8} {hit['fraction']:.0%}")
@@ -0,0 +1,345 @@
+import os, json, time, argparse
+import numpy as np
+
+from config import config
+from columnar_store import ColumnarStore
+from violence_events import segment_events
+
+### SCORE STORES
+
+class FaceScoreStore(ColumnarStore):
+    """
+    Cosine similarity of every embedded face to every reference template,
+    one row per (face, reference) pair and whether it matched or not, so
+    thresholds can be re-applied without re-running the pipeline (see
+    ColumnarStore). `references` names the template columns of the job.
+    """
+    columns = {
+        "camera": np.int32,
+        "video": np.int32,
+        "timestamp": np.float64,   # Wall-clock seconds since the epoch
+        "time": np.float32,        # Seconds into the video
+        "frame_idx": np.int64,
+        "box": np.int32,           # (R, 4)
+        "reference": np.int32,     # Index into manifest["references"]
+        "similarity": np.float32,
+    }
+    name_columns = dict(ColumnarStore.name_columns, reference="references")
+
+    def __init__(self, references=(), store_dir=None, flush_rows=200000):
+        super().__init__(store_dir or os.path.join(config.INDEX_DIR, "scores", "faces"), flush_rows)
+        self.references = [os.path.basename(r) for r in references]
+
+    def _read_manifest(self):
+        manifest = super()._read_manifest()
+        manifest.setdefault("references", [])
+        return manifest
+
+    def add(self, camera, video, video_start, face_meta, similarities):
+        """Buffer the (F, R) similarities of one batch; `face_meta` holds (frame_idx, fps, orig_rgb, box) per face"""
+        if not len(face_meta) or not self.references:
+            return
+        count = len(self.references)
+        frames = np.array([frame_idx for frame_idx, _, _, _ in face_meta], dtype=np.int64)
+        fps = np.array([fps or 0.0 for _, fps, _, _ in face_meta])
+        self.append(camera, video, {
+            "timestamp": list(np.repeat(video_start + frames / np.where(fps > 0, fps, 30.0), count)),
+            "time": list(np.repeat(np.where(fps > 0, frames / np.maximum(fps, 1e-9), frames), count)),
+            "frame_idx": list(np.repeat(frames, count)),
+            "box": list(np.repeat(np.array([box for _, _, _, box in face_meta], dtype=np.int32).reshape(-1, 4), count, axis=0)),
+            "reference": self.references * len(face_meta),
+            "similarity": list(np.asarray(similarities, dtype=np.float32).reshape(-1)),
+        })
+
+
+class ViolenceScoreStore(ColumnarStore):
+    """Probability of every scored violence clip, one row per clip (see ColumnarStore)"""
+    columns = {
+        "camera": np.int32,
+        "video": np.int32,
+        "timestamp": np.float64,   # Wall-clock seconds since the epoch at the first frame
+        "first_frame": np.int64,
+        "last_frame": np.int64,
+        "fps": np.float32,
+        "probability": np.float32,
+    }
+
+    def __init__(self, store_dir=None, flush_rows=200000):
+        super().__init__(store_dir or os.path.join(config.INDEX_DIR, "scores", "violence"), flush_rows)
+
+    def add(self, camera, video, video_start, fps, scores):
+        """Buffer the (first_frame, last_frame, probability) clip scores of one video"""
+        fps = fps or 30.0
+        self.append(camera, video, {
+            "timestamp": [video_start + first / fps for first, _, _ in scores],
+            "first_frame": [first for first, _, _ in scores],
+            "last_frame": [last for _, last, _ in scores],
+            "fps": [fps] * len(scores),
+            "probability": [prob for _, _, prob in scores],
+        })
+
+### THRESHOLD CALIBRATION
+
+def _load(store, videos=None, camera=None):
+    """Concatenate every column of the rows of `videos` (paths) and `camera`, or None if there are none"""
+    store.reload()
+    video_ids = None
+    if videos is not None:
+        wanted = {os.path.abspath(v) for v in videos}
+        video_ids = [i for i, name in enumerate(store.manifest["videos"]) if name in wanted]
+    camera_id = store.camera_id(camera) if camera is not None else None
+    if camera is not None and camera_id is None:
+        return None
+    parts = []
+    for _, cols, mask in store.segments(camera_id):
+        if video_ids is not None:
+            mask &= np.isin(cols["video"], video_ids)
+        if mask.any():
+            parts.append({name: np.asarray(col)[mask] for name, col in cols.items()})
+    if not parts:
+        return None
+    return {name: np.concatenate([p[name] for p in parts]) for name in store.columns}
+
+def _latest(keys):
+    """Sorted indices of the last occurrence of each distinct row of (N,K) keys, so re-runs replace earlier rows"""
+    _, first = np.unique(keys[::-1], axis=0, return_index=True)
+    return np.sort(len(keys) - 1 - first)
+
+def _precision_recall(flagged, labels):
+    """Video-level precision and recall of the set of `flagged` video paths against {path: 0/1} labels"""
+    positives = {v for v, label in labels.items() if label == 1}
+    flagged = {v for v in flagged if v in labels}
+    hits = len(flagged & positives)
+    precision = hits / len(flagged) if flagged else float("nan")
+    recall = hits / len(positives) if positives else float("nan")
+    return precision, recall
+
+
+class FaceScores:
+    """
+    Stored face similarities held in memory for instant threshold changes.
+    A face matches a reference when its similarity is above the threshold,
+    as in match_faces; detections() rebuilds the detections of any
+    threshold from the store alone.
+    """
+    def __init__(self, store=None, videos=None, camera=None, reference=None):
+        self.store = store or FaceScoreStore()
+        cols = _load(self.store, videos, camera)
+        if cols is not None and reference is not None:
+            names = self.store.manifest["references"]
+            keep = cols["reference"] == (names.index(reference) if reference in names else -1)
+            cols = {name: col[keep] for name, col in cols.items()}
+        if cols is not None and len(cols["similarity"]):
+            keys = np.column_stack([cols["video"], cols["frame_idx"], cols["box"], cols["reference"]]).astype(np.int64)
+            latest = _latest(keys)
+            cols = {name: col[latest] for name, col in cols.items()}
+        else:
+            cols = {name: np.zeros((0, 4) if name == "box" else 0, dtype=dtype) for name, dtype in FaceScoreStore.columns.items()}
+        self.cols = cols
+        # Best similarity per face, for face and video counts
+        faces = np.column_stack([cols["video"], cols["frame_idx"], cols["box"]]).astype(np.int64)
+        if len(faces):
+            _, self._face_of_row = np.unique(faces, axis=0, return_inverse=True)
+            self._face_of_row = self._face_of_row.reshape(-1)
+        else:
+            self._face_of_row = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.cols["similarity"])
+
+    def count(self, threshold):
+        """Number of (face, reference) matches above `threshold`"""
+        return int((self.cols["similarity"] > threshold).sum())
+
+    def sweep(self, thresholds, labels=None):
+        """
+        One row per threshold with the number of matches, distinct faces and
+        videos with a match, and with `labels` ({video path: 1 if the person
+        appears}) video-level precision and recall.
+        """
+        videos = self.store.manifest["videos"]
+        rows = []
+        for threshold in thresholds:
+            hit = self.cols["similarity"] > threshold
+            flagged = {videos[v] for v in np.unique(self.cols["video"][hit])}
+            row = {
+                "threshold": float(threshold),
+                "matches": int(hit.sum()),
+                "faces": int(len(np.unique(self._face_of_row[hit]))),
+                "videos": len(flagged),
+            }
+            if labels:
+                row["precision"], row["recall"] = _precision_recall(flagged, labels)
+            rows.append(row)
+        return rows
+
+    def detections(self, threshold):
+        """Detections above `threshold`, strongest first, in the format of match_faces without the frame image"""
+        idx = np.nonzero(self.cols["similarity"] > threshold)[0]
+        idx = idx[np.argsort(-self.cols["similarity"][idx], kind="stable")]
+        manifest = self.store.manifest
+        return [{
+            "frame_idx": int(self.cols["frame_idx"][i]),
+            "time": float(self.cols["time"][i]),
+            "similarity": float(self.cols["similarity"][i]),
+            "video_filename": os.path.basename(manifest["videos"][self.cols["video"][i]]),
+            "video": manifest["videos"][self.cols["video"][i]],
+            "camera": manifest["cameras"][self.cols["camera"][i]],
+            "timestamp": float(self.cols["timestamp"][i]),
+            "box": tuple(int(v) for v in self.cols["box"][i]),
+            "reference": manifest["references"][self.cols["reference"][i]],
+        } for i in idx]
+
+
+class ViolenceScores:
+    """
+    Stored violence clip probabilities held in memory, per video. events()
+    re-runs smoothing and hysteresis segmentation for any threshold, as
+    detect_violence_in_video does. With adaptive scanning only regions the
+    coarse pass flagged were scored densely, so thresholds below
+    VIOLENCE_INTEREST_THRESH cannot find events the coarse pass missed.
+    """
+    def __init__(self, store=None, videos=None, camera=None):
+        self.store = store or ViolenceScoreStore()
+        cols = _load(self.store, videos, camera)
+        self.videos = {}   # path -> (camera, video_start, fps, [(first, last, prob)])
+        if cols is None:
+            return
+        latest = _latest(np.column_stack([cols["video"], cols["first_frame"], cols["last_frame"]]))
+        cols = {name: col[latest] for name, col in cols.items()}
+        manifest = self.store.manifest
+        for v in np.unique(cols["video"]):
+            sel = np.nonzero(cols["video"] == v)[0]
+            sel = sel[np.argsort(cols["first_frame"][sel], kind="stable")]
+            fps = float(cols["fps"][sel[0]])
+            scores = list(zip(cols["first_frame"][sel].tolist(), cols["last_frame"][sel].tolist(),
+                              cols["probability"][sel].tolist()))
+            video_start = float(cols["timestamp"][sel[0]]) - scores[0][0] / fps
+            self.videos[manifest["videos"][v]] = (manifest["cameras"][cols["camera"][sel[0]]], video_start, fps, scores)
+
+    def __len__(self):
+        return sum(len(scores) for _, _, _, scores in self.videos.values())
+
+    def events(self, threshold):
+        """{video path: events} for `threshold`, in the format of detect_violence_in_video without thumbnails"""
+        events = {}
+        for path, (camera, _, fps, scores) in self.videos.items():
+            found = segment_events(scores, fps, enter_threshold=threshold,
+                                   exit_threshold=threshold - config.VIOLENCE_HYSTERESIS,
+                                   window=config.VIOLENCE_SMOOTHING_WINDOW)
+            for event in found:
+                event["video"], event["camera"] = path, camera
+            if found:
+                events[path] = found
+        return events
+
+    def count(self, threshold):
+        """Number of violence events at `threshold`"""
+        return sum(len(found) for found in self.events(threshold).values())
+
+    def sweep(self, thresholds, labels=None):
+        """
+        One row per threshold with the number of events, videos with an event
+        and clips above the threshold, and with `labels` ({video path: 1 if
+        violent}) video-level precision and recall.
+        """
+        rows = []
+        for threshold in thresholds:
+            events = self.events(threshold)
+            row = {
+                "threshold": float(threshold),
+                "events": sum(len(found) for found in events.values()),
+                "videos": len(events),
+                "clips": sum(sum(prob >= threshold for _, _, prob in scores)
+                             for _, _, _, scores in self.videos.values()),
+            }
+            if labels:
+                row["precision"], row["recall"] = _precision_recall(set(events), labels)
+            rows.append(row)
+        return rows
+
+
+def plot_sweep(rows, path, title):
+    """Save hit-count and, when labelled, precision/recall curves of a sweep as an image"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    thresholds = [row["threshold"] for row in rows]
+    counts = [k for k in rows[0] if k not in ("threshold", "precision", "recall")]
+    labelled = "precision" in rows[0]
+    fig, axes = plt.subplots(1, 2 if labelled else 1, figsize=(12 if labelled else 6, 4), squeeze=False)
+    for key in counts:
+        axes[0][0].plot(thresholds, [row[key] for row in rows], marker="o", label=key)
+    axes[0][0].set_xlabel("threshold")
+    axes[0][0].set_yscale("symlog")
+    axes[0][0].legend()
+    if labelled:
+        axes[0][1].plot(thresholds, [row["precision"] for row in rows], marker="o", label="precision")
+        axes[0][1].plot(thresholds, [row["recall"] for row in rows], marker="o", label="recall")
+        axes[0][1].set_xlabel("threshold")
+        axes[0][1].set_ylim(0, 1.05)
+        axes[0][1].legend()
+    fig.suptitle(title)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def _print_sweep(rows):
+    keys = list(rows[0])
+    print(" ".join(f"{k:>10}" for k in keys))
+    for row in rows:
+        print(" ".join(f"{row[k]:>10.3f}" if isinstance(row[k], float) else f"{row[k]:>10}" for k in keys))
+
+def _write_jsonl(path, records):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep detection thresholds over stored similarity and clip scores")
+    parser.add_argument("kind", choices=["faces", "violence"])
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=[round(t, 2) for t in np.arange(0.3, 0.96, 0.05)])
+    parser.add_argument("--labels", help="CSV of video_path,label (1 = person present / violent)")
+    parser.add_argument("--videos", nargs="+", help="Only these videos")
+    parser.add_argument("--camera")
+    parser.add_argument("--reference", help="Only matches against this reference image (file name)")
+    parser.add_argument("--plot", help="Save the curves to this image file")
+    parser.add_argument("--regenerate", type=float, metavar="THRESHOLD",
+                        help="Write the detections for this threshold as JSON lines")
+    parser.add_argument("--out", help="Output file for --regenerate")
+    args = parser.parse_args()
+
+    labels = None
+    if args.labels:
+        from violence_cascade import load_labels
+        labels = {os.path.abspath(path): label for path, label in load_labels(args.labels)}
+    videos = args.videos or (list(labels) if labels else None)
+
+    t0 = time.time()
+    if args.kind == "faces":
+        scores = FaceScores(videos=videos, camera=args.camera, reference=args.reference)
+    else:
+        scores = ViolenceScores(videos=videos, camera=args.camera)
+    print(f"Loaded {len(scores)} stored {args.kind} scores in {(time.time() - t0) * 1000:.0f} ms")
+    if not len(scores):
+        raise SystemExit("No stored scores; run the pipeline with SCORE_STORE = True first.")
+
+    rows = scores.sweep(sorted(args.thresholds), labels)
+    _print_sweep(rows)
+    if args.plot:
+        plot_sweep(rows, args.plot, f"{args.kind} threshold sweep")
+        print(f"Curves saved to {args.plot}")
+
+    if args.regenerate is not None:
+        t0 = time.time()
+        if args.kind == "faces":
+            records = scores.detections(args.regenerate)
+        else:
+            records = [event for found in scores.events(args.regenerate).values() for event in found]
+        out = args.out or os.path.join(config.OUTPUT_DIR, "calibration", f"{args.kind}_{args.regenerate:.2f}.jsonl")
+        _write_jsonl(out, records)
+        print(f"{len(records)} detections at {args.regenerate:.2f} written to {out} in {(time.time() - t0) * 1000:.0f} ms")
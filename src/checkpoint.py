@@ -0,0 +1,160 @@
+import os, json, time, hashlib, threading
+from collections import deque
+import numpy as np
+
+from config import config
+
+### JOB CHECKPOINTS
+
+class CommitWatermark:
+    """
+    Track work items that are issued in order but may complete out of order.
+    complete() returns the resume point and payloads of every item in the
+    newly completed prefix, so only work with nothing unfinished before it
+    is ever committed.
+    """
+    def __init__(self):
+        self._issued = deque()
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def issue(self, key):
+        with self._lock:
+            self._issued.append(key)
+
+    def complete(self, key, resume_point, payload=None):
+        """Mark `key` finished; returns (resume_point, payloads) for the committed prefix, or None"""
+        with self._lock:
+            self._done[key] = (resume_point, payload)
+            committed, payloads = None, []
+            while self._issued and self._issued[0] in self._done:
+                committed, item = self._done.pop(self._issued.popleft())
+                if item:
+                    payloads.extend(item)
+            return (committed, payloads) if committed is not None else None
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class JobCheckpoint:
+    """
+    Durable progress of a long archive job in an append-only journal
+    (one JSON record per line), keyed by the job's parameters so a resumed
+    run only picks up work done with the same settings.
+    Record types:
+      - "detection": one result, written once everything before it in its video is done.
+      - "progress":  the next frame to process in a video (written at most every
+                     CHECKPOINT_INTERVAL seconds and fsynced, keeping overhead small).
+      - "segment":   the clip scores of one finished scan segment.
+      - "done":      the video is finished.
+    On load, detections not covered by a later progress or done record for
+    their video are discarded; they are produced again when the video resumes.
+    """
+    def __init__(self, kind, params, checkpoint_dir=None, interval=None, resume=None):
+        self.kind = kind
+        self.interval = config.CHECKPOINT_INTERVAL if interval is None else interval
+        checkpoint_dir = checkpoint_dir or os.path.join(config.INDEX_DIR, "checkpoints")
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        key = hashlib.sha256(json.dumps(_jsonable(params), sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(checkpoint_dir, f"{kind}_{key}.jsonl")
+        self._lock = threading.Lock()
+        self._last_sync = {}
+
+        self.progress = {}   # video key -> next frame to process
+        self.done = set()
+        self.segments = {}   # (video key, segment key) -> clip scores
+        self._detections = []
+        resume = config.CHECKPOINT_RESUME if resume is None else resume
+        if resume and os.path.exists(self.path):
+            self._replay()
+        self._file = open(self.path, "a" if resume else "w")
+        self.resumed = bool(self.progress or self.done or self.segments)
+        if self.resumed:
+            print(f"Resuming {kind} job: {len(self.done)} videos done, {len(self.progress)} in progress")
+
+    def _replay(self):
+        detections = []
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    rec = None
+                if rec is None:
+                    break  # Torn final line from a crash
+                valid_bytes += len(line)
+                kind, video = rec.get("type"), rec.get("video")
+                if kind == "detection":
+                    detections.append(rec)
+                elif kind == "progress":
+                    self.progress[video] = max(self.progress.get(video, 0), rec["frame"])
+                elif kind == "segment":
+                    self.segments[(video, rec["key"])] = [tuple(s) for s in rec["scores"]]
+                elif kind == "done":
+                    self.done.add(video)
+                    self.progress.pop(video, None)
+        # Drop any torn tail so appended records start on a clean line
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_bytes)
+        for rec in detections:
+            video = rec["video"]
+            if video in self.done or rec["data"]["frame_idx"] < self.progress.get(video, 0):
+                self._detections.append(rec)
+
+    def _write(self, rec, sync=False):
+        with self._lock:
+            self._file.write(json.dumps(_jsonable(rec)) + "\n")
+            if sync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def is_done(self, video):
+        return video in self.done
+
+    def resume_frame(self, video):
+        return self.progress.get(video, 0)
+
+    def segment(self, video, key):
+        """Clip scores of a finished segment, or None"""
+        return self.segments.get((video, key))
+
+    def detections(self):
+        """Committed detections from earlier runs as (video_path, detection) pairs"""
+        return [(rec["path"], dict(rec["data"])) for rec in self._detections]
+
+    def commit(self, video, path, next_frame, detections=(), force=False, drop_keys=("frame_img",)):
+        """
+        Record detections up to `next_frame` of `video`. Progress is synced at
+        most every `interval` seconds unless `force` is set.
+        """
+        for det in detections:
+            data = {k: v for k, v in det.items() if k not in drop_keys}
+            self._write({"type": "detection", "video": video, "path": path, "data": data})
+        now = time.monotonic()
+        if force or now - self._last_sync.get(video, 0.0) >= self.interval:
+            self._last_sync[video] = now
+            self._write({"type": "progress", "video": video, "frame": int(next_frame)}, sync=True)
+
+    def save_segment(self, video, key, scores):
+        self.segments[(video, key)] = list(scores)
+        self._write({"type": "segment", "video": video, "key": key, "scores": scores}, sync=True)
+
+    def mark_done(self, video):
+        self.done.add(video)
+        self._write({"type": "done", "video": video}, sync=True)
+
+    def close(self, completed=False):
+        """Close the journal; a completed job's checkpoint is removed"""
+        with self._lock:
+            self._file.close()
+        if completed and os.path.exists(self.path):
+            os.remove(self.path)
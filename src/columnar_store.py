@@ -0,0 +1,167 @@
+import os, json, uuid, threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+### COLUMNAR SEGMENT STORE
+
+class ColumnarStore:
+    """
+    Append-only store of per-sighting rows for one camera network.
+    Rows are buffered and flushed into immutable segments, one .npy file
+    per column, plus a manifest recording each segment's time range and
+    cameras. Readers prune segments with the manifest and scan the rest as
+    memory-mapped columns. Subclasses define `columns` ({name: dtype});
+    "camera", "video" and "timestamp" are always present.
+
+    Several processes (watch daemon, CLI runs, UI, query service) may write
+    one store. Buffered rows keep camera, video and other `name_columns`
+    as names; flush() maps them to ids and adds its segment while holding
+    an exclusive lock on the store, after re-reading the manifest, so
+    writers never overwrite each other's segments, ids or manifest entries.
+    """
+    columns = {}
+    name_columns = {"camera": "cameras", "video": "videos"}  # Column -> manifest list its ids index
+
+    def __init__(self, store_dir, flush_rows=50000):
+        self.store_dir = store_dir
+        self.flush_rows = flush_rows
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._manifest_path = os.path.join(self.store_dir, "manifest.json")
+        self._lock_path = os.path.join(self.store_dir, "manifest.lock")
+        self.manifest = self._read_manifest()
+        self._buffer = {name: [] for name in self.columns}
+        self._buffered = 0
+        self._segment_cache = {}
+
+    def _read_manifest(self):
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                return json.load(f)
+        return {"cameras": [], "videos": [], "segments": []}
+
+    @contextmanager
+    def _store_lock(self):
+        """Exclusive lock across processes writing this store"""
+        with open(self._lock_path, "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _id(manifest, kind, name):
+        names = manifest.setdefault(kind, [])
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    def append(self, camera, video, rows):
+        """Buffer rows for one video; `rows` maps each column except camera/video to a list of values"""
+        count = len(rows["timestamp"])
+        if not count:
+            return
+        with self._lock:
+            self._buffer["camera"].extend([camera] * count)
+            self._buffer["video"].extend([video] * count)
+            for name, values in rows.items():
+                self._buffer[name].extend(values)
+            self._buffered += count
+            full = self._buffered >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows as a new segment"""
+        with self._lock:
+            if not self._buffered:
+                return
+            buffer = self._buffer
+            self._buffer = {name: [] for name in self.columns}
+            self._buffered = 0
+
+            with self._store_lock():
+                # Other processes may have flushed since this one last read the manifest
+                manifest = self._read_manifest()
+                columns = {}
+                for name, values in buffer.items():
+                    if name in self.name_columns:
+                        kind = self.name_columns[name]
+                        ids = {n: self._id(manifest, kind, n) for n in dict.fromkeys(values)}
+                        values = [ids[n] for n in values]
+                    columns[name] = np.asarray(values, dtype=self.columns[name])
+
+                # Unique across processes; the counter keeps names in flush order within one store
+                segment = f"seg_{len(manifest['segments']):06d}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+                for name, values in columns.items():
+                    np.save(os.path.join(self.store_dir, f"{segment}_{name}.npy"), values)
+                manifest["segments"].append({
+                    "name": segment,
+                    "rows": int(len(columns["timestamp"])),
+                    "min_time": float(columns["timestamp"].min()),
+                    "max_time": float(columns["timestamp"].max()),
+                    "cameras": sorted(int(c) for c in np.unique(columns["camera"])),
+                })
+                tmp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(manifest, f)
+                os.replace(tmp_path, self._manifest_path)
+            self.manifest = manifest
+
+    def reload(self):
+        """Pick up segments flushed by other processes; returns True if the manifest changed"""
+        manifest = self._read_manifest()
+        with self._lock:
+            changed = len(manifest["segments"]) != len(self.manifest["segments"])
+            if changed:
+                self.manifest = manifest
+        return changed
+
+    def load_segment(self, name):
+        if name not in self._segment_cache:
+            self._segment_cache[name] = {
+                col: np.load(os.path.join(self.store_dir, f"{name}_{col}.npy"), mmap_mode="r")
+                for col in self.columns
+            }
+        return self._segment_cache[name]
+
+    def camera_id(self, camera):
+        """Numeric id of a camera, or None if it has never been seen"""
+        cameras = self.manifest["cameras"]
+        return cameras.index(camera) if camera in cameras else None
+
+    def segments(self, camera_id=None, start=None, end=None):
+        """Yield (segment, columns, mask) for segments that may hold rows in the camera/time range"""
+        for seg in self.manifest["segments"]:
+            # Zone-map pruning: skip segments outside the time range or camera
+            if start is not None and seg["max_time"] < start:
+                continue
+            if end is not None and seg["min_time"] > end:
+                continue
+            if camera_id is not None and camera_id not in seg["cameras"]:
+                continue
+
+            cols = self.load_segment(seg["name"])
+            mask = np.ones(seg["rows"], dtype=bool)
+            if camera_id is not None:
+                mask &= cols["camera"] == camera_id
+            if start is not None:
+                mask &= cols["timestamp"] >= start
+            if end is not None:
+                mask &= cols["timestamp"] <= end
+            yield seg, cols, mask
@@ -11,14 +11,101 @@ class Config:
     
     # Violence Detection
     VIOLENCE_MODEL = "i3d"  # "slowfast", "r3d", or "i3d"
-    VIOLENCE_THRESH = 0.68
+    VIOLENCE_THRESH = 0.68        # Event threshold on smoothed clip probabilities
     CLIP_LENGTH = 32
     CLIP_STRIDE = 16
+    VIOLENCE_DECODER = "opencv"   # "opencv" or "ffmpeg"
+    VIOLENCE_DECODE_SIZE = (112, 112)
+    VIOLENCE_DECODE_FPS = None    # None keeps the source frame rate
+    VIOLENCE_BATCH_SIZE = 8       # Clips per r3d_18 forward pass
+    VIOLENCE_SCORE_WORKERS = 1
+    VIOLENCE_ADAPTIVE = True      # Coarse sparse pass, then dense re-scan of interesting regions
+    VIOLENCE_COARSE_FRAME_STEP = 4
+    VIOLENCE_INTEREST_THRESH = 0.35
+    VIOLENCE_SHARED_FEATURES = False  # Per-chunk backbone features + temporal head
+    VIOLENCE_FEATURE_CHUNK = 8        # Frames per cached chunk; clip strides should be multiples
+    VIOLENCE_FEATURE_CACHE = 256      # Chunk features kept in the ring buffer
+    VIOLENCE_SMOOTHING_WINDOW = 3     # Clips in the moving average of scores
+    VIOLENCE_HYSTERESIS = 0.15        # Events end when the score drops this far below the threshold
+    VIOLENCE_CASCADE = True           # Motion-energy gate in front of r3d_18
+    VIOLENCE_CASCADE_THRESH = 0.01    # Fraction of moving pixels needed to pass; tune with violence_cascade.py
     
     # Missing Person
-    FACE_THRESH = 0.72
+    FACE_THRESH = 0.72            # Cosine similarity to a reference; tune with calibration.py
+    FACE_MODEL_WEIGHTS = "vggface2"
+    REFERENCE_TTA = False         # Average flip / crop views of each reference face
+    ATTRIBUTE_INDEX = True        # Index clothing colours of every detected person
+    EMBEDDING_INDEX = True        # Store every face embedding for query_service.py
+    SCORE_STORE = True            # Record every face similarity and violence clip score for calibration.py
+    FACE_QUALITY_GATE = True      # Skip small, blurry, uncertain or profile faces before embedding
+    FACE_QUALITY_FLOOR = 0.3      # Minimum quality (weakest of size, probability, sharpness, pose)
+    FACE_QUALITY_SIZE = 40        # Shorter box side, in pixels, that scores full size quality
+    FACE_QUALITY_SHARPNESS = 100.0  # Laplacian variance of a 160x160 crop that scores full sharpness
     FRAME_INTERVAL = 15
     BATCH_SIZE = 16
+    FACE_DECODER = "opencv"       # "opencv" or "ffmpeg"
+    FACE_DECODE_WIDTH = None      # e.g. 960 to scale frames down before MTCNN
+
+    # Priority search (see priority_search.py)
+    PRIORITY_SEGMENT_SECONDS = 300    # Footage searched as one unit, so priority applies within long videos
+    PRIORITY_FRAME_INTERVAL = 15      # Frames between samples
+    PRIORITY_CONFIRM_FRAMES = 2       # Matching frames needed to confirm a sighting
+    PRIORITY_CONFIRM_WINDOW = 10.0    # Seconds within which those frames must fall; later matches extend the sighting
+    PRIORITY_HIGH_CONFIDENCE = 0.8    # Similarity of the sightings counted by --stop-after
+
+    # Desktop UI (see ui_main.py)
+    UI_POLL_MS = 100              # Interval at which the Tk thread drains updates from the workers
+    UI_PREVIEW_FPS = 5            # Live preview frames shown per second; frames in between are skipped
+    UI_PREVIEW_WIDTH = 480        # Preview frames are downscaled to this width on the worker, before queueing
+    UI_LIVE_ROWS = 500            # Newest detections kept in the live results list
+
+    # Pipeline (workers per stage and bounded queue length between stages)
+    DECODE_WORKERS = 1
+    DETECT_WORKERS = 2
+    EMBED_WORKERS = 1
+    MATCH_WORKERS = 1
+    ATTRIBUTE_WORKERS = 1
+    PIPELINE_QUEUE_SIZE = 4
+    DECODE_PROCESS = False        # Decode in a separate process into a shared-memory frame ring
+    FRAME_RING_SLOTS = 64         # Frames held by the ring; bounds decode read-ahead
+    EMBED_SERVER = True           # Batch face crops across concurrently processed videos
+    EMBED_MAX_BATCH = 64          # Crops per shared ResNet call
+    EMBED_MAX_WAIT_MS = 5.0       # Longest a crop waits for its batch to fill
+    TENSOR_POOL = True            # Reuse preallocated face-crop and clip batch tensors
+    PREFETCH = True               # Read the next queued videos into the page cache in a background thread
+    PREFETCH_AHEAD = 2            # Unopened videos read ahead at a time
+    PREFETCH_BUDGET_MB = 1024     # Most read-ahead bytes outstanding before their videos are opened
+    PREFETCH_CHUNK_MB = 8         # Size of each read
+
+    # CPU budget (see resources.py)
+    CPU_CORES = None              # Cores to use; None for every core the process may run on
+    TORCH_INTRA_THREADS = 4       # torch intra-op threads per inference call
+    CV2_THREADS = 1               # OpenCV threads per call; videos are already decoded in parallel
+    DECODER_THREADS = 2           # ffmpeg threads per FFmpegDecoder
+    CPU_SHARES = {"faces": 0.5, "violence": 0.5}  # Split of the cores when both branches run at once (live streams)
+
+    # Live stream mode
+    STREAM_LATENCY_BUDGET = 2.0   # Seconds; older frames and clips are dropped instead of processed
+    STREAM_FACE_INTERVAL = 0.5    # Seconds between face-detection passes per camera
+    STREAM_CLIP_STRIDE = 8        # Frames between consecutive violence clips
+
+    # Checkpointing of long archive jobs
+    CHECKPOINT_RESUME = True          # Continue a matching interrupted job instead of starting over
+    CHECKPOINT_INTERVAL = 10.0        # Seconds between synced progress records per video
+    CHECKPOINT_SEGMENT_FRAMES = 4096  # Violence scan segment size
+
+    # Watch-folder daemon
+    WATCH_POLL_INTERVAL = 10.0    # Seconds between rescans when inotify is unavailable
+    WATCH_SETTLE_SECONDS = 5.0    # A file must stop changing for this long before it is processed
+
+    # Query service
+    QUERY_HOST = "127.0.0.1"      # Bind to localhost only
+    QUERY_PORT = 8765
+    EMBEDDING_FLOAT16 = True      # Store new face embeddings as float16
+    EMBEDDING_PQ = True           # Search product-quantized codes, then re-rank exactly
+    EMBEDDING_PQ_SUBSPACES = 64   # Bytes per face code (512 dims / 64 = 8 per subspace)
+    EMBEDDING_PQ_MIN_ROWS = 20000 # Faces needed before the quantizer is trained; exact search until then
+    EMBEDDING_PQ_RERANK = 256     # Candidates re-read from disk and ranked exactly
     
     # Spark
     SPARK_CONF = {
@@ -31,6 +118,10 @@ class Config:
     # Paths
     MODEL_CACHE = os.getenv("MODEL_CACHE", "./models")
     OUTPUT_DIR = "./Output"
+    INDEX_DIR = "./Output/index"  # Metadata, embedding and detection stores
+    ROI_FILE = "./roi.json"       # Per-camera regions of interest (see roi.py); whole frames without it
+    RESULTS_DB = True             # Write detections to INDEX_DIR/results.db (see results_db.py) instead of keeping them in memory
+    RESULTS_BATCH_ROWS = 1000     # Result rows buffered per batched insert
     
     def __post_init__(self):
         os.makedirs(self.OUTPUT_DIR, exist_ok=True)
@@ -0,0 +1,227 @@
+import math
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+from config import config
+
+### VIDEO DECODER BACKENDS
+#
+# Both backends share one interface:
+#   read_batch(n)  -> list of (frame_idx, raw_frame); raw frames go through convert()
+#   convert(frame) -> RGB frame at the decoder's output size
+#   read_into(out) -> frame_idx of a frame written (already converted) into `out`, or None
+# Decoding starts at `start_frame`, which lets callers seek straight to a position.
+# `crop` (x1, y1, x2, y2 in source pixels) is cut out before scaling; `size`
+# then applies to the cropped region.
+# frame_idx always refers to the frame's position in the source video, so
+# timestamps stay correct when frames are skipped or the frame rate is reduced.
+
+def probe_video(video_path):
+    """Return (fps, frame_count, width, height) of a video"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    return fps, frame_count, width, height
+
+def _output_size(src_width, src_height, size):
+    """Resolve `size` ((w, h), a width int, or None) to an even (w, h)"""
+    if size is None:
+        return src_width, src_height
+    if isinstance(size, int):
+        width = size
+        height = int(round(src_height * size / src_width / 2.0)) * 2 if src_width else size
+        return width, max(height, 2)
+    return tuple(size)
+
+
+class OpenCVDecoder:
+    """Decode with cv2.VideoCapture; cropping, colour conversion and scaling happen in convert()"""
+    def __init__(self, video_path, size=None, frame_step=1, fps=None, metadata=None, start_frame=0, crop=None):
+        self.video_path = video_path
+        src_fps, self.frame_count, src_width, src_height = metadata or probe_video(video_path)
+        self.source_fps = src_fps
+        self._crop = crop
+        if crop is not None:
+            src_width, src_height = crop[2] - crop[0], crop[3] - crop[1]
+        self.width, self.height = _output_size(src_width, src_height, size)
+        self._resize = (self.width, self.height) != (src_width, src_height)
+        self.frame_step = max(1, int(frame_step))
+        # Emit a frame every `src_fps / fps` source frames when reducing the frame rate
+        self._fps_step = src_fps / fps if fps and fps < src_fps else 1.0
+        self._next_emit = float(start_frame)
+        self._cap = cv2.VideoCapture(video_path)
+        if start_frame:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        self._frame_idx = start_frame
+        self._start_frame = start_frame
+
+    def _wanted(self, frame_idx):
+        if (frame_idx - self._start_frame) % self.frame_step != 0:
+            return False
+        if frame_idx + 1e-6 < self._next_emit:
+            return False
+        self._next_emit += self._fps_step
+        return True
+
+    def _read_raw(self):
+        while self._cap.grab():
+            frame_idx = self._frame_idx
+            self._frame_idx += 1
+            if self._wanted(frame_idx):
+                ret, frame = self._cap.retrieve()
+                if ret:
+                    return frame_idx, frame
+                return None
+        return None
+
+    def read_batch(self, n):
+        batch = []
+        while len(batch) < n:
+            item = self._read_raw()
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def convert(self, frame, out=None):
+        if self._crop is not None:
+            x1, y1, x2, y2 = self._crop
+            frame = frame[y1:y2, x1:x2]
+        if self._resize:
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=out)
+
+    def read_into(self, out):
+        item = self._read_raw()
+        if item is None:
+            return None
+        frame_idx, frame = item
+        self.convert(frame, out=out)
+        return frame_idx
+
+    def close(self):
+        self._cap.release()
+
+
+class FFmpegDecoder:
+    """
+    Decode with a local `ffmpeg` subprocess that outputs raw RGB frames.
+    Frame selection, frame-rate reduction, scaling and colour conversion all
+    run inside ffmpeg's multithreaded filter graph; frames are read straight
+    into preallocated NumPy buffers with readinto().
+    """
+    def __init__(self, video_path, size=None, frame_step=1, fps=None, metadata=None, start_frame=0, threads=None, crop=None):
+        self.video_path = video_path
+        src_fps, self.frame_count, src_width, src_height = metadata or probe_video(video_path)
+        self.source_fps = src_fps
+        if crop is not None:
+            src_width, src_height = crop[2] - crop[0], crop[3] - crop[1]
+        self.width, self.height = _output_size(src_width, src_height, size)
+        self.frame_step = max(1, int(frame_step))
+        self.frame_bytes = self.width * self.height * 3
+
+        # Frame-rate reduction uses the same rule as OpenCVDecoder, inside select: keep frame n if it is
+        # on the frame_step grid and at least `src_fps / fps` frames after the last emit time (kept in
+        # select's variable 0). Frames are only ever dropped, so the indices can be replayed exactly.
+        self._fps_step = src_fps / fps if fps and fps < src_fps else 0.0
+        filters = []
+        if self._fps_step:
+            filters.append(f"select='if(not(mod(n\\,{self.frame_step}))*gte(n+0.000001\\,ld(0))"
+                           f"\\,st(0\\,ld(0)+{self._fps_step!r})*0+1\\,0)'")
+        elif self.frame_step > 1:
+            filters.append(f"select='not(mod(n\\,{self.frame_step}))'")
+        if crop is not None:
+            filters.append(f"crop={src_width}:{src_height}:{crop[0]}:{crop[1]}")
+        if (self.width, self.height) != (src_width, src_height):
+            filters.append(f"scale={self.width}:{self.height}:flags=area")
+
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-threads", str(config.DECODER_THREADS if threads is None else threads)]
+        if start_frame:
+            # Input seeking jumps to the nearest keyframe, then decodes up to the exact frame
+            cmd += ["-ss", f"{start_frame / src_fps:.6f}"]
+        cmd += ["-i", video_path]
+        if filters:
+            cmd += ["-vf", ",".join(filters)]
+        # Passthrough keeps ffmpeg from duplicating frames to fill gaps left by select
+        cmd += ["-vsync", "passthrough", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=self.frame_bytes)
+        self._next_n = 0          # First frame (counted from start_frame) select may still keep
+        self._next_emit = 0.0
+        self._start_frame = start_frame
+
+    def _next_frame_idx(self):
+        n = self._next_n
+        if self._fps_step:
+            n = max(n, math.ceil((self._next_emit - 1e-6) / self.frame_step) * self.frame_step)
+            self._next_emit += self._fps_step
+        self._next_n = n + self.frame_step
+        return self._start_frame + n
+
+    def read_into(self, out):
+        view = memoryview(out.reshape(-1).view(np.uint8))
+        filled = 0
+        while filled < self.frame_bytes:
+            n = self._proc.stdout.readinto(view[filled:])
+            if not n:
+                return None
+            filled += n
+        return self._next_frame_idx()
+
+    def read_batch(self, n):
+        buffers = np.empty((n, self.height, self.width, 3), dtype=np.uint8)
+        batch = []
+        for i in range(n):
+            frame_idx = self.read_into(buffers[i])
+            if frame_idx is None:
+                break
+            batch.append((frame_idx, buffers[i]))
+        return batch
+
+    def convert(self, frame, out=None):
+        # ffmpeg already produced RGB at the output size
+        if out is not None:
+            out[...] = frame
+            return out
+        return frame
+
+    def close(self):
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.stdout.close()
+        self._proc.wait()
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+def open_decoder(video_path, backend="opencv", size=None, frame_step=1, fps=None, metadata=None, start_frame=0, crop=None):
+    """
+    Open a video with the requested backend ("opencv" or "ffmpeg").
+    Falls back to OpenCV when ffmpeg is not installed.
+    """
+    if backend == "ffmpeg":
+        if ffmpeg_available():
+            return FFmpegDecoder(video_path, size=size, frame_step=frame_step, fps=fps, metadata=metadata,
+                                 start_frame=start_frame, crop=crop)
+        print("ffmpeg not found, falling back to OpenCV decoding")
+    return OpenCVDecoder(video_path, size=size, frame_step=frame_step, fps=fps, metadata=metadata,
+                         start_frame=start_frame, crop=crop)
+
+def read_frame_at(video_path, frame_idx, size=None):
+    """Read a single RGB frame by index, at full resolution or scaled to `size` like a decoder's output"""
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        return None
+    if size is not None:
+        width, height = _output_size(frame.shape[1], frame.shape[0], size)
+        if (width, height) != (frame.shape[1], frame.shape[0]):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
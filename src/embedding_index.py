@@ -0,0 +1,328 @@
+import os, time, argparse, tempfile, threading
+import numpy as np
+
+from config import config
+from columnar_store import ColumnarStore
+from product_quantizer import ProductQuantizer, save_codes
+
+### FACE EMBEDDING STORE
+
+EMBEDDING_DIM = 512
+
+class FaceEmbeddingStore(ColumnarStore):
+    """Columnar store of the InceptionResnetV1 embedding of every detected face (see ColumnarStore)"""
+    columns = {
+        "camera": np.int32,
+        "video": np.int32,
+        "timestamp": np.float64,   # Wall-clock seconds since the epoch
+        "frame_idx": np.int64,
+        "box": np.int32,           # (R, 4)
+        # (R, EMBEDDING_DIM), L2-normalized; float16 halves disk and page cache at ~1e-3 similarity error
+        "embedding": np.float16 if config.EMBEDDING_FLOAT16 else np.float32,
+    }
+
+    def __init__(self, store_dir=None, flush_rows=50000):
+        super().__init__(store_dir or os.path.join(config.INDEX_DIR, "embeddings"), flush_rows)
+
+    def add(self, camera, video, video_start, face_meta, embeddings):
+        """Buffer the embeddings of one batch; `face_meta` holds (frame_idx, fps, orig_rgb, box) per face"""
+        if embeddings is None or not len(face_meta):
+            return
+        emb = embeddings.float()
+        emb = (emb / emb.norm(dim=1, keepdim=True).clamp_min(1e-12)).cpu().numpy()
+        self.append(camera, video, {
+            "timestamp": [video_start + frame_idx / (fps or 30.0) for frame_idx, fps, _, _ in face_meta],
+            "frame_idx": [frame_idx for frame_idx, _, _, _ in face_meta],
+            "box": [tuple(int(v) for v in box) for _, _, _, box in face_meta],
+            "embedding": list(emb),
+        })
+
+
+def gather_rows(segments, offsets, rows, chunk=65536):
+    """float32 (n,D) embeddings of global `rows` from per-segment arrays starting at `offsets`"""
+    out = np.empty((len(rows), EMBEDDING_DIM), dtype=np.float32)
+    seg_ids = np.searchsorted(offsets, rows, side="right") - 1
+    for s in np.unique(seg_ids):
+        sel = np.nonzero(seg_ids == s)[0]
+        for start in range(0, len(sel), chunk):
+            part = sel[start:start + chunk]
+            out[part] = segments[s][rows[part] - offsets[s]]
+    return out
+
+
+class EmbeddingIndex:
+    """
+    Search over a FaceEmbeddingStore that keeps the embeddings on disk.
+    Embedding columns stay memory-mapped per segment; only the small
+    metadata columns are held in memory, for vectorized camera and time
+    filters. Exact search streams the mapped vectors through a matrix
+    product. Once the store holds EMBEDDING_PQ_MIN_ROWS faces, a product
+    quantizer is trained and every face also gets a one-byte-per-subspace
+    code kept in memory: a query then scores all codes by ADC and re-reads
+    only the best `rerank` candidates from disk to rank them exactly.
+    refresh() picks up newly flushed segments.
+    """
+    def __init__(self, store=None, pq=None, rerank=None):
+        self.store = store or FaceEmbeddingStore()
+        self.use_pq = config.EMBEDDING_PQ if pq is None else pq
+        self.rerank = config.EMBEDDING_PQ_RERANK if rerank is None else rerank
+        self._lock = threading.Lock()
+        self._pq_lock = threading.Lock()
+        self.segment_names = []
+        self.segments = []                       # Memory-mapped (R, D) embeddings per segment
+        self.offsets = np.zeros(1, dtype=np.int64)  # First global row of each segment, then the total
+        self.camera = np.zeros(0, dtype=np.int32)
+        self.video = np.zeros(0, dtype=np.int32)
+        self.timestamp = np.zeros(0, dtype=np.float64)
+        self.frame_idx = np.zeros(0, dtype=np.int64)
+        self.box = np.zeros((0, 4), dtype=np.int32)
+        self.quantizer = None
+        self.codes = None                        # Subspace-major (M, N) uint8 once a quantizer exists
+        self.refresh()
+
+    @property
+    def _codebook_path(self):
+        return os.path.join(self.store.store_dir, "pq_codebook.npy")
+
+    def refresh(self):
+        """Load segments that are not mapped yet; returns the number of new rows"""
+        self.store.reload()
+        new = [seg for seg in self.store.manifest["segments"] if seg["name"] not in self.segment_names]
+        if new:
+            parts = [self.store.load_segment(seg["name"]) for seg in new]
+            sizes = [len(p["embedding"]) for p in parts]
+            with self._lock:
+                # Build new arrays and swap them in, so concurrent searches see a consistent snapshot
+                self.segments = self.segments + [p["embedding"] for p in parts]
+                self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(sizes)])
+                self.camera = np.concatenate([self.camera] + [p["camera"] for p in parts])
+                self.video = np.concatenate([self.video] + [p["video"] for p in parts])
+                self.timestamp = np.concatenate([self.timestamp] + [p["timestamp"] for p in parts])
+                self.frame_idx = np.concatenate([self.frame_idx] + [p["frame_idx"] for p in parts])
+                self.box = np.concatenate([self.box] + [p["box"] for p in parts])
+                self.segment_names = self.segment_names + [seg["name"] for seg in new]
+        if self.use_pq:
+            self._update_codes()
+        return sum(seg["rows"] for seg in new)
+
+    def _update_codes(self):
+        """Load or train the quantizer, then encode segments that have no codes yet"""
+        with self._pq_lock:
+            if self.quantizer is None:
+                if os.path.exists(self._codebook_path):
+                    self.quantizer = ProductQuantizer.load(self._codebook_path)
+                elif len(self) >= config.EMBEDDING_PQ_MIN_ROWS:
+                    self.quantizer = self._train()
+                else:
+                    return
+            done = self.codes.shape[1] if self.codes is not None else 0
+            coded = np.searchsorted(self.offsets, done, side="right") - 1
+            parts = []
+            for name, embeddings in zip(self.segment_names[coded:], self.segments[coded:]):
+                path = os.path.join(self.store.store_dir, f"{name}_pq.npy")
+                if os.path.exists(path):
+                    codes = np.load(path)
+                else:
+                    codes = self.quantizer.encode(embeddings)
+                    save_codes(path, codes)
+                parts.append(codes.T)
+            if parts:
+                codes = np.concatenate(([self.codes] if self.codes is not None else []) + parts, axis=1)
+                with self._lock:
+                    self.codes = codes
+
+    def _train(self, sample_rows=65536, seed=0):
+        rng = np.random.default_rng(seed)
+        total = len(self)
+        rows = np.sort(rng.choice(total, min(total, sample_rows), replace=False))
+        print(f"Training product quantizer on {len(rows)} of {total} face embeddings...")
+        quantizer = ProductQuantizer(EMBEDDING_DIM, config.EMBEDDING_PQ_SUBSPACES).fit(
+            gather_rows(self.segments, self.offsets, rows), seed=seed
+        )
+        if not quantizer.save(self._codebook_path):
+            # Another process trained first; codes must all come from one codebook
+            quantizer = ProductQuantizer.load(self._codebook_path)
+        return quantizer
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def memory_bytes(self):
+        """Resident bytes of the in-memory part of the index (metadata and PQ codes)"""
+        meta = sum(a.nbytes for a in (self.camera, self.video, self.timestamp, self.frame_idx, self.box))
+        return meta + (self.codes.nbytes if self.codes is not None else 0)
+
+    def search_rows(self, query, k=20, camera=None, start=None, end=None, exact=False, rerank=None):
+        """
+        Global rows and similarities of the faces most similar to `query`
+        (a (D,) or (Q,D) array; several reference views are matched by their
+        best similarity), highest first. `exact=True` skips the quantizer;
+        `rerank=0` returns the ADC approximations without re-ranking.
+        """
+        with self._lock:
+            segments, offsets, codes = self.segments, self.offsets, self.codes
+            cams, timestamps = self.camera, self.timestamp
+        total = int(offsets[-1])
+        rerank = self.rerank if rerank is None else rerank
+        query = np.atleast_2d(np.asarray(query, dtype=np.float32))
+        query = query / np.maximum(np.linalg.norm(query, axis=1, keepdims=True), 1e-12)
+
+        idx = None
+        if camera is not None or start is not None or end is not None:
+            mask = np.ones(total, dtype=bool)
+            if camera is not None:
+                camera_id = self.store.camera_id(camera)
+                if camera_id is None:
+                    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+                mask &= cams == camera_id
+            if start is not None:
+                mask &= timestamps >= start
+            if end is not None:
+                mask &= timestamps <= end
+            idx = np.nonzero(mask)[0]
+        count = len(idx) if idx is not None else total
+        if not count:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        use_pq = not exact and codes is not None and codes.shape[1] == total and count > max(k, rerank)
+        if use_pq:
+            approx = self.quantizer.scores(codes if idx is None else codes[:, idx], self.quantizer.tables(query)).max(axis=1)
+            keep = min(max(k, rerank), count)
+            cand = np.argpartition(-approx, keep - 1)[:keep]
+            rows = cand if idx is None else idx[cand]
+            if rerank:
+                sims = (gather_rows(segments, offsets, rows) @ query.T).max(axis=1)
+            else:
+                sims = approx[cand]
+        elif idx is None:
+            rows = np.arange(total)
+            sims = np.concatenate([self._scan(seg, query) for seg in segments])
+        else:
+            rows = idx
+            sims = np.concatenate([
+                (gather_rows(segments, offsets, idx[i:i + 65536]) @ query.T).max(axis=1)
+                for i in range(0, len(idx), 65536)
+            ])
+
+        k = min(k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return rows[top], sims[top]
+
+    @staticmethod
+    def _scan(segment, query, chunk=65536):
+        return np.concatenate([
+            (np.asarray(segment[i:i + chunk], dtype=np.float32) @ query.T).max(axis=1)
+            for i in range(0, len(segment), chunk)
+        ]) if len(segment) else np.zeros(0, dtype=np.float32)
+
+    def search(self, query, k=20, threshold=None, camera=None, start=None, end=None):
+        """Faces most similar to `query` as dicts sorted by cosine similarity, highest first"""
+        rows, sims = self.search_rows(query, k, camera, start, end)
+        if threshold is not None:
+            keep = sims >= threshold
+            rows, sims = rows[keep], sims[keep]
+        with self._lock:
+            cams, videos, timestamps, frames, boxes = self.camera, self.video, self.timestamp, self.frame_idx, self.box
+        return [{
+            "camera": self.store.manifest["cameras"][cams[r]],
+            "video": self.store.manifest["videos"][videos[r]],
+            "timestamp": float(timestamps[r]),
+            "frame_idx": int(frames[r]),
+            "box": [int(v) for v in boxes[r]],
+            "similarity": float(s),
+        } for r, s in zip(rows, sims)]
+
+
+### BENCHMARK
+
+def benchmark(index, queries, k=10, rerank_values=(0, 64, 256)):
+    """
+    Compare recall@k, memory footprint and query latency of each search
+    mode against brute force over float32 vectors held in RAM.
+    """
+    total = len(index)
+    vectors = gather_rows(index.segments, index.offsets, np.arange(total))
+    meta_bytes = index.memory_bytes() - (index.codes.nbytes if index.codes is not None else 0)
+
+    def brute_force(q):
+        sims = vectors @ (q / np.linalg.norm(q))
+        top = np.argpartition(-sims, k - 1)[:k]
+        return top[np.argsort(-sims[top])]
+
+    modes = [("float32 brute force (RAM)", brute_force, meta_bytes + vectors.nbytes, 0)]
+    stored_bytes = sum(seg.nbytes for seg in index.segments)
+    modes.append((f"{index.segments[0].dtype} exact (mmap)",
+                  lambda q: index.search_rows(q, k, exact=True)[0], meta_bytes, stored_bytes))
+    if index.codes is not None:
+        for rerank in rerank_values:
+            name = f"PQ{index.quantizer.subspaces} ADC" + (f" + rerank {rerank}" if rerank else "")
+            modes.append((name, lambda q, r=rerank: index.search_rows(q, k, rerank=r)[0],
+                          index.memory_bytes() + index.quantizer.codebooks.nbytes, stored_bytes if rerank else 0))
+    else:
+        print(f"No product quantizer yet (needs {config.EMBEDDING_PQ_MIN_ROWS} faces); showing exact modes only")
+
+    truth = [set(brute_force(q)) for q in queries]
+    print(f"\n{total} faces, {len(queries)} queries, k={k}")
+    print(f"{'mode':<30} {'recall@k':>9} {'RAM MiB':>9} {'mmap MiB':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    results = []
+    for name, fn, ram, mapped in modes:
+        fn(queries[0])  # Warm the page cache and code paths
+        latencies, hits = [], 0
+        for q, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found = fn(q)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len(expected.intersection(found.tolist()))
+        row = {
+            "mode": name,
+            "recall": hits / (k * len(queries)),
+            "ram_bytes": ram,
+            "mapped_bytes": mapped,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+        }
+        results.append(row)
+        print(f"{name:<30} {row['recall']:>9.3f} {ram / 2**20:>9.1f} {mapped / 2**20:>9.1f} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+    return results
+
+
+def synthetic_store(store_dir, faces, identities=None, noise=0.6, seed=0):
+    """Fill a store with `faces` embeddings clustered around random identities, for benchmarking"""
+    rng = np.random.default_rng(seed)
+    identities = identities or max(faces // 50, 1)
+    centers = rng.standard_normal((identities, EMBEDDING_DIM)).astype(np.float32)
+    store = FaceEmbeddingStore(store_dir)
+    for start in range(0, faces, 50000):
+        n = min(50000, faces - start)
+        emb = centers[rng.integers(0, identities, n)] + noise * rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+        emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+        store.append("synthetic", "synthetic.mp4", {
+            "timestamp": list(start + np.arange(n, dtype=np.float64)),
+            "frame_idx": list(start + np.arange(n)),
+            "box": [(0, 0, 0, 0)] * n,
+            "embedding": list(emb),
+        })
+    store.flush()
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark compressed face-embedding search against brute force")
+    parser.add_argument("--synthetic", type=int, help="Benchmark on this many synthetic faces instead of the stored ones")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 64, 256])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = synthetic_store(tmp, args.synthetic) if args.synthetic else FaceEmbeddingStore()
+        index = EmbeddingIndex(store, pq=True)
+        if not len(index):
+            raise SystemExit("No face embeddings stored yet")
+        rng = np.random.default_rng(1)
+        # Queries are perturbed stored faces, like a new photo of an indexed person
+        queries = gather_rows(index.segments, index.offsets, rng.choice(len(index), args.queries))
+        queries += 0.3 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(EMBEDDING_DIM)
+        benchmark(index, queries, args.k, args.rerank)
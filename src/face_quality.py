@@ -0,0 +1,116 @@
+import threading
+import cv2
+import numpy as np
+
+from config import config
+from tensor_pool import tensor_pool
+
+### FACE QUALITY GATE
+
+COMPONENTS = ("size", "probability", "sharpness", "pose")
+
+
+def pose_score(landmarks):
+    """
+    Frontalness of (N,5,2) MTCNN landmarks (eyes, nose, mouth corners) in
+    [0,1]: 1 when the nose sits midway between the eyes along the eye line,
+    0 when it reaches either eye (profile). Roll is factored out by measuring
+    along the eye axis.
+    """
+    left_eye, right_eye, nose = landmarks[:, 0], landmarks[:, 1], landmarks[:, 2]
+    axis = right_eye - left_eye
+    eye_dist = np.linalg.norm(axis, axis=1)
+    axis = axis / np.maximum(eye_dist, 1e-6)[:, None]
+    offset = ((nose - (left_eye + right_eye) / 2) * axis).sum(axis=1)
+    return np.clip(1.0 - 2.0 * np.abs(offset) / np.maximum(eye_dist, 1e-6), 0.0, 1.0)
+
+
+def sharpness(frames, boxes, size=160):
+    """Variance of the Laplacian of each face crop, resized to the embedder's input size"""
+    pooled = tensor_pool.acquire(len(boxes), (size, size))
+    crops = pooled.numpy()
+    for i, (frame, box) in enumerate(zip(frames, boxes)):
+        height, width = frame.shape[:2]
+        x1, y1 = int(max(box[0], 0)), int(max(box[1], 0))
+        x2, y2 = int(min(box[2], width)), int(min(box[3], height))
+        if x2 <= x1 or y2 <= y1:
+            crops[i] = 0
+            continue
+        grey = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_RGB2GRAY)
+        crops[i] = cv2.resize(grey, (size, size), interpolation=cv2.INTER_AREA)
+    laplacian = (4 * crops[:, 1:-1, 1:-1] - crops[:, :-2, 1:-1] - crops[:, 2:, 1:-1]
+                 - crops[:, 1:-1, :-2] - crops[:, 1:-1, 2:])
+    tensor_pool.release(pooled)
+    return laplacian.var(axis=(1, 2))
+
+
+class FaceQualityGate:
+    """
+    Drops faces that are not worth embedding before they reach
+    InceptionResnetV1. Each face gets a score in [0,1] per component:
+      - size:        shorter box side relative to `good_size` pixels,
+      - probability: MTCNN face probability, rescaled from [0.9, 1],
+      - sharpness:   Laplacian variance relative to `good_sharpness`,
+      - pose:        landmark frontalness (see pose_score).
+    Its quality is the weakest component; faces below `floor` are skipped.
+    Keeps per-run counts of skipped faces by limiting component.
+    """
+    def __init__(self, floor=None, good_size=None, good_sharpness=None, image_size=160):
+        self.floor = config.FACE_QUALITY_FLOOR if floor is None else floor
+        self.good_size = config.FACE_QUALITY_SIZE if good_size is None else good_size
+        self.good_sharpness = config.FACE_QUALITY_SHARPNESS if good_sharpness is None else good_sharpness
+        self.image_size = image_size
+        self.total = 0
+        self.skipped = 0
+        self.skipped_by = dict.fromkeys(COMPONENTS, 0)
+        self._lock = threading.Lock()
+
+    def scores(self, frames, boxes, probs, landmarks):
+        """(N,4) component scores, in COMPONENTS order, for N faces of the given frames"""
+        sides = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        return np.stack([
+            np.clip(sides / self.good_size, 0.0, 1.0),
+            np.clip((probs - 0.9) / 0.1, 0.0, 1.0),
+            np.clip(sharpness(frames, boxes, self.image_size) / self.good_sharpness, 0.0, 1.0),
+            pose_score(landmarks),
+        ], axis=1)
+
+    def __call__(self, frames, batch_boxes, batch_probs, batch_landmarks):
+        """Filter MTCNN output for a batch of frames; returns per-frame boxes (None where no face passes)"""
+        owners, boxes, probs, landmarks = [], [], [], []
+        for i, (b, p, l) in enumerate(zip(batch_boxes, batch_probs, batch_landmarks)):
+            if b is None:
+                continue
+            owners.extend([i] * len(b))
+            boxes.append(np.asarray(b, dtype=np.float64).reshape(-1, 4))
+            probs.append(np.asarray(p, dtype=np.float32).reshape(-1))
+            landmarks.append(np.asarray(l, dtype=np.float32).reshape(-1, 5, 2))
+        if not owners:
+            return list(batch_boxes)
+
+        owners = np.asarray(owners)
+        boxes = np.concatenate(boxes)
+        scores = self.scores([frames[o] for o in owners], boxes, np.concatenate(probs), np.concatenate(landmarks))
+        keep = scores.min(axis=1) >= self.floor
+        weakest = scores.argmin(axis=1)[~keep]
+        with self._lock:
+            self.total += len(keep)
+            self.skipped += int((~keep).sum())
+            for c in weakest:
+                self.skipped_by[COMPONENTS[c]] += 1
+
+        filtered = []
+        for i in range(len(batch_boxes)):
+            mask = keep & (owners == i)
+            filtered.append(boxes[mask] if mask.any() else None)
+        return filtered
+
+    @property
+    def skip_rate(self):
+        return self.skipped / self.total if self.total else 0.0
+
+    def summary(self):
+        with self._lock:
+            reasons = ", ".join(f"{name} {count}" for name, count in self.skipped_by.items() if count)
+        return (f"Face quality: {self.skipped}/{self.total} faces skipped before embedding ({self.skip_rate:.1%})"
+                + (f"; weakest: {reasons}" if reasons else ""))
@@ -0,0 +1,173 @@
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+from decoders import open_decoder, _output_size
+
+### SHARED-MEMORY FRAME RING
+
+_END = -1  # Slot index marking the end of the stream
+
+
+class SharedFrameRing:
+    """
+    Fixed-size frame slots in one multiprocessing.shared_memory block.
+    Slot ownership is passed through two queues that carry only slot
+    indices, never pixels:
+      - `free`:  slots the writer may fill,
+      - `ready`: (slot, frame_idx) pairs the reader may use.
+    The writer decodes straight into a slot's NumPy view and publishes it;
+    the reader works on the view in place and releases the slot when done,
+    so frames cross the process boundary without being copied.
+    """
+    def __init__(self, slots, shape, ctx=None, name=None, free=None, ready=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        frame_bytes = int(np.prod(self.shape))
+        self._owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self._owner, size=slots * frame_bytes)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        if self._owner:
+            ctx = ctx or mp.get_context("spawn")
+            free, ready = ctx.Queue(), ctx.Queue()
+            for slot in range(slots):
+                free.put(slot)
+        self.free, self.ready = free, ready
+
+    def spec(self):
+        """Arguments that attach another process to this ring"""
+        return {"slots": self.slots, "shape": self.shape, "name": self.shm.name, "free": self.free, "ready": self.ready}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["slots"], spec["shape"], name=spec["name"], free=spec["free"], ready=spec["ready"])
+
+    # Writer side
+    def acquire(self, timeout=None):
+        """Next free slot, or None on timeout"""
+        try:
+            return self.free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def publish(self, slot, frame_idx):
+        self.ready.put((slot, frame_idx))
+
+    def finish(self, error=None):
+        self.ready.put((_END, error))
+
+    # Reader side
+    def get(self, timeout=None):
+        """(slot, frame_idx) of the next frame, (None, error) at the end, or None on timeout"""
+        try:
+            slot, value = self.ready.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return (None, value) if slot == _END else (slot, value)
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def close(self):
+        """Detach from the shared block (and free it, in the process that created it)"""
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # Views still alive elsewhere; the mapping goes away with them
+        if self._owner:
+            self.shm.unlink()
+
+
+def _decode_into_ring(spec, stop, video_path, backend, size, frame_step, metadata, start_frame):
+    """Decoder process: fill free slots with converted frames until the video ends or `stop` is set"""
+    cv2.setNumThreads(1)  # One sequential stream; leave the cores to inference
+    ring = SharedFrameRing.attach(spec)
+    decoder = None
+    try:
+        decoder = open_decoder(video_path, backend=backend, size=size, frame_step=frame_step,
+                               metadata=metadata, start_frame=start_frame)
+        while not stop.is_set():
+            slot = ring.acquire(timeout=0.5)
+            if slot is None:
+                continue
+            frame_idx = decoder.read_into(ring.frames[slot])
+            if frame_idx is None:
+                ring.release(slot)
+                break
+            ring.publish(slot, frame_idx)
+        ring.finish()
+    except Exception as e:
+        ring.finish(f"{type(e).__name__}: {e}")
+    finally:
+        if decoder is not None:
+            decoder.close()
+        ring.close()
+
+
+class SharedMemoryFrameSource:
+    """
+    Decode a video in a separate process into a SharedFrameRing and read
+    it here as batches of (frame_idx, fps, frame) in the format of
+    read_sampled_frames. Frames are views into shared memory, already RGB
+    at the output size: release() each batch once it is finished with, and
+    copy any frame that must outlive it. Starting the process costs about
+    a second per video, so this pays off on long recordings.
+    """
+    def __init__(self, video_path, metadata, backend="opencv", size=None, frame_step=1, start_frame=0, slots=64):
+        self.fps = metadata.fps
+        width, height = _output_size(metadata.width, metadata.height, size)
+        # Spawned, not forked: the child must not inherit torch/OpenCV thread pools
+        ctx = mp.get_context("spawn")
+        self.ring = SharedFrameRing(slots, (height, width, 3), ctx=ctx)
+        self._stop = ctx.Event()
+        self._slots = {}
+        self._process = ctx.Process(
+            target=_decode_into_ring,
+            args=(self.ring.spec(), self._stop, video_path, backend, size, frame_step, metadata.as_probe(), start_frame),
+            name=f"decode-{metadata.content_hash[:8]}",
+            daemon=True
+        )
+        self._process.start()
+
+    def batches(self, batch_size=16):
+        """Yield batches of frame views until the decoder process finishes"""
+        # A batch being filled must never wait on slots held by the batch before it
+        batch_size = max(1, min(batch_size, self.ring.slots // 2))
+        batch = []
+        while True:
+            item = self.ring.get(timeout=1.0)
+            if item is None:
+                if not self._process.is_alive():
+                    raise RuntimeError("Decoder process exited unexpectedly")
+                continue
+            slot, value = item
+            if slot is None:
+                if value:
+                    raise RuntimeError(f"Decoder process failed: {value}")
+                break
+            self._slots[value] = slot
+            batch.append((value, self.fps, self.ring.frames[slot]))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def release(self, batch_info):
+        """Hand the slots of a finished batch back to the decoder process"""
+        for frame_idx, _, _ in batch_info:
+            slot = self._slots.pop(frame_idx, None)
+            if slot is not None:
+                self.ring.release(slot)
+
+    def close(self):
+        """Stop the decoder process and free the shared memory; call once no frame views are in use"""
+        self._stop.set()
+        self._process.join(timeout=5.0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self.ring.close()
@@ -0,0 +1,122 @@
+import time, queue, threading
+from concurrent.futures import Future
+import torch
+
+from config import config
+from tensor_pool import tensor_pool
+
+### DYNAMIC BATCHING INFERENCE SERVER
+
+_CLOSE = object()
+
+
+class DynamicBatcher:
+    """
+    In-process inference server shared by many caller threads.
+    Callers submit (N, ...) tensors; a single worker thread gathers requests
+    into one batch until it holds `max_batch_size` rows or the first request
+    has waited `max_wait` seconds, runs `fn` once on the concatenation and
+    routes each caller's slice of the output back through its Future.
+    The concatenated batch is assembled in a pooled buffer.
+    """
+    def __init__(self, fn, max_batch_size=64, max_wait=0.005, name="batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, inputs):
+        """Queue an (N, ...) tensor; returns a Future of the (N, ...) output"""
+        future = Future()
+        self._queue.put((inputs, future))
+        return future
+
+    def __call__(self, inputs):
+        return self.submit(inputs).result()
+
+    def _gather(self, first):
+        """Collect requests for one batch; returns (batch, carry, closing)"""
+        batch, rows = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _CLOSE:
+                return batch, None, True
+            if rows + len(item[0]) > self.max_batch_size:
+                return batch, item, False  # Starts the next batch
+            batch.append(item)
+            rows += len(item[0])
+        return batch, None, False
+
+    def _run(self):
+        carry, closing = None, False
+        while not closing or carry is not None:
+            item = carry if carry is not None else self._queue.get()
+            if item is _CLOSE:
+                break
+            batch, carry, closing = self._gather(item)
+            counts = [len(inputs) for inputs, _ in batch]
+            first = batch[0][0]
+            merged = tensor_pool.acquire(sum(counts), first.shape[1:], first.dtype)
+            try:
+                outputs = self.fn(torch.cat([inputs for inputs, _ in batch], dim=0, out=merged))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                tensor_pool.release(merged)
+            offset = 0
+            for (_, future), count in zip(batch, counts):
+                future.set_result(outputs[offset:offset + count])
+                offset += count
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.rows += sum(counts)
+
+    def close(self):
+        """Finish queued requests and stop the worker"""
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def summary(self):
+        with self._lock:
+            mean = self.rows / self.batches if self.batches else 0.0
+            return (f"{self.rows} rows from {self.requests} requests in {self.batches} batches "
+                    f"(mean batch {mean:.1f})")
+
+
+class FaceEmbeddingServer(DynamicBatcher):
+    """Batches face crops (N,3,160,160) from every video being processed into shared InceptionResnetV1 calls"""
+    def __init__(self, resnet, device, max_batch_size=None, max_wait_ms=None):
+        self.resnet = resnet
+        self.device = device
+        super().__init__(
+            self._embed,
+            max_batch_size=config.EMBED_MAX_BATCH if max_batch_size is None else max_batch_size,
+            max_wait=(config.EMBED_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000.0,
+            name="face-embedder"
+        )
+
+    def _embed(self, faces):
+        faces = faces.to(self.device)
+        if self.device.type == 'cuda':
+            faces = faces.half()
+        with torch.no_grad():
+            if self.device.type == 'cuda':
+                with torch.cuda.amp.autocast():
+                    return self.resnet(faces)
+            return self.resnet(faces)
@@ -16,6 +16,7 @@ import torch
 from missing_person_detection import run_missing_person_detection
 from violence_detection import run_violence_detection
 from utils import select_files
+from config import config
 
 ### SECTION 4: INTEGRATION AND MAIN EXECUTION
 
@@ -39,7 +40,8 @@ def run_full_pipeline():
         print("\n[STEP 2] VIOLENCE DETECTION")
         print("------------------------------")
         # Extract unique video files from detections
-        detected_videos = list(set([det['video_filename'] for det in missing_person_detections]))
+        # Full paths: the basename alone only resolves when run from the video directory
+        detected_videos = list(set([det['video'] for det in missing_person_detections]))
         print(f"Analyzing {len(detected_videos)} videos with detected missing persons for violence...")
         run_violence_detection(detected_videos)
     else:
@@ -71,6 +73,74 @@ def run_only_violence_detection():
     else:
         print("No videos selected. Exiting.")
 
+def run_live_stream_mode():
+    """Monitor live camera streams (or video files replayed in real time)"""
+    from stream_mode import run_live_mode
+    from missing_person_detection import setup_missing_person_detection, load_reference_images
+    from violence_detection import load_violence_detection_model
+
+    sources = [s.strip() for s in input("Enter stream URLs or video paths (comma-separated): ").split(",") if s.strip()]
+    if not sources:
+        print("No streams given. Exiting.")
+        return
+    device, mtcnn, resnet = setup_missing_person_detection()
+    ref_embeddings = None
+    if input("Search for a missing person? (y/n): ").strip().lower() == "y":
+        ref_embeddings, _ = load_reference_images(device, mtcnn, resnet)
+    violence_model = load_violence_detection_model(device)
+    run_live_mode(sources, device, mtcnn, resnet, ref_embeddings, violence_model)
+
+def prompt(question, parse, error):
+    """Ask `question` until `parse` accepts the answer; `error` says what is expected"""
+    while True:
+        answer = input(question).strip()
+        try:
+            return parse(answer)
+        except ValueError:
+            print(error)
+
+def _stop_after(answer):
+    if not answer:
+        return None
+    if int(answer) < 1:
+        raise ValueError(answer)
+    return int(answer)
+
+def _priority(answer):
+    from priority_search import PRIORITIES
+    if (answer or "recent") not in PRIORITIES:
+        raise ValueError(answer)
+    return answer or "recent"
+
+def _last_seen(answer):
+    from query_service import parse_time
+    if not answer:
+        raise ValueError(answer)
+    return parse_time(answer)
+
+def run_priority_search_mode():
+    """Urgent missing person search: most promising footage first, stopping after enough sightings"""
+    from priority_search import run_priority_search, PRIORITIES
+
+    print("Select video files to search:")
+    video_files = select_files("Select Video Files", [("Video files", "*.mp4 *.avi *.mov")])
+    if not video_files:
+        print("No videos selected. Exiting.")
+        return
+    priority = prompt(f"Search order ({'/'.join(PRIORITIES)}) [recent]: ", _priority,
+                      f"Search order must be one of: {', '.join(PRIORITIES)}.")
+    cameras = around = None
+    if priority == "cameras":
+        cameras = [c.strip() for c in input("Cameras, nearest first (comma-separated): ").split(",") if c.strip()]
+    elif priority == "around":
+        around = prompt("Last known time (YYYY-MM-DD HH:MM): ", _last_seen,
+                        "Last known time must look like 2024-05-01 14:30.")
+    stop_after = prompt("Stop after how many high-confidence sightings? (blank: search everything): ", _stop_after,
+                        "Number of sightings must be a whole number of at least 1, or blank.")
+    run_priority_search(video_files, priority=priority, cameras=cameras, around=around,
+                        stop_after=stop_after,
+                        sinks=("-", os.path.join(config.OUTPUT_DIR, "priority", "sightings.jsonl")))
+
 # Main execution section
 if __name__ == '__main__':
     print("======================================================")
@@ -80,16 +150,22 @@ if __name__ == '__main__':
     print("1. Run full pipeline (Missing Person + Violence Detection)")
     print("2. Run only Missing Person Detection")
     print("3. Run only Violence Detection")
+    print("4. Live stream monitoring")
+    print("5. Priority search (urgent missing person case)")
     
     try:
-        choice = int(input("Enter your choice (1-3): "))
+        choice = int(input("Enter your choice (1-5): "))
         if choice == 1:
             run_full_pipeline()
         elif choice == 2:
             run_only_missing_person_detection()
         elif choice == 3:
             run_only_violence_detection()
+        elif choice == 4:
+            run_live_stream_mode()
+        elif choice == 5:
+            run_priority_search_mode()
         else:
             print("Invalid choice. Exiting.")
     except ValueError:
-        print("Please enter a number between 1 and 3. Exiting.")
\ No newline at end of file
+        print("Please enter a number between 1 and 5. Exiting.")
\ No newline at end of file
@@ -1,11 +1,28 @@
-import sys, os, time, cv2, numpy as np, torch, asyncio
+import sys, os, time, cv2, numpy as np, torch
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image, ImageDraw
 from facenet_pytorch import MTCNN, InceptionResnetV1
 import torch
 
 # Import from your custom modules
+from config import config
 from utils import select_files
+from pipeline import StagedPipeline, PipelineStage
+from decoders import open_decoder, read_frame_at
+from frame_ring import SharedMemoryFrameSource
+from video_index import VideoIndex, ProgressETA, camera_name
+from attribute_index import AttributeStore, extract_attributes
+from embedding_index import FaceEmbeddingStore
+from calibration import FaceScoreStore
+from reference_gallery import ReferenceGallery, as_templates, image_hash
+from checkpoint import JobCheckpoint, CommitWatermark
+from inference_server import FaceEmbeddingServer
+from tensor_pool import tensor_pool, crop_faces_into
+from face_quality import FaceQualityGate
+from roi import roi_for, roi_signature
+from results_db import ResultsDB
+from prefetch import prefetching, prefetched
+from resources import governor
 from report_generation import export_to_pdf
 
 ### SECTION 2: MISSING PERSON DETECTION
@@ -13,6 +30,7 @@ from report_generation import export_to_pdf
 def setup_missing_person_detection():
     """Initialize models and device for face detection"""
     print("Setting up Missing Person Detection System")
+    governor.apply()
 
     # Device and Model Initialization
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -20,7 +38,7 @@ def setup_missing_person_detection():
 
     # Set up face detection and recognition models
     mtcnn = MTCNN(keep_all=True, device=device)
-    resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+    resnet = InceptionResnetV1(pretrained=config.FACE_MODEL_WEIGHTS).eval().to(device)
     if device.type == 'cuda':
         resnet = resnet.half()
 
@@ -35,29 +53,11 @@ def load_reference_images(device, mtcnn, resnet):
     if not ref_filenames:
         sys.exit("No reference image selected.")
 
-    ref_embeddings = []
-    for ref_filename in ref_filenames:
-        ref_img = Image.open(ref_filename).convert("RGB")
-        faces, probs = mtcnn(ref_img, return_prob=True)
-        if faces is None or (hasattr(faces, '__len__') and len(faces) == 0):
-            continue
-        # Use highest probability face if multiple are detected
-        ref_face = faces[int(np.argmax(probs))] if faces.ndim == 4 else faces
-        with torch.no_grad():
-            emb = resnet(
-                ref_face.unsqueeze(0).to(device).half() if device.type=='cuda'
-                else ref_face.unsqueeze(0).to(device)
-            )
-        ref_embeddings.append(emb)
-
-    if not ref_embeddings:
+    gallery = ReferenceGallery(mtcnn, resnet, device).load(ref_filenames)
+    if not len(gallery):
         sys.exit("No valid faces detected in the reference images.")
 
-    # Convert reference embeddings to half precision if on GPU
-    if device.type == 'cuda':
-        ref_embeddings = [emb.half() for emb in ref_embeddings]
-
-    return ref_embeddings, ref_filenames
+    return gallery.templates, gallery.filenames  # Filenames of the images with a face, one per template
 
 def load_video_files():
     """Load video files to search for the missing person"""
@@ -78,133 +78,340 @@ def fast_dominant_color(pil_img_region):
     mean_color = np_region.mean(axis=(0, 1))
     return tuple(map(int, mean_color[:3]))
 
-async def async_video_loader(video_path, buffer_size=64):
-    """Asynchronous video loader that buffers frames to reduce disk I/O latency"""
-    cap = cv2.VideoCapture(video_path)
-    frames_buffer = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        frames_buffer.append(rgb_frame)
-        if len(frames_buffer) >= buffer_size:
-            yield frames_buffer
-            frames_buffer = []
-    if frames_buffer:
-        yield frames_buffer
-    cap.release()
-
-def process_batch(batch_info, video_filename, mtcnn, resnet, device, ref_embeddings, detection_threshold):
+def read_sampled_frames(decoder, batch_size=16):
     """
-    Process a batch of frames:
-      - Detect faces in each frame.
-      - Batch-process face crops using the ResNet model.
-      - Compare embeddings with reference embeddings.
+    Read the decoder's sampled frames and yield them in batches of
+    (frame_idx, fps, raw_frame). Raw frames are finished by decode_batch.
     """
-    detections = []
-    face_tensors = []   # List of face crop tensors
-    face_meta = []      # Corresponding metadata for each detected face
+    fps = decoder.source_fps
+    try:
+        while True:
+            batch = decoder.read_batch(batch_size)
+            if not batch:
+                break
+            yield [(frame_idx, fps, frame) for frame_idx, frame in batch]
+    finally:
+        decoder.close()
+
+def frames_until(batches, end_frame):
+    """Batches of (frame_idx, ...) up to, not including, `end_frame`"""
+    try:
+        for batch in batches:
+            kept = [item for item in batch if item[0] < end_frame]
+            if kept:
+                yield kept
+            if len(kept) < len(batch):
+                return
+    finally:
+        batches.close()  # Stops the decoder
+
+def decode_batch(batch_info, decoder):
+    """Convert a batch of raw frames to RGB at the decoder's output size"""
+    return [(frame_idx, fps, decoder.convert(frame)) for frame_idx, fps, frame in batch_info]
+
+def detect_faces(batch_info, mtcnn, quality_gate=None, roi=None):
+    """
+    Detect faces in a batch of RGB frames and crop them. With a
+    `quality_gate` (FaceQualityGate), faces too small, blurry, uncertain or
+    turned away to be worth embedding are dropped before cropping.
+    With a `roi` (RegionOfInterest), MTCNN only sees the camera's region of
+    interest; boxes are mapped back to full-frame coordinates.
+    Returns (batch_info, faces, face_meta), where faces is a pooled
+    (N,3,160,160) tensor of crops (None without faces) and face_meta holds
+    (frame_idx, fps, orig_rgb, box) for every crop.
+    """
+    face_meta = []      # Metadata for each detected face, in crop order
 
-    for frame_idx, fps, orig_rgb in batch_info:
-        pil_img = Image.fromarray(orig_rgb)
-        boxes, _ = mtcnn.detect(pil_img)
+    frames = [orig_rgb for _, _, orig_rgb in batch_info]
+    detect_frames = [roi.apply(f) for f in frames] if roi is not None else frames
+    # Frames of one video share a size, so MTCNN can run on the whole batch at once
+    if len({f.shape for f in detect_frames}) == 1:
+        batch_boxes, batch_probs, batch_points = mtcnn.detect(np.stack(detect_frames), landmarks=True)
+    else:
+        batch_boxes, batch_probs, batch_points = zip(*[mtcnn.detect(f, landmarks=True) for f in detect_frames])
+    if roi is not None:
+        batch_boxes, batch_points = roi.shift(frames[0].shape, batch_boxes, batch_points)
+    if quality_gate is not None:
+        batch_boxes = quality_gate(frames, batch_boxes, batch_probs, batch_points)
+    faces, _ = crop_faces_into(frames, batch_boxes, mtcnn)
+
+    for (frame_idx, fps, orig_rgb), boxes in zip(batch_info, batch_boxes):
         if boxes is None:
             continue
-        faces, probs = mtcnn(pil_img, return_prob=True)
-        if faces is None or faces.ndim != 4:
-            continue
-        for i, face in enumerate(faces):
-            face_tensors.append(face.unsqueeze(0))
-            face_meta.append((frame_idx, fps, orig_rgb, boxes[i], pil_img))
+        for box in boxes:
+            face_meta.append((frame_idx, fps, orig_rgb, box))
 
-    if not face_tensors:
-        return detections
+    return batch_info, faces, face_meta
 
-    faces_batch = torch.cat(face_tensors, dim=0).to(device)
-    if device.type == 'cuda':
-        faces_batch = faces_batch.half()
+def index_attributes(detected, attribute_store, camera, video_start, video_filename):
+    """Add clothing-colour histograms for every detected person to the attribute store"""
+    _, _, face_meta = detected
+    rows, hists = extract_attributes(face_meta)
+    attribute_store.add(camera, os.path.basename(video_filename), video_start, rows, hists)
+    return detected
 
-    with torch.no_grad():
+def embed_faces(detected, resnet, device, embedder=None):
+    """
+    Embed all face crops of a batch with a single ResNet forward pass, or
+    through a shared FaceEmbeddingServer (`embedder`) that batches crops
+    across videos. The pooled crop tensor is released afterwards.
+    """
+    batch_info, faces, face_meta = detected
+    if faces is None:
+        return batch_info, None, face_meta
+    try:
+        if embedder is not None:
+            return batch_info, embedder(faces), face_meta
+
+        faces_batch = faces.to(device)
         if device.type == 'cuda':
-            with torch.cuda.amp.autocast():
+            faces_batch = faces_batch.half()
+
+        with torch.no_grad():
+            if device.type == 'cuda':
+                with torch.cuda.amp.autocast():
+                    embeddings = resnet(faces_batch)
+            else:
                 embeddings = resnet(faces_batch)
-        else:
-            embeddings = resnet(faces_batch)
-
-    # Compare each face embedding with each reference embedding
-    for idx, embedding in enumerate(embeddings):
-        frame_idx, fps, orig_rgb, box, pil_img = face_meta[idx]
-        for ref_embedding in ref_embeddings:
-            cos_sim = torch.nn.functional.cosine_similarity(
-                ref_embedding, embedding.unsqueeze(0).to(device)
-            ).item()
-            if cos_sim > detection_threshold:
-                detection_time = frame_idx / fps if fps else frame_idx
-                x1, y1, x2, y2 = map(int, box)
-                torso_top = y2
-                torso_bottom = y2 + int((y2 - y1) * 1.5)
-                torso_bottom = min(torso_bottom, pil_img.height)
-                torso_region = pil_img.crop((x1, torso_top, x2, torso_bottom))
-                dominant_color = fast_dominant_color(torso_region)
-                detections.append({
-                    'frame_idx': frame_idx,
-                    'time': detection_time,
-                    'similarity': cos_sim,
-                    'video_filename': os.path.basename(video_filename),
-                    'frame_img': orig_rgb,
-                    'box': (x1, y1, x2, y2),
-                    'dominant_color': dominant_color
-                })
+        return batch_info, embeddings, face_meta
+    finally:
+        tensor_pool.release(faces)
+
+def index_embeddings(embedded, embedding_store, camera, video_start, video_filename):
+    """Add the embedding of every detected face to the embedding store"""
+    _, embeddings, face_meta = embedded
+    embedding_store.add(camera, os.path.abspath(video_filename), video_start, face_meta, embeddings)
+    return embedded
+
+def match_faces(embedded, video_filename, device, ref_embeddings, detection_threshold, on_scores=None):
+    """
+    Compare each face embedding with each normalized reference template (N,D)
+    and build detections. `on_scores(face_meta, similarities)` receives the
+    full (F,N) similarity matrix, matched or not.
+    """
+    batch_info, embeddings, face_meta = embedded
+    detections = []
+    if embeddings is None:
+        return batch_info, detections
+
+    # Cosine similarity of every face against every reference in one matmul
+    templates = ref_embeddings.to(device)
+    faces = torch.nn.functional.normalize(embeddings.to(device).float(), dim=1)
+    similarities = (faces @ templates.float().T).cpu().numpy()
+    if on_scores is not None:
+        on_scores(face_meta, similarities)
+
+    for idx, face_similarities in enumerate(similarities):
+        frame_idx, fps, orig_rgb, box = face_meta[idx]
+        for ref_idx in np.flatnonzero(face_similarities > detection_threshold):
+            cos_sim = float(face_similarities[ref_idx])
+            detection_time = frame_idx / fps if fps else frame_idx
+            height, width = orig_rgb.shape[:2]
+            x1, y1, x2, y2 = map(int, box)
+            torso_top = max(y2, 0)
+            torso_bottom = min(y2 + int((y2 - y1) * 1.5), height)
+            torso_region = orig_rgb[torso_top:torso_bottom, max(x1, 0):min(x2, width)]
+            dominant_color = fast_dominant_color(torso_region) if torso_region.size else (0, 0, 0)
+            detections.append({
+                'frame_idx': frame_idx,
+                'time': detection_time,
+                'similarity': cos_sim,
+                'video_filename': os.path.basename(video_filename),
+                'video': os.path.abspath(video_filename),
+                'frame_img': orig_rgb,
+                'box': (x1, y1, x2, y2),
+                'dominant_color': dominant_color,
+                'reference': int(ref_idx)
+            })
+    return batch_info, detections
+
+def process_batch(batch_info, video_filename, mtcnn, resnet, device, ref_embeddings, detection_threshold):
+    """
+    Process a batch of RGB frames:
+      - Detect faces in each frame.
+      - Batch-process face crops using the ResNet model.
+      - Compare embeddings with reference embeddings.
+    """
+    detected = detect_faces(batch_info, mtcnn)
+    embedded = embed_faces(detected, resnet, device)
+    _, detections = match_faces(embedded, video_filename, device, as_templates(ref_embeddings), detection_threshold)
     return detections
 
-def process_video(video_filename, mtcnn, resnet, device, ref_embeddings, frame_interval=60, batch_size=16, detection_threshold=0.65):
-    """Process a single video file: Uses an asynchronous loader to fetch buffered frames."""
+def show_detections(batch_info, detections):
+    """Display a batch of frames with their face boxes; returns False if 'q' was pressed"""
+    for frame_idx, _, frame in batch_info:
+        for det in detections:
+            if det['frame_idx'] == frame_idx:
+                x1, y1, x2, y2 = det['box']
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.imshow("Missing Person Detection", frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            return False
+    return True
+
+def process_video(video_filename, mtcnn, resnet, device, ref_embeddings, frame_interval=60, batch_size=16, detection_threshold=0.65, stop_event=None, metadata=None, on_progress=None, attribute_store=None, checkpoint=None, preview=True, embedding_store=None, embedder=None, quality_gate=None, score_store=None, results=None, start_frame=0, end_frame=None, on_detections=None):
+    """
+    Process a single video file through a staged pipeline:
+    read -> decode -> detect -> embed -> match, with bounded queues between
+    stages so decoding overlaps with inference. Pressing 'q' in the preview
+    window or setting `stop_event` cancels the pipeline.
+    `metadata` (from VideoIndex) avoids re-probing the file, and
+    `on_progress(frames_done)` is called as batches complete.
+    With an `attribute_store`, clothing colours of every detected person
+    are indexed as well, matched or not; likewise every face embedding
+    with an `embedding_store`, for later search without re-processing.
+    With a `checkpoint` (JobCheckpoint), processing resumes from the video's
+    last committed frame and new detections are journaled as batches finish.
+    `preview=False` runs headless, without the OpenCV window.
+    `embedder` (FaceEmbeddingServer) replaces the per-video ResNet calls.
+    `quality_gate` (FaceQualityGate) skips faces not worth embedding.
+    With a `score_store` (FaceScoreStore), every face-to-reference similarity
+    is recorded for threshold calibration.
+    With `results` (ResultsRun), detections are written to the results
+    database as batches finish and an empty list is returned, so frames
+    of matched faces are not held in memory until the report.
+    `start_frame`/`end_frame` limit processing to one segment of the video,
+    and `on_detections(batch_info, detections)` receives each batch's
+    detections as soon as it finishes, with frames still valid.
+    With config.DECODE_PROCESS, frames are decoded in a separate process
+    into a shared-memory ring instead of the "decode" stage threads.
+    Faces are only searched for in the camera's region of interest, if one
+    is configured in ROI_FILE.
+    """
     detections_video = []
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    buffer_generator = async_video_loader(video_filename, buffer_size=64)
-    batch_info = []
-    frame_idx = 0
+    ref_embeddings = as_templates(ref_embeddings)
+    if checkpoint is not None and metadata is None:
+        metadata = VideoIndex().get(video_filename)
+    video_key = metadata.content_hash if checkpoint is not None else None
+    if checkpoint is not None:
+        start_frame = checkpoint.resume_frame(video_key)
+    frames_done = start_frame
+    ring_source = None
+    if config.DECODE_PROCESS:
+        if metadata is None:
+            metadata = VideoIndex().get(video_filename)
+        ring_source = SharedMemoryFrameSource(
+            video_filename, metadata, backend=config.FACE_DECODER, size=config.FACE_DECODE_WIDTH,
+            frame_step=frame_interval, start_frame=start_frame, slots=config.FRAME_RING_SLOTS
+        )
+        source = ring_source.batches(batch_size)
+    else:
+        decoder = open_decoder(
+            video_filename, backend=config.FACE_DECODER, size=config.FACE_DECODE_WIDTH, frame_step=frame_interval,
+            metadata=metadata.as_probe() if metadata is not None else None, start_frame=start_frame
+        )
+        source = read_sampled_frames(decoder, batch_size)
+    if end_frame is not None:
+        source = frames_until(source, end_frame)
+    watermark = CommitWatermark()
+    committed_frame = None
+
+    def issue(batches):
+        # Batches finish out of order across workers; only a finished prefix is committed
+        for batch in batches:
+            watermark.issue(batch[0][0])
+            yield batch
+
+    camera = camera_name(video_filename)
+    roi = roi_for(camera)
+    stages = []
+    if ring_source is None:
+        stages.append(PipelineStage("decode", lambda b: decode_batch(b, decoder), config.DECODE_WORKERS))
+    stages.append(PipelineStage("detect", lambda b: detect_faces(b, mtcnn, quality_gate, roi), config.DETECT_WORKERS))
+    if (attribute_store is not None or embedding_store is not None or score_store is not None
+            or results is not None) and metadata is None:
+        metadata = VideoIndex().get(video_filename)
+    if attribute_store is not None:
+        stages.append(PipelineStage(
+            "attributes",
+            lambda d: index_attributes(d, attribute_store, camera, metadata.start_time, video_filename),
+            config.ATTRIBUTE_WORKERS
+        ))
+    stages.append(PipelineStage("embed", lambda d: embed_faces(d, resnet, device, embedder), config.EMBED_WORKERS))
+    if embedding_store is not None:
+        stages.append(PipelineStage(
+            "index",
+            lambda e: index_embeddings(e, embedding_store, camera, metadata.start_time, video_filename),
+            config.MATCH_WORKERS
+        ))
+    on_scores = None
+    if score_store is not None:
+        video_path = os.path.abspath(video_filename)
+        on_scores = lambda face_meta, sims: score_store.add(camera, video_path, metadata.start_time, face_meta, sims)
+    stages.append(PipelineStage(
+        "match", lambda e: match_faces(e, video_filename, device, ref_embeddings, detection_threshold, on_scores),
+        config.MATCH_WORKERS
+    ))
+    pipeline = StagedPipeline(
+        issue(source),
+        stages,
+        queue_size=config.PIPELINE_QUEUE_SIZE,
+        stop_event=stop_event,
+        name=os.path.basename(video_filename)
+    )
 
     # Open a window to display the video
-    cv2.namedWindow("Missing Person Detection", cv2.WINDOW_NORMAL)
-
-    while True:
-        try:
-            frames_buffer = loop.run_until_complete(buffer_generator.__anext__())
-        except StopAsyncIteration:
-            break
-        for frame in frames_buffer:
-            if frame_idx % frame_interval == 0:
-                cap = cv2.VideoCapture(video_filename)
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                cap.release()
-                if fps == 0:
-                    fps = 30.0
-                batch_info.append((frame_idx, fps, frame))
-                if len(batch_info) >= batch_size:
-                    detections_video.extend(process_batch(batch_info, video_filename, mtcnn, resnet, device, ref_embeddings, detection_threshold))
-                    batch_info = []
-
-                # Display the frame with bounding boxes
-                for det in detections_video:
-                    if det['frame_idx'] == frame_idx:
-                        x1, y1, x2, y2 = det['box']
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.imshow("Missing Person Detection", frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-
-            frame_idx += 1
-
-    if batch_info:
-        detections_video.extend(process_batch(batch_info, video_filename, mtcnn, resnet, device, ref_embeddings, detection_threshold))
-
-    loop.close()
-    cv2.destroyAllWindows()
+    if preview:
+        cv2.namedWindow("Missing Person Detection", cv2.WINDOW_NORMAL)
+
+    try:
+        with pipeline:
+            for batch_info, detections in pipeline:
+                if on_detections is not None:
+                    on_detections(batch_info, detections)
+                if results is not None:
+                    results.add_sightings(video_filename, detections, metadata, camera)
+                else:
+                    if ring_source is not None:
+                        # Ring slots are reused once released; keep only what the report needs
+                        for det in detections:
+                            det['frame_img'] = det['frame_img'].copy()
+                    detections_video.extend(detections)
+                if on_progress is not None:
+                    frames_done = max(frames_done, batch_info[-1][0] + 1)
+                    on_progress(frames_done)
+                if checkpoint is not None:
+                    committed = watermark.complete(batch_info[0][0], batch_info[-1][0] + frame_interval, detections)
+                    if committed is not None:
+                        committed_frame, new_detections = committed
+                        checkpoint.commit(video_key, video_filename, committed_frame, new_detections)
+                if preview and not show_detections(batch_info, detections):
+                    pipeline.cancel()
+                if ring_source is not None:
+                    ring_source.release(batch_info)
+            finished = not pipeline.cancelled
+    finally:
+        if ring_source is not None:
+            batch_info = detections = None  # Drop the last views into the ring before freeing it
+            ring_source.close()
+
+    if preview:
+        cv2.destroyAllWindows()
+    if checkpoint is not None:
+        if finished:
+            checkpoint.mark_done(video_key)
+        elif committed_frame is not None:
+            checkpoint.commit(video_key, video_filename, committed_frame, force=True)
     return detections_video
 
+def restore_detections(checkpoint):
+    """Detections committed by an earlier run of a resumed job, with their frames re-read for the report"""
+    restored = []
+    for path, det in checkpoint.detections():
+        det['video'] = path
+        det['box'] = tuple(det['box'])
+        det['dominant_color'] = tuple(det['dominant_color'])
+        det['frame_img'] = read_frame_at(path, det['frame_idx'], config.FACE_DECODE_WIDTH)
+        if det['frame_img'] is not None:
+            restored.append(det)
+    return restored
+
+def restore_results(checkpoint, results, video_index):
+    """Re-add detections committed by an earlier run of a resumed job; rows already stored are skipped"""
+    for path, det in checkpoint.detections():
+        results.add_sightings(path, [det], video_index.get(path), camera_name(path))
+    results.flush()
+
 def run_missing_person_detection():
     """Main function to run the missing person detection pipeline"""
     # Setup
@@ -212,21 +419,65 @@ def run_missing_person_detection():
 
     # Parameters
     frame_interval = 60        # Process every 60th frame
-    detection_threshold = 0.65  # Cosine similarity threshold
+    detection_threshold = config.FACE_THRESH  # Cosine similarity threshold; tune with calibration.py
     batch_size = 16            # Number of frames to process in one batch
 
     # Load reference images and videos
     ref_embeddings, ref_filenames = load_reference_images(device, mtcnn, resnet)
     video_files = load_video_files()
 
+    # Probe every video once (cached across runs) and start the longest first
+    video_index = VideoIndex()
+    video_files = video_index.schedule(video_files)
+    metadata = {vf: video_index.get(vf) for vf in video_files}
+    eta = ProgressETA(metadata.values())
+    attribute_store = AttributeStore() if config.ATTRIBUTE_INDEX else None
+    embedding_store = FaceEmbeddingStore() if config.EMBEDDING_INDEX else None
+    score_store = FaceScoreStore(ref_filenames) if config.SCORE_STORE else None
+
+    # Journal progress so a crashed or killed run can pick up where it stopped
+    # Every setting that changes detections; a resumed run only reuses output computed under them
+    checkpoint = JobCheckpoint("missing_person", {
+        "references": sorted(image_hash(f) for f in ref_filenames),
+        "reference_tta": config.REFERENCE_TTA,
+        "model": config.FACE_MODEL_WEIGHTS,
+        "frame_interval": frame_interval,
+        "threshold": detection_threshold,
+        "quality": config.FACE_QUALITY_GATE and (config.FACE_QUALITY_FLOOR, config.FACE_QUALITY_SIZE,
+                                                 config.FACE_QUALITY_SHARPNESS),
+        "decode": (config.FACE_DECODER, config.FACE_DECODE_WIDTH),
+        "roi": roi_signature(),
+    })
+    if config.RESULTS_DB:
+        # Detections go to the results database as they are found instead of a list of frames
+        results = ResultsDB().start_run(
+            "missing_person", {"threshold": detection_threshold, "frame_interval": frame_interval},
+            job_key=os.path.basename(checkpoint.path), resume=checkpoint.resumed, references=ref_filenames
+        )
+        restore_results(checkpoint, results, video_index)
+        all_detections = []
+    else:
+        results = None
+        all_detections = restore_detections(checkpoint)
+    for vf in video_files:
+        key = metadata[vf].content_hash
+        eta.update(vf, metadata[vf].frame_count if checkpoint.is_done(key) else checkpoint.resume_frame(key))
+    video_files = [vf for vf in video_files if not checkpoint.is_done(metadata[vf].content_hash)]
+
+    # One embedder for all videos, so faces from concurrent videos share ResNet batches
+    embedder = FaceEmbeddingServer(resnet, device) if config.EMBED_SERVER else None
+    quality_gate = FaceQualityGate(image_size=mtcnn.image_size) if config.FACE_QUALITY_GATE else None
+
     print("Starting video processing...")
     start_time = time.time()
-    all_detections = []
 
-    # Process videos concurrently using ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=min(len(video_files), os.cpu_count())) as executor:
+    # Process as many videos at once as the core budget allows; videos still queued are read ahead
+    with prefetching(video_files) as prefetcher, \
+            ThreadPoolExecutor(max_workers=governor.video_workers("faces", len(video_files), config.DETECT_WORKERS)) as executor:
         future_to_video = {
             executor.submit(
+                prefetched,
+                prefetcher,
                 process_video,
                 vf,
                 mtcnn,
@@ -235,18 +486,50 @@ def run_missing_person_detection():
                 ref_embeddings,
                 frame_interval,
                 batch_size,
-                detection_threshold
+                detection_threshold,
+                metadata=metadata[vf],
+                on_progress=lambda n, vf=vf: eta.update(vf, n),
+                attribute_store=attribute_store,
+                checkpoint=checkpoint,
+                embedding_store=embedding_store,
+                embedder=embedder,
+                quality_gate=quality_gate,
+                score_store=score_store,
+                results=results
             ): vf for vf in video_files
         }
         for future in as_completed(future_to_video):
+            vf = future_to_video[future]
             all_detections.extend(future.result())
+            eta.update(vf, metadata[vf].frame_count)
+            remaining = eta.eta_seconds()
+            print(f"Finished {os.path.basename(vf)} ({eta.fraction:.0%} done"
+                  + (f", ~{remaining:.0f}s remaining)" if remaining is not None else ")"))
+
+    if embedder is not None:
+        embedder.close()
+        print(f"Face embedder: {embedder.summary()}")
+    if quality_gate is not None:
+        print(quality_gate.summary())
+    print(f"Tensor pool: {tensor_pool.summary()}")
+    if attribute_store is not None:
+        attribute_store.flush()
+    if embedding_store is not None:
+        embedding_store.flush()
+    if score_store is not None:
+        score_store.flush()
+    checkpoint.close(completed=True)
+    if results is not None:
+        results.finish()
+        all_detections = results.sightings(order="similarity")
 
     processing_time = time.time() - start_time
     print(f"Processing completed in {processing_time:.2f}s")
 
     if all_detections:
-        # Sort detections by similarity (highest first)
-        all_detections.sort(key=lambda x: x['similarity'], reverse=True)
+        if results is None:
+            # Sort detections by similarity (highest first)
+            all_detections.sort(key=lambda x: x['similarity'], reverse=True)
         export_to_pdf(all_detections, ref_filenames=ref_filenames)
     else:
         print("No matches found.")
@@ -0,0 +1,151 @@
+import queue
+import threading
+
+### STAGED PIPELINE
+
+_END = object()  # Marks the end of a stage's input
+
+
+class PipelineStage:
+    """One step of a StagedPipeline: `fn` is applied to every item by `workers` threads"""
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+
+
+class StagedPipeline:
+    """
+    Run a source generator and a chain of stages on separate threads,
+    connected by bounded queues.
+      - Each stage has its own worker count.
+      - Full queues block the upstream stage (backpressure), so a slow model
+        never lets the decoder run ahead and fill memory.
+      - cancel(), or setting the caller's `stop_event`, stops every thread promptly.
+    Iterating over the pipeline yields the outputs of the last stage.
+    Stages may return None to drop an item.
+    """
+    def __init__(self, source, stages, queue_size=4, stop_event=None, name="pipeline"):
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.name = name
+        self.stop_event = stop_event
+        self._cancel = threading.Event()
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(len(self.stages) + 1)]
+        self._threads = []
+        self._error = None
+        self._error_lock = threading.Lock()
+        self._started = False
+
+    def _stopped(self):
+        return self._cancel.is_set() or (self.stop_event is not None and self.stop_event.is_set())
+
+    # Queue helpers that give up as soon as the pipeline is cancelled
+    def _put(self, q, item):
+        while not self._stopped():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stopped():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, exc):
+        with self._error_lock:
+            if self._error is None:
+                self._error = exc
+        self._cancel.set()
+
+    def _run_source(self):
+        try:
+            for item in self.source:
+                if not self._put(self._queues[0], item):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            close = getattr(self.source, "close", None)
+            if close is not None:
+                close()
+            self._put(self._queues[0], _END)
+
+    def _run_stage(self, index, stage, remaining):
+        in_q, out_q = self._queues[index], self._queues[index + 1]
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _END:
+                    # Let sibling workers of this stage see the end marker too
+                    self._put(in_q, _END)
+                    break
+                result = stage.fn(item)
+                if result is not None and not self._put(out_q, result):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            with remaining["lock"]:
+                remaining["count"] -= 1
+                last = remaining["count"] == 0
+            if last:
+                self._put(out_q, _END)
+
+    def start(self):
+        """Start the source and all stage workers"""
+        if self._started:
+            return self
+        self._started = True
+        self._threads.append(threading.Thread(
+            target=self._run_source, name=f"{self.name}-source", daemon=True
+        ))
+        for index, stage in enumerate(self.stages):
+            remaining = {"count": stage.workers, "lock": threading.Lock()}
+            for w in range(stage.workers):
+                self._threads.append(threading.Thread(
+                    target=self._run_stage, args=(index, stage, remaining),
+                    name=f"{self.name}-{stage.name}-{w}", daemon=True
+                ))
+        for t in self._threads:
+            t.start()
+        return self
+
+    def __iter__(self):
+        self.start()
+        out_q = self._queues[-1]
+        while True:
+            item = self._get(out_q)
+            if item is _END:
+                break
+            yield item
+        self.join()
+        if self._error is not None:
+            raise self._error
+
+    def cancel(self):
+        """Stop all stages; items still in flight are discarded"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._stopped() and self._error is None
+
+    def join(self, timeout=5.0):
+        for t in self._threads:
+            t.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cancel()
+        self.join()
+        return False
@@ -0,0 +1,201 @@
+import os, time, argparse, threading
+from contextlib import contextmanager
+
+from config import config
+
+### READ-AHEAD PREFETCHER
+
+class VideoPrefetcher:
+    """
+    Warms the page cache for the next videos of a work queue in a
+    background I/O thread, so a worker opening its next file finds the
+    first seconds already in memory instead of waiting on the NAS. Each
+    upcoming file gets a posix_fadvise(WILLNEED) hint, then its tail (where
+    an MP4 may keep its index) and head are read in chunks into one reused
+    buffer. At most `ahead` unopened files are warmed, and at most
+    `budget_mb` of read-ahead is outstanding; bytes count against the
+    budget until their file is opened, which workers report with opened().
+    """
+    def __init__(self, paths, ahead=None, budget_mb=None, chunk_mb=None):
+        self.ahead = config.PREFETCH_AHEAD if ahead is None else ahead
+        self.budget = int((config.PREFETCH_BUDGET_MB if budget_mb is None else budget_mb) * 2**20)
+        self.chunk = int((config.PREFETCH_CHUNK_MB if chunk_mb is None else chunk_mb) * 2**20)
+        self._queue = []         # Unopened paths, in the order workers will open them
+        self._files = {}         # path -> per-file read-ahead state
+        self._outstanding = 0    # Warmed bytes of unopened files
+        self._cond = threading.Condition()
+        self._closed = False
+        self.opened_early = 0    # Files opened before their read-ahead finished
+        for path in paths:
+            self._add(path)
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def _add(self, path):
+        path = os.path.abspath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if path not in self._files:
+            self._queue.append(path)
+            # Ranges still to read: the tail chunk first, then the head in order
+            tail = max(0, size - self.chunk)
+            ranges = [(tail, size), (0, tail)] if tail else [(0, size)]
+            self._files[path] = {"size": size, "ranges": ranges, "warmed": 0, "seconds": 0.0,
+                                 "hidden": 0.0, "opened": False}
+
+    def add(self, paths):
+        """Append paths to the end of the work queue"""
+        with self._cond:
+            for path in paths:
+                self._add(path)
+            self._cond.notify()
+
+    def _next(self):
+        """(path, offset, length) of the next chunk to read, or None while nothing is due"""
+        for path in self._queue[:self.ahead]:
+            state = self._files[path]
+            if not state["ranges"]:
+                continue
+            length = min(self.chunk, self.budget - self._outstanding)
+            if length <= 0:
+                return None
+            start, end = state["ranges"][0]
+            return path, start, min(length, end - start)
+        return None
+
+    def _run(self):
+        view = memoryview(bytearray(self.chunk))
+        files = {}
+        try:
+            while True:
+                with self._cond:
+                    for path in [p for p in files if not self._files[p]["ranges"]]:
+                        files.pop(path).close()  # Opened by its worker between chunks
+                    task = None
+                    while not self._closed and task is None:
+                        task = self._next()
+                        if task is None:
+                            self._cond.wait()
+                    if self._closed:
+                        return
+                path, offset, length = task
+                started = time.perf_counter()
+                try:
+                    if path not in files:
+                        files[path] = open(path, "rb", buffering=0)
+                        if hasattr(os, "posix_fadvise"):
+                            # Lets the kernel start its own readahead while the chunks below are read
+                            os.posix_fadvise(files[path].fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    files[path].seek(offset)
+                    n = files[path].readinto(view[:length]) or 0
+                except OSError as e:
+                    print(f"Prefetch of {path} stopped: {e}")
+                    n = 0
+                elapsed = time.perf_counter() - started
+                with self._cond:
+                    state = self._files[path]
+                    # Once the worker has opened the file, the chunk no longer counts as read ahead
+                    if not state["opened"]:
+                        state["seconds"] += elapsed
+                        state["warmed"] += n
+                        self._outstanding += n
+                        start, end = state["ranges"][0]
+                        if n <= 0 or offset + n >= end:
+                            state["ranges"].pop(0)
+                        else:
+                            state["ranges"][0] = (offset + n, end)
+                    if not state["ranges"] and path in files:
+                        files.pop(path).close()
+        finally:
+            for f in files.values():
+                f.close()
+
+    def opened(self, path):
+        """A worker is opening `path`: stop warming it and release its bytes from the budget"""
+        path = os.path.abspath(path)
+        with self._cond:
+            state = self._files.get(path)
+            if state is None or state["opened"]:
+                return
+            state["opened"] = True
+            state["hidden"] = state["seconds"]
+            if state["ranges"] and state["warmed"]:
+                self.opened_early += 1
+            state["ranges"] = []
+            self._outstanding -= state["warmed"]
+            if path in self._queue:
+                self._queue.remove(path)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def hidden_seconds(self):
+        """Read time spent ahead of the workers, i.e. I/O wait they no longer see"""
+        with self._cond:
+            return sum(state["hidden"] for state in self._files.values())
+
+    def summary(self):
+        with self._cond:
+            opened = [s for s in self._files.values() if s["opened"] and s["warmed"]]
+            warmed = sum(s["warmed"] for s in opened)
+            hidden = sum(s["hidden"] for s in opened)
+        rate = f" at {warmed / hidden / 2**20:.0f} MB/s" if hidden > 0 else ""
+        return (f"Prefetch: {warmed / 2**20:.0f} MB read ahead for {len(opened)} files{rate}, "
+                f"hiding ~{hidden:.1f}s of I/O wait ({self.opened_early} files opened before read-ahead finished)")
+
+
+@contextmanager
+def prefetching(paths):
+    """A VideoPrefetcher for `paths` (None with PREFETCH off), closed and summarized on exit"""
+    if not config.PREFETCH:
+        yield None
+        return
+    prefetcher = VideoPrefetcher(paths)
+    try:
+        yield prefetcher
+    finally:
+        prefetcher.close()
+        print(prefetcher.summary())
+
+def mark_opened(prefetcher, path):
+    """Tell `prefetcher` (or None) that a worker is opening `path`"""
+    if prefetcher is not None:
+        prefetcher.opened(path)
+
+def prefetched(prefetcher, fn, path, *args, **kwargs):
+    """fn(path, *args, **kwargs) for an executor, marking `path` opened when a worker picks it up"""
+    mark_opened(prefetcher, path)
+    return fn(path, *args, **kwargs)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time opening a sequence of videos with and without read-ahead")
+    parser.add_argument("videos", nargs="+", help="Uncached files, e.g. on the NAS (drop the page cache between runs)")
+    parser.add_argument("--ahead", type=int)
+    parser.add_argument("--budget-mb", type=float)
+    parser.add_argument("--process-seconds", type=float, default=2.0, help="Simulated processing time per video")
+    parser.add_argument("--off", action="store_true", help="Baseline without the prefetcher")
+    args = parser.parse_args()
+
+    import cv2
+    prefetcher = None if args.off else VideoPrefetcher(args.videos, args.ahead, args.budget_mb)
+    waits = []
+    for path in args.videos:
+        mark_opened(prefetcher, path)
+        started = time.perf_counter()
+        cap = cv2.VideoCapture(path)
+        for _ in range(30):
+            cap.grab()
+        cap.release()
+        waits.append(time.perf_counter() - started)
+        print(f"{os.path.basename(path)}: open and first 30 frames in {waits[-1] * 1000:.0f} ms")
+        time.sleep(args.process_seconds)  # Stands in for processing the video
+    print(f"Total time to first frames: {sum(waits):.2f}s")
+    if prefetcher is not None:
+        prefetcher.close()
+        print(prefetcher.summary())
@@ -0,0 +1,371 @@
+import os, json, time, socket, argparse, threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import cv2
+
+from config import config
+from video_index import VideoIndex, camera_name
+from decoders import read_frame_at
+from results_db import ResultsDB
+from resources import governor
+from prefetch import prefetching, mark_opened
+from query_service import parse_time
+
+### PRIORITY SEARCH
+
+# A stretch of one video, searched as one unit of work
+Segment = namedtuple("Segment", "video camera start_frame end_frame start_time end_time")
+
+PRIORITIES = ("recent", "cameras", "around")
+
+
+def plan_segments(video_files, priority="recent", cameras=None, around=None, segment_seconds=None, video_index=None):
+    """
+    Split videos into segments of `segment_seconds` and order them by priority:
+      - "recent": newest footage first,
+      - "cameras": in the order of `cameras` (e.g. nearest to the last
+        known location first), newest first within a camera; other
+        cameras follow,
+      - "around": closest in time to `around` (epoch seconds, e.g. the
+        last confirmed sighting) first.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {PRIORITIES}")
+    if priority == "around" and around is None:
+        raise ValueError('priority "around" needs a time')
+    video_index = video_index or VideoIndex()
+    segment_seconds = segment_seconds or config.PRIORITY_SEGMENT_SECONDS
+    rank = {camera: i for i, camera in enumerate(cameras or [])}
+    segments = []
+    for video in video_files:
+        meta = video_index.get(video)
+        step = max(1, int(round(segment_seconds * meta.fps))) if meta.fps else meta.frame_count or 1
+        for start in range(0, max(meta.frame_count, 1), step):
+            end = min(start + step, meta.frame_count) if meta.frame_count else None
+            segments.append(Segment(
+                video, camera_name(video), start, end,
+                meta.start_time + start / (meta.fps or 1.0), meta.start_time + (end or start) / (meta.fps or 1.0)
+            ))
+
+    if priority == "recent":
+        key = lambda seg: -seg.end_time
+    elif priority == "cameras":
+        key = lambda seg: (rank.get(seg.camera, len(rank)), -seg.end_time)
+    else:
+        # Distance of the segment's time span from `around`; zero if it contains it
+        key = lambda seg: max(seg.start_time - around, around - seg.end_time, 0.0)
+    return sorted(segments, key=key)
+
+
+class SightingConfirmer:
+    """
+    Turns raw face matches into confirmed sightings. A sighting is
+    confirmed once `frames` sampled frames of the same video match within
+    `window` seconds of each other; further matches within `window` of a
+    confirmed sighting belong to it and are not reported again. Batches
+    may arrive out of order, so matches are kept sorted by time.
+    Pending matches more than two windows (one window of slack for late
+    batches) behind the newest match of their video are dropped, and only
+    the best pending match of each video keeps a copy of its frame, so
+    memory stays bounded on long footage.
+    """
+    def __init__(self, frames=None, window=None):
+        self.frames = config.PRIORITY_CONFIRM_FRAMES if frames is None else frames
+        self.window = config.PRIORITY_CONFIRM_WINDOW if window is None else window
+        self._matches = {}     # video -> [(time, detection)], detections without frames except the best
+        self._best = {}        # video -> pending detection holding the frame copy
+        self._latest = {}      # video -> time of the newest match
+        self._confirmed = {}   # video -> [(first, last) times of confirmed sightings]
+        self._lock = threading.Lock()
+
+    def _drop(self, video, matches, keep):
+        """Keep only the pending `matches` for which keep(match) is true"""
+        kept = [m for m in matches if keep(m)]
+        best = self._best.get(video)
+        if best is not None and not any(m[1] is best for m in kept):
+            del self._best[video]
+        self._matches[video] = kept
+        return kept
+
+    def push(self, video, detection):
+        """
+        Add a matched detection; returns the newly confirmed sighting's
+        detections, or None. Their 'frame_img' is only set on the one that
+        was the best pending match; the frame is a copy, so it stays valid
+        after the decoder reuses its buffers.
+        """
+        t = detection['time']
+        with self._lock:
+            latest = self._latest[video] = max(self._latest.get(video, t), t)
+            spans = self._confirmed.setdefault(video, [])
+            for i, (first, last) in enumerate(spans):
+                if first - self.window <= t <= last + self.window:
+                    spans[i] = (min(first, t), max(last, t))
+                    return None
+            matches = self._matches.setdefault(video, [])
+            horizon = latest - 2 * self.window
+            if matches and matches[0][0] < horizon:
+                matches = self._drop(video, matches, lambda m: m[0] >= horizon)
+
+            entry = {k: v for k, v in detection.items() if k != 'frame_img'}
+            best = self._best.get(video)
+            if detection.get('frame_img') is not None and (best is None or entry['similarity'] > best['similarity']):
+                if best is not None:
+                    best.pop('frame_img', None)
+                entry['frame_img'] = detection['frame_img'].copy()
+                self._best[video] = entry
+            matches.append((t, entry))
+            matches.sort(key=lambda m: m[0])
+            # Distinct frames within one window around this match
+            near = [m for m in matches if abs(m[0] - t) <= self.window]
+            if len({m[1]['frame_idx'] for m in near}) < self.frames:
+                return None
+            spans.append((near[0][0], near[-1][0]))
+            used = {id(m[1]) for m in near}
+            self._drop(video, matches, lambda m: id(m[1]) not in used)
+            return [m[1] for m in near]
+
+
+class JsonLinesSink:
+    """Appends each sighting to a JSON-lines file, flushed to disk immediately"""
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def __call__(self, sighting):
+        with self._lock:
+            self._file.write(json.dumps(sighting) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class SocketSink:
+    """Sends each sighting as a JSON line over TCP, reconnecting once if the connection dropped"""
+    def __init__(self, host, port, timeout=5.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def __call__(self, sighting):
+        line = (json.dumps(sighting) + "\n").encode()
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+                    self._sock.sendall(line)
+                    return
+                except OSError as e:
+                    self.close()
+                    if attempt:
+                        print(f"Could not send sighting to {self.address[0]}:{self.address[1]}: {e}")
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def print_sighting(sighting):
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sighting["timestamp"]))
+    print(f"[SIGHTING +{sighting['elapsed_s']:.1f}s] {sighting['camera']}: {sighting['video_filename']} "
+          f"at {sighting['time']:.1f}s ({when}), similarity {sighting['similarity']:.2f} "
+          f"over {sighting['frames']} frames" + (f", snapshot {sighting['snapshot']}" if sighting.get("snapshot") else ""))
+
+def open_sink(spec):
+    """A sighting sink from "-" (print), "tcp://host:port" or a JSON-lines file path"""
+    if spec == "-":
+        return print_sighting
+    if spec.startswith("tcp://"):
+        host, port = spec[len("tcp://"):].rsplit(":", 1)
+        return SocketSink(host, int(port))
+    return JsonLinesSink(spec)
+
+
+class PrioritySearch:
+    """
+    Urgent search for a missing person: segments are searched in priority
+    order, each confirmed sighting is emitted to every sink as soon as it
+    is confirmed (with a snapshot of the best frame), and with
+    `stop_after` the search ends once that many confirmed sightings reach
+    `high_confidence` similarity. Time to first hit is measured from start.
+    """
+    def __init__(self, mtcnn, resnet, device, ref_embeddings, ref_filenames=None, sinks=(), threshold=None,
+                 stop_after=None, high_confidence=None, snapshot_dir=None, embedder=None, quality_gate=None):
+        self.mtcnn, self.resnet, self.device = mtcnn, resnet, device
+        self.ref_embeddings = ref_embeddings
+        self.ref_filenames = [os.path.basename(f) for f in ref_filenames] if ref_filenames else None
+        self.sinks = list(sinks) or [print_sighting]
+        self.threshold = config.FACE_THRESH if threshold is None else threshold
+        self.stop_after = stop_after
+        self.high_confidence = config.PRIORITY_HIGH_CONFIDENCE if high_confidence is None else high_confidence
+        self.snapshot_dir = snapshot_dir or os.path.join(config.OUTPUT_DIR, "priority")
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self.embedder = embedder
+        self.quality_gate = quality_gate
+        self.confirmer = SightingConfirmer()
+        self.stop_event = threading.Event()
+        self._metadata = {}
+        self.sightings = []
+        self.started = None
+        self.first_match_s = None    # Seconds from start to the first raw match
+        self.first_hit_s = None      # Seconds from start to the first confirmed sighting
+        self.frames_before_hit = None
+        self._frames_done = 0
+        self._lock = threading.Lock()
+
+    def _snapshot(self, det):
+        """Save the detection's frame with its box; re-read from the video if the confirmer kept no copy"""
+        frame = det.get('frame_img')
+        if frame is None:
+            frame = read_frame_at(det['video'], det['frame_idx'], config.FACE_DECODE_WIDTH)
+            if frame is None:
+                return None
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        x1, y1, x2, y2 = det['box']
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        stem = os.path.splitext(det['video_filename'])[0]
+        path = os.path.join(self.snapshot_dir, f"{camera_name(det['video'])}_{stem}_{det['frame_idx']}.jpg")
+        cv2.imwrite(path, frame)
+        return path
+
+    def _on_detections(self, segment, batch_info, detections):
+        elapsed = time.monotonic() - self.started
+        with self._lock:
+            self._frames_done += len(batch_info)
+            if detections and self.first_match_s is None:
+                self.first_match_s = elapsed
+        for det in detections:
+            det['video'] = segment.video
+            confirmed = self.confirmer.push(segment.video, det)
+            if confirmed is None:
+                continue
+            best = max(confirmed, key=lambda d: d['similarity'])
+            ref = best.get('reference')
+            sighting = {
+                "type": "missing_person",
+                "camera": segment.camera,
+                "video": os.path.abspath(segment.video),
+                "video_filename": best['video_filename'],
+                "frame_idx": best['frame_idx'],
+                "time": best['time'],
+                "timestamp": self._metadata[segment.video].start_time + best['time'],
+                "similarity": best['similarity'],
+                "box": list(best['box']),
+                "reference": self.ref_filenames[ref] if self.ref_filenames and ref is not None else ref,
+                "frames": len(confirmed),
+                "snapshot": self._snapshot(best),
+                "elapsed_s": elapsed,
+                "wall_time": time.time(),
+            }
+            with self._lock:
+                self.sightings.append(sighting)
+                if self.first_hit_s is None:
+                    self.first_hit_s = elapsed
+                    self.frames_before_hit = self._frames_done
+                strong = sum(1 for s in self.sightings if s["similarity"] >= self.high_confidence)
+            for sink in self.sinks:
+                sink(sighting)
+            if self.stop_after and strong >= self.stop_after:
+                print(f"{strong} high-confidence sightings confirmed; stopping the search")
+                self.stop_event.set()
+
+    def _search(self, segment, results, prefetcher=None):
+        from missing_person_detection import process_video
+
+        if self.stop_event.is_set():
+            return
+        mark_opened(prefetcher, segment.video)
+        process_video(
+            segment.video, self.mtcnn, self.resnet, self.device, self.ref_embeddings,
+            config.PRIORITY_FRAME_INTERVAL, config.BATCH_SIZE, self.threshold, stop_event=self.stop_event,
+            metadata=self._metadata[segment.video], preview=False, embedder=self.embedder,
+            quality_gate=self.quality_gate, results=results, start_frame=segment.start_frame,
+            end_frame=segment.end_frame, on_detections=lambda b, d: self._on_detections(segment, b, d)
+        )
+
+    def run(self, segments):
+        """Search `segments` in order; returns the confirmed sightings"""
+        video_index = VideoIndex()
+        self._metadata = {seg.video: video_index.get(seg.video) for seg in segments}
+        self.started = time.monotonic()
+        results = None
+        if config.RESULTS_DB:
+            results = ResultsDB().start_run("priority", {"threshold": self.threshold, "stop_after": self.stop_after},
+                                            references=self.ref_filenames)
+        # The executor takes segments in submission order, so the first workers get the top priorities
+        workers = governor.video_workers("faces", len(segments), config.DETECT_WORKERS)
+        videos = list(self._metadata)
+        with prefetching(videos) as prefetcher, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._search, seg, results, prefetcher) for seg in segments]
+            for future in as_completed(futures):
+                future.result()
+        if results is not None:
+            results.finish()
+        print(self.summary(len(segments)))
+        return self.sightings
+
+    def summary(self, segments=None):
+        elapsed = time.monotonic() - self.started
+        first_hit = (f"first confirmed sighting after {self.first_hit_s:.1f}s ({self.frames_before_hit} frames searched)"
+                     if self.first_hit_s is not None else "no confirmed sighting")
+        first_match = f", first raw match after {self.first_match_s:.1f}s" if self.first_match_s is not None else ""
+        stopped = " (stopped early)" if self.stop_event.is_set() else ""
+        return (f"Priority search: {len(self.sightings)} sightings in {elapsed:.1f}s{stopped}, "
+                f"{first_hit}{first_match}, {self._frames_done} frames searched"
+                + (f" across {segments} segments" if segments else ""))
+
+
+def run_priority_search(video_files, reference_files=None, priority="recent", cameras=None, around=None,
+                        stop_after=None, sinks=("-",)):
+    """
+    Search `video_files` by priority for the person in `reference_files`
+    (selected in a dialog if not given), emitting sightings as they are confirmed
+    """
+    from missing_person_detection import setup_missing_person_detection, load_reference_images
+    from reference_gallery import ReferenceGallery
+    from inference_server import FaceEmbeddingServer
+    from face_quality import FaceQualityGate
+
+    device, mtcnn, resnet = setup_missing_person_detection()
+    if reference_files:
+        gallery = ReferenceGallery(mtcnn, resnet, device).load(reference_files)
+        if not len(gallery):
+            raise SystemExit("No valid faces detected in the reference images.")
+        ref_embeddings, ref_filenames = gallery.templates, gallery.filenames
+    else:
+        ref_embeddings, ref_filenames = load_reference_images(device, mtcnn, resnet)
+    segments = plan_segments(video_files, priority, cameras, around)
+    print(f"Searching {len(video_files)} videos in {len(segments)} segments, {priority} first")
+    embedder = FaceEmbeddingServer(resnet, device) if config.EMBED_SERVER else None
+    quality_gate = FaceQualityGate(image_size=mtcnn.image_size) if config.FACE_QUALITY_GATE else None
+    opened = [open_sink(spec) for spec in sinks]
+    try:
+        search = PrioritySearch(mtcnn, resnet, device, ref_embeddings, ref_filenames, opened, stop_after=stop_after,
+                                embedder=embedder, quality_gate=quality_gate)
+        return search.run(segments)
+    finally:
+        if embedder is not None:
+            embedder.close()
+        for sink in opened:
+            if hasattr(sink, "close"):
+                sink.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Urgent missing-person search: most promising footage first, sightings streamed as found")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--references", nargs="+", required=True, help="Reference images of the missing person")
+    parser.add_argument("--priority", choices=PRIORITIES, default="recent")
+    parser.add_argument("--cameras", nargs="*", help='Camera order for --priority cameras, e.g. nearest first')
+    parser.add_argument("--around", help='Time for --priority around (epoch or "YYYY-MM-DD HH:MM")')
+    parser.add_argument("--stop-after", type=int, help="Stop after this many high-confidence sightings")
+    parser.add_argument("--emit", nargs="*", default=["-"],
+                        help='Where to send sightings: "-" (print), a JSON-lines file or tcp://host:port')
+    args = parser.parse_args()
+    run_priority_search(args.videos, args.references, args.priority, args.cameras,
+                        args.around and parse_time(args.around), args.stop_after, args.emit)
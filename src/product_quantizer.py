@@ -0,0 +1,112 @@
+import os
+import numpy as np
+
+### PRODUCT QUANTIZATION
+
+class ProductQuantizer:
+    """
+    Compresses D-dimensional embeddings to `subspaces` one-byte codes.
+    Each vector is split into equal sub-vectors and every sub-vector is
+    replaced by the index of its nearest centroid in that subspace's
+    codebook (k-means, 256 centroids). Inner products with a query are then
+    approximated by asymmetric distance computation (ADC): the exact query
+    is compared with every centroid once, and each stored code costs only
+    `subspaces` table lookups.
+    """
+    def __init__(self, dim=512, subspaces=64, centroids=256):
+        if dim % subspaces:
+            raise ValueError(f"dim {dim} is not divisible into {subspaces} subspaces")
+        if centroids > 256:
+            raise ValueError("codes are stored in one byte, so at most 256 centroids per subspace")
+        self.dim = dim
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.sub_dim = dim // subspaces
+        self.codebooks = None   # (M, K, D/M) float32
+
+    def _split(self, x):
+        return np.asarray(x, dtype=np.float32).reshape(len(x), self.subspaces, self.sub_dim)
+
+    def fit(self, x, iterations=20, seed=0):
+        """Train one k-means codebook per subspace on a (N,D) sample"""
+        x = self._split(x)
+        if len(x) < self.centroids:
+            raise ValueError(f"need at least {self.centroids} vectors to train, got {len(x)}")
+        rng = np.random.default_rng(seed)
+        self.codebooks = np.empty((self.subspaces, self.centroids, self.sub_dim), dtype=np.float32)
+        for m in range(self.subspaces):
+            sub = x[:, m]
+            centers = sub[rng.choice(len(sub), self.centroids, replace=False)].copy()
+            for _ in range(iterations):
+                assign = self._nearest(sub, centers)
+                counts = np.bincount(assign, minlength=self.centroids)
+                sums = np.stack([np.bincount(assign, weights=sub[:, d], minlength=self.centroids)
+                                 for d in range(self.sub_dim)], axis=1)
+                empty = counts == 0
+                centers[~empty] = sums[~empty] / counts[~empty, None]
+                # Re-seed empty clusters from random points so every code stays in use
+                centers[empty] = sub[rng.choice(len(sub), int(empty.sum()), replace=False)]
+            self.codebooks[m] = centers
+        return self
+
+    @staticmethod
+    def _nearest(sub, centers):
+        distances = (centers ** 2).sum(axis=1) - 2 * sub @ centers.T
+        return distances.argmin(axis=1)
+
+    def encode(self, x, chunk=65536):
+        """(N,D) vectors -> (N,M) uint8 codes"""
+        codes = np.empty((len(x), self.subspaces), dtype=np.uint8)
+        for start in range(0, len(x), chunk):
+            sub = self._split(x[start:start + chunk])
+            for m in range(self.subspaces):
+                codes[start:start + len(sub), m] = self._nearest(sub[:, m], self.codebooks[m])
+        return codes
+
+    def tables(self, queries):
+        """(Q,M,K) inner products between each query's sub-vectors and every centroid"""
+        return np.einsum("qmd,mkd->qmk", self._split(queries), self.codebooks)
+
+    def scores(self, codes_t, tables):
+        """
+        Approximate inner products (N,Q) of subspace-major (M,N) codes with
+        the queries behind `tables`; one contiguous lookup per subspace.
+        """
+        out = np.empty((codes_t.shape[1], len(tables)), dtype=np.float32)
+        acc = np.empty(codes_t.shape[1], dtype=np.float32)
+        for q, table in enumerate(tables):
+            acc.fill(0)
+            for m in range(self.subspaces):
+                acc += table[m].take(codes_t[m])
+            out[:, q] = acc
+        return out
+
+    def save(self, path):
+        """
+        Publish the codebooks at `path` unless another process already did;
+        returns False in that case, and the caller should load() theirs so
+        that every code is built against the same codebooks.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, self.codebooks)
+        try:
+            os.link(tmp_path, path)  # Atomic, and fails if the file exists
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path):
+        codebooks = np.load(path)
+        pq = cls(codebooks.shape[0] * codebooks.shape[2], codebooks.shape[0], codebooks.shape[1])
+        pq.codebooks = codebooks
+        return pq
+
+
+def save_codes(path, codes):
+    """Write a codes array atomically"""
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, codes)
+    os.replace(tmp_path, path)
@@ -0,0 +1,185 @@
+import io, json, time, argparse, threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from config import config
+from embedding_index import EmbeddingIndex
+from attribute_index import AttributeStore, COLOR_BINS
+from results_db import ResultsDB
+
+### LOCAL QUERY SERVICE
+
+def parse_time(value):
+    """Epoch seconds or "YYYY-MM-DD HH:MM[:SS]" / ISO 8601 local time"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class QueryService:
+    """
+    Keeps the face-embedding index and attribute store resident in memory
+    and answers queries against them and the results database. New data
+    written by pipeline runs or the watch-folder daemon is picked up
+    automatically.
+    Query images are embedded with the same MTCNN + InceptionResnetV1 path
+    as reference photos.
+    """
+    def __init__(self, refresh_interval=2.0):
+        from missing_person_detection import setup_missing_person_detection
+        from reference_gallery import ReferenceGallery
+
+        self.device, mtcnn, resnet = setup_missing_person_detection()
+        self.gallery = ReferenceGallery(mtcnn, resnet, self.device)
+        self.embeddings = EmbeddingIndex()
+        self.results = ResultsDB()
+        self.attributes = AttributeStore()
+        self.refresh_interval = refresh_interval
+        self._last_refresh = time.monotonic()
+        self._refresh_lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        print(f"Loaded {len(self.embeddings)} face embeddings, "
+              f"{len(self.results.sightings())} sightings, {len(self.results.violence_events())} violence events")
+
+    def maybe_refresh(self):
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        # Only one request thread refreshes; the others keep using the current snapshot
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_refresh = time.monotonic()
+            self.embeddings.refresh()
+            self.attributes.reload()
+        finally:
+            self._refresh_lock.release()
+
+    def search_image(self, image_bytes, k=20, threshold=None, camera=None, start=None, end=None):
+        """Returns (results, embed_ms, search_ms); results is None if the image has no face"""
+        started = time.perf_counter()
+        with self._model_lock:
+            query = self.gallery.embed_image(io.BytesIO(image_bytes))
+        embedded = time.perf_counter()
+        if query is None:
+            return None, (embedded - started) * 1000, 0.0
+        results = self.embeddings.search(query, k, threshold, camera, start, end)
+        return results, (embedded - started) * 1000, (time.perf_counter() - embedded) * 1000
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health
+    GET  /detections?type=sighting|violence&camera=&start=&end=&run=&reference=&min_score=&order=&limit=&offset=
+    GET  /attributes?color=&region=&camera=&start=&end=&min_fraction=&limit=
+    POST /search?k=&threshold=&camera=&start=&end=   (body: JPEG/PNG image)
+    """
+    service = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self):
+        return {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+
+    def _filters(self, params):
+        return params.get("camera"), parse_time(params.get("start")), parse_time(params.get("end"))
+
+    def do_GET(self):
+        started = time.perf_counter()
+        route = urlparse(self.path).path
+        params = self._params()
+        self.service.maybe_refresh()
+        try:
+            camera, start, end = self._filters(params)
+            if route == "/health":
+                payload = {
+                    "embeddings": len(self.service.embeddings),
+                    "detections": {"sighting": len(self.service.results.sightings()),
+                                   "violence": len(self.service.results.violence_events())},
+                }
+            elif route == "/detections":
+                run = int(params["run"]) if params.get("run") else None
+                min_score = float(params["min_score"]) if params.get("min_score") else None
+                order = params.get("order", "timestamp")
+                if params.get("type", "sighting") == "sighting":
+                    results = self.service.results.sightings(run, camera, start, end, reference=params.get("reference"),
+                                                             min_similarity=min_score, order=order)
+                else:
+                    results = self.service.results.violence_events(run, camera, start, end,
+                                                                   min_probability=min_score, order=order)
+                payload = {"total": len(results),
+                           "results": results.page(int(params.get("offset", 0)), int(params.get("limit", 100)))}
+            elif route == "/attributes":
+                if params.get("color") not in COLOR_BINS:
+                    return self._send(400, {"error": f"color must be one of {sorted(COLOR_BINS)}"})
+                results = self.service.attributes.query(
+                    params["color"], params.get("region", "upper"), camera, start, end,
+                    float(params.get("min_fraction", 0.3)), int(params.get("limit", 100))
+                )
+                payload = {"results": results}
+            else:
+                return self._send(404, {"error": "not found"})
+        except (ValueError, KeyError) as e:
+            return self._send(400, {"error": str(e)})
+        payload["query_ms"] = (time.perf_counter() - started) * 1000
+        self._send(200, payload)
+
+    def do_POST(self):
+        started = time.perf_counter()
+        if urlparse(self.path).path != "/search":
+            return self._send(404, {"error": "not found"})
+        params = self._params()
+        self.service.maybe_refresh()
+        try:
+            camera, start, end = self._filters(params)
+            length = int(self.headers.get("Content-Length", 0))
+            if not length:
+                return self._send(400, {"error": "POST an image as the request body"})
+            threshold = params.get("threshold")
+            results, embed_ms, search_ms = self.service.search_image(
+                self.rfile.read(length), int(params.get("k", 20)),
+                float(threshold) if threshold is not None else None, camera, start, end
+            )
+        except (ValueError, OSError) as e:
+            return self._send(400, {"error": str(e)})
+        if results is None:
+            return self._send(422, {"error": "no face found in the query image"})
+        self._send(200, {
+            "results": results,
+            "embed_ms": embed_ms,
+            "search_ms": search_ms,
+            "query_ms": (time.perf_counter() - started) * 1000,
+        })
+
+    def log_message(self, format, *args):
+        pass  # Keep the console for service messages
+
+
+def serve(host=None, port=None):
+    """Run the query service until interrupted"""
+    QueryHandler.service = QueryService()
+    server = ThreadingHTTPServer((host or config.QUERY_HOST, port or config.QUERY_PORT), QueryHandler)
+    server.daemon_threads = True
+    print(f"Query service listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve similarity and detection queries over the local indexes")
+    parser.add_argument("--host", default=config.QUERY_HOST)
+    parser.add_argument("--port", type=int, default=config.QUERY_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -0,0 +1,136 @@
+import os, hashlib
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from config import config
+
+### REFERENCE GALLERY
+
+def image_hash(path):
+    """SHA-256 of an image file's bytes"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def select_reference_face(boxes, probs, min_prob=0.9):
+    """
+    Pick the face to use from a reference photo: the largest confident face,
+    falling back to the most confident one. Bystanders in the background are
+    usually smaller than the subject of a reference photo.
+    """
+    probs = np.array([p if p is not None else 0.0 for p in probs], dtype=np.float32)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    confident = probs >= min_prob
+    if confident.any():
+        return int(np.argmax(np.where(confident, areas, -1)))
+    return int(np.argmax(probs))
+
+def augment_faces(faces, tta=False):
+    """Return the test-time augmented views of a (N,3,H,W) face batch: original, flip, centre crop"""
+    if not tta:
+        return [faces]
+    size = faces.shape[-1]
+    margin = size // 10
+    crop = faces[:, :, margin:size - margin, margin:size - margin]
+    crop = F.interpolate(crop, size=(size, size), mode="bilinear", align_corners=False)
+    return [faces, torch.flip(faces, dims=[3]), crop]
+
+def as_templates(ref_embeddings):
+    """Accept a list of (1,D) embeddings or a (N,D) tensor and return L2-normalized (N,D) templates"""
+    if isinstance(ref_embeddings, (list, tuple)):
+        ref_embeddings = torch.cat([e.reshape(1, -1) for e in ref_embeddings], dim=0)
+    return F.normalize(ref_embeddings.float(), dim=1).to(ref_embeddings.dtype)
+
+
+class ReferenceGallery:
+    """
+    Embeddings of the missing person's reference photos.
+      - All reference faces are embedded in one batched ResNet pass,
+        optionally with flip / crop test-time augmentation.
+      - Embeddings are cached on disk keyed by image content hash, model
+        weights and augmentation setting, so re-running a case is free.
+      - `templates` holds the L2-normalized (N,512) matrix used for matching.
+    """
+    def __init__(self, mtcnn, resnet, device, tta=None, cache_dir=None, model_version=None):
+        self.mtcnn = mtcnn
+        self.resnet = resnet
+        self.device = device
+        self.tta = config.REFERENCE_TTA if tta is None else tta
+        self.cache_dir = cache_dir or os.path.join(config.INDEX_DIR, "reference_cache")
+        self.model_version = model_version or f"InceptionResnetV1-{config.FACE_MODEL_WEIGHTS}"
+        self.filenames = []
+        self.templates = None
+
+    def _cache_path(self, digest):
+        key = hashlib.sha256(f"{digest}:{self.model_version}:tta={self.tta}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _crop_face(self, image):
+        """Detect faces in a reference image (path, file object or PIL image) and return the chosen (3,160,160) crop, or None"""
+        ref_img = (image if isinstance(image, Image.Image) else Image.open(image)).convert("RGB")
+        boxes, probs = self.mtcnn.detect(ref_img)
+        if boxes is None or len(boxes) == 0:
+            return None
+        best = select_reference_face(boxes, probs)
+        faces = self.mtcnn.extract(ref_img, boxes[[best]], None)
+        return faces[0] if faces.ndim == 4 else faces
+
+    def _embed(self, faces):
+        """Embed (N,3,160,160) crops and all their augmentations in one forward pass"""
+        views = augment_faces(faces, self.tta)
+        batch = torch.cat(views, dim=0).to(self.device)
+        if self.device.type == 'cuda':
+            batch = batch.half()
+        with torch.no_grad():
+            emb = self.resnet(batch).float()
+        emb = F.normalize(emb, dim=1).reshape(len(views), len(faces), -1).mean(dim=0)
+        return F.normalize(emb, dim=1).cpu().numpy()
+
+    def load(self, filenames):
+        """Build the gallery from reference image files; images without a face are skipped"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        embeddings = {}
+        pending, pending_faces = [], []
+        cached = 0
+
+        for filename in filenames:
+            cache_path = self._cache_path(image_hash(filename))
+            if os.path.exists(cache_path):
+                embeddings[filename] = np.load(cache_path)
+                cached += 1
+                continue
+            face = self._crop_face(filename)
+            if face is None:
+                print(f"No face detected in reference image {os.path.basename(filename)}")
+                continue
+            pending.append((filename, cache_path))
+            pending_faces.append(face)
+
+        if pending_faces:
+            new_embeddings = self._embed(torch.stack(pending_faces))
+            for (filename, cache_path), emb in zip(pending, new_embeddings):
+                np.save(cache_path, emb)
+                embeddings[filename] = emb
+
+        print(f"Reference gallery: {cached} faces from cache, {len(pending)} embedded")
+
+        self.filenames = [f for f in filenames if f in embeddings]
+        if not self.filenames:
+            return self
+        templates = torch.from_numpy(np.stack([embeddings[f] for f in self.filenames])).to(self.device)
+        self.templates = templates.half() if self.device.type == 'cuda' else templates
+        return self
+
+    def embed_image(self, image):
+        """Embed the main face of one image (path, file object or PIL image) without caching; returns (D,) or None"""
+        face = self._crop_face(image)
+        if face is None:
+            return None
+        return self._embed(face.unsqueeze(0))[0]
+
+    def __len__(self):
+        return len(self.filenames)
@@ -5,13 +5,33 @@ import platform
 import subprocess
 import matplotlib.pyplot as plt
 from config import config
+from decoders import read_frame_at
+
+def _frame_of(det, key, frame_key, size=None):
+    """
+    The frame image of a detection; results loaded from the results database
+    carry no frames, so theirs is re-read from the video when the report needs it
+    """
+    if det.get(key) is None:
+        det[key] = read_frame_at(det['video'], det[frame_key], size)
+    return det[key]
+
+def _with_frames(detections, key, frame_key, size=None):
+    """The detections whose frame can be loaded; those of moved or unreadable videos are skipped"""
+    for det in detections:
+        if _frame_of(det, key, frame_key, size) is None:
+            print(f"Skipping detection at {det['time']:.2f}s of {det.get('video', det.get('video_filename'))}: frame unreadable")
+            continue
+        yield det
 
 # Missing Person Detection PDF Report
-def export_to_pdf(detections, pdf_filename="Output/detections.pdf", ref_filenames=None):
+def export_to_pdf(detections, pdf_filename="Output/detections.pdf", ref_filenames=None, open_viewer=True):
     """
     Export detection detections to a PDF report with improved formatting.
     Each detection includes the video filename, detection time, similarity score,
     and an image preview with bounding box and dominant color.
+    `detections` may be a results_db.ResultSet; frames are then re-read one
+    detection at a time instead of being held for the whole report.
     """
     # Create PDF with appropriate settings
     pdf = FPDF()
@@ -157,7 +177,7 @@ def export_to_pdf(detections, pdf_filename="Output/detections.pdf", ref_filename
     images_per_page = 4  # Reduced from 6 to allow more space
     current_image = 0
 
-    for idx, det in enumerate(detections):
+    for idx, det in enumerate(_with_frames(detections, 'frame_img', 'frame_idx', config.FACE_DECODE_WIDTH)):
         # Start a new page for first image or when page is full
         if current_image == 0:
             pdf.add_page()
@@ -242,6 +262,8 @@ def export_to_pdf(detections, pdf_filename="Output/detections.pdf", ref_filename
     # Save the PDF
     pdf.output(pdf_filename)
     print(f"PDF saved as {pdf_filename}")
+    if not open_viewer:
+        return
     # Open the PDF with the default PDF viewer
     try:
         import platform
@@ -256,7 +278,7 @@ def export_to_pdf(detections, pdf_filename="Output/detections.pdf", ref_filename
         print("Could not open PDF automatically. Please open it manually.")
 
 # Violence Detection PDF Report  
-def export_violence_report(detections, video_filename, pdf_filename="Output/violence_detections.pdf"):
+def export_violence_report(detections, video_filename, pdf_filename="Output/violence_detections.pdf", open_viewer=True):
     """Create a PDF report for violence detections with improved formatting"""
     if not detections:
         print(f"No violence detected in {video_filename}")
@@ -286,7 +308,7 @@ def export_violence_report(detections, video_filename, pdf_filename="Output/viol
     pdf.ln(10)
 
     # Add each detection with proper spacing
-    for idx, det in enumerate(detections):
+    for idx, det in enumerate(_with_frames(detections, 'thumbnail', 'peak_frame')):
         # Create a new page for each detection except the first one
         if idx > 0:
             pdf.add_page()
@@ -318,7 +340,10 @@ def export_violence_report(detections, video_filename, pdf_filename="Output/viol
         pdf.set_font("Arial", "B", size=11)
         pdf.cell(40, 8, "Time:", 1, 0)
         pdf.set_font("Arial", size=11)
-        pdf.cell(0, 8, f"{det['time']:.2f} seconds", 1, 1)
+        if 'end_time' in det:
+            pdf.cell(0, 8, f"{det['time']:.2f} - {det['end_time']:.2f} seconds", 1, 1)
+        else:
+            pdf.cell(0, 8, f"{det['time']:.2f} seconds", 1, 1)
 
         pdf.set_font("Arial", "B", size=11)
         pdf.cell(40, 8, "Probability:", 1, 0)
@@ -359,6 +384,8 @@ def export_violence_report(detections, video_filename, pdf_filename="Output/viol
 
     pdf.output(pdf_filename)
     print(f"Violence detection report saved as {pdf_filename}")
+    if not open_viewer:
+        return
     
     # Open the PDF with the default PDF viewer
     try:
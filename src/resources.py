@@ -0,0 +1,181 @@
+import os, sys, time, json, argparse, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import torch
+
+from config import config
+
+### CPU RESOURCE GOVERNOR
+
+def available_cores():
+    """Cores this process may run on (its affinity mask, e.g. under taskset or a container cpuset)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def os_threads():
+    """Threads of this process as the OS sees them, including torch/OpenMP and OpenCV pools"""
+    try:
+        return len(os.listdir("/proc/self/task"))
+    except OSError:
+        return threading.active_count()
+
+
+class ResourceGovernor:
+    """
+    Owns the process's core budget and sizes every thread pool from it
+    together, instead of torch, OpenCV, ffmpeg and each executor assuming
+    the whole machine:
+      - torch runs `intra_threads` intra-op threads per inference call,
+        OpenCV `cv2_threads` per call and ffmpeg DECODER_THREADS per
+        decoder (decode and resize already run in parallel across videos),
+      - inference_workers(branch) is how many inference calls a branch
+        can run at once without oversubscribing its cores, which sizes the
+        video executor of an archive run,
+      - with both branches running at once (live streams), each gets its
+        CPU_SHARES fraction of the cores, enforced by slot(branch).
+    torch's thread pool is process-wide, so branches are partitioned by
+    the number of concurrent callers, not by per-branch torch threads.
+    """
+    def __init__(self, cores=None, intra_threads=None, cv2_threads=None, shares=None):
+        self.cores = max(1, cores or config.CPU_CORES or available_cores())
+        self.intra_threads = max(1, min(self.cores, intra_threads or config.TORCH_INTRA_THREADS))
+        self.cv2_threads = config.CV2_THREADS if cv2_threads is None else cv2_threads
+        self.shares = dict(shares or config.CPU_SHARES)
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.applied = False
+
+    def apply(self):
+        """Set torch's and OpenCV's thread counts; idempotent"""
+        with self._lock:
+            if self.applied:
+                return self
+            torch.set_num_threads(self.intra_threads)
+            try:
+                # Inter-op parallelism is not used (no torch.jit.fork); can only be set before first use
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass
+            cv2.setNumThreads(self.cv2_threads)
+            self.applied = True
+        print(f"CPU governor: {self.summary()}")
+        return self
+
+    def branch_cores(self, branch, concurrent=False):
+        """Cores of `branch`; all of them unless the face and violence branches run at once"""
+        if not concurrent:
+            return self.cores
+        total = sum(self.shares.values()) or 1.0
+        return max(1, int(round(self.cores * self.shares.get(branch, 0.0) / total)))
+
+    def inference_workers(self, branch, concurrent=False):
+        """Concurrent inference calls that fit the branch's cores at intra_threads each"""
+        return max(1, self.branch_cores(branch, concurrent) // self.intra_threads)
+
+    def video_workers(self, branch, videos, stage_workers=1):
+        """Videos to process at once when each runs `stage_workers` inference threads"""
+        return max(1, min(videos, self.inference_workers(branch) // max(1, stage_workers)))
+
+    def slot(self, branch):
+        """Semaphore bounding a branch's concurrent inference calls to its share of the cores"""
+        with self._lock:
+            if branch not in self._slots:
+                self._slots[branch] = threading.BoundedSemaphore(self.inference_workers(branch, concurrent=True))
+            return self._slots[branch]
+
+    def summary(self):
+        shares = ", ".join(f"{b} {self.branch_cores(b, True)} cores / {self.inference_workers(b, True)} calls"
+                           for b in self.shares)
+        return (f"{self.cores} cores, torch {self.intra_threads} intra-op threads, OpenCV {self.cv2_threads}, "
+                f"ffmpeg {config.DECODER_THREADS} per decoder; concurrent branches: {shares}")
+
+
+# Shared by every pipeline in the process
+governor = ResourceGovernor()
+
+
+### BENCHMARK
+
+def _workload(batches, stage_workers, seed=0):
+    """One "video": `stage_workers` threads each running MTCNN-sized convolutions and an OpenCV resize per batch"""
+    torch.manual_seed(seed)
+    net = torch.nn.Sequential(
+        torch.nn.Conv2d(3, 32, 3, stride=2), torch.nn.PReLU(32),
+        torch.nn.Conv2d(32, 64, 3, stride=2), torch.nn.PReLU(64),
+        torch.nn.Conv2d(64, 64, 3), torch.nn.PReLU(64),
+    ).eval()
+    frame = (torch.rand(720, 1280, 3) * 255).to(torch.uint8).numpy()
+
+    def run(_):
+        with torch.no_grad():
+            for _ in range(batches):
+                small = cv2.resize(frame, (640, 360), interpolation=cv2.INTER_AREA)
+                net(torch.from_numpy(small).permute(2, 0, 1)[None].float().expand(8, -1, -1, -1).contiguous())
+
+    with ThreadPoolExecutor(max_workers=stage_workers) as stages:
+        list(stages.map(run, range(stage_workers)))
+
+def _benchmark_run(mode, videos, batches, stage_workers, cores):
+    """Process `videos` like an archive run in this process; returns its measurements"""
+    import resource
+    if mode == "governed":
+        gov = ResourceGovernor(cores=cores).apply()
+        max_workers = gov.video_workers("faces", videos, stage_workers)
+    else:
+        # What the pipeline did before: one worker per core, torch and OpenCV at their defaults
+        max_workers = max(1, min(videos, cores))
+    peak = [os_threads()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peak[0] = max(peak[0], os_threads())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda i: _workload(batches, stage_workers, i), range(videos)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "mode": mode, "video_workers": max_workers, "torch_threads": torch.get_num_threads(),
+        "cv2_threads": cv2.getNumThreads(), "peak_threads": peak[0] - 1,  # Without the sampler
+        "seconds": elapsed, "batches_per_s": videos * stage_workers * batches / elapsed,
+        "involuntary_switches": after.ru_nivcsw - usage.ru_nivcsw,
+        "cpu_seconds": (after.ru_utime + after.ru_stime) - (usage.ru_utime + usage.ru_stime),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show the CPU governor's settings, or benchmark oversubscription")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--videos", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=10, help="Batches per inference thread")
+    parser.add_argument("--stage-workers", type=int, default=config.DETECT_WORKERS)
+    parser.add_argument("--cores", type=int, default=None)
+    parser.add_argument("--run", choices=["ungoverned", "governed"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    cores = args.cores or available_cores()
+
+    if args.run:
+        print(json.dumps(_benchmark_run(args.run, args.videos, args.batches, args.stage_workers, cores)))
+    elif not args.benchmark:
+        print(ResourceGovernor(cores=cores).summary())
+    else:
+        # Each mode runs in a fresh process, since torch's thread pools are set once per process
+        print(f"{args.videos} videos x {args.stage_workers} inference threads x {args.batches} batches on {cores} cores")
+        print(f"{'mode':<11} {'videos':>6} {'torch':>5} {'cv2':>4} {'threads':>7} {'seconds':>8} "
+              f"{'batch/s':>8} {'cpu s':>7} {'inv. switches':>13}")
+        for mode in ("ungoverned", "governed"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", mode, "--videos", str(args.videos),
+                 "--batches", str(args.batches), "--stage-workers", str(args.stage_workers), "--cores", str(cores)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['mode']:<11} {r['video_workers']:>6} {r['torch_threads']:>5} {r['cv2_threads']:>4} "
+                  f"{r['peak_threads']:>7} {r['seconds']:>8.2f} {r['batches_per_s']:>8.1f} {r['cpu_seconds']:>7.1f} "
+                  f"{r['involuntary_switches']:>13}")
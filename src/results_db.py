@@ -0,0 +1,374 @@
+import os, json, time, sqlite3, argparse, threading
+
+from config import config
+
+### RESULTS DATABASE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,             -- "missing_person", "violence", "watch" or "ui"
+    job_key TEXT,                   -- Checkpoint job of the run, so a resumed job keeps its run
+    params TEXT,                    -- JSON
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    camera TEXT,
+    content_hash TEXT,
+    start_time REAL,                -- Wall-clock seconds at frame 0
+    fps REAL,
+    frame_count INTEGER,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS sightings (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    video_id INTEGER NOT NULL REFERENCES videos(id),
+    frame_idx INTEGER NOT NULL,
+    time REAL NOT NULL,             -- Seconds into the video
+    timestamp REAL,                 -- Wall-clock seconds
+    reference TEXT NOT NULL DEFAULT '',  -- Reference image the face matched; '' if unknown (NULLs would defeat UNIQUE)
+    similarity REAL NOT NULL,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    color_r INTEGER, color_g INTEGER, color_b INTEGER,
+    UNIQUE (run_id, video_id, frame_idx, x1, y1, x2, y2, reference)
+);
+CREATE INDEX IF NOT EXISTS sightings_video ON sightings (video_id, frame_idx);
+CREATE INDEX IF NOT EXISTS sightings_time ON sightings (timestamp);
+CREATE INDEX IF NOT EXISTS sightings_identity ON sightings (reference, similarity);
+CREATE INDEX IF NOT EXISTS sightings_score ON sightings (run_id, similarity);
+CREATE TABLE IF NOT EXISTS violence_events (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    video_id INTEGER NOT NULL REFERENCES videos(id),
+    frame_idx INTEGER NOT NULL,
+    end_frame INTEGER,
+    peak_frame INTEGER,
+    time REAL NOT NULL,
+    end_time REAL,
+    timestamp REAL,
+    probability REAL NOT NULL,      -- Peak clip probability
+    UNIQUE (run_id, video_id, frame_idx)
+);
+CREATE INDEX IF NOT EXISTS violence_video ON violence_events (video_id, frame_idx);
+CREATE INDEX IF NOT EXISTS violence_time ON violence_events (timestamp);
+CREATE INDEX IF NOT EXISTS violence_score ON violence_events (run_id, probability);
+"""
+
+_SIGHTING_COLUMNS = ("run_id", "video_id", "frame_idx", "time", "timestamp", "reference", "similarity",
+                     "x1", "y1", "x2", "y2", "color_r", "color_g", "color_b")
+_EVENT_COLUMNS = ("run_id", "video_id", "frame_idx", "end_frame", "peak_frame", "time", "end_time",
+                  "timestamp", "probability")
+
+# Result orderings accepted by queries
+ORDERS = {
+    "similarity": "similarity DESC, id",
+    "probability": "probability DESC, id",
+    "timestamp": "timestamp, id",
+    "video": "video_id, frame_idx, id",
+}
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers (UI, query service, reports) page through results while a run writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _sighting(row):
+    """A sightings row in the format of match_faces detections, without the frame image"""
+    return {
+        "frame_idx": row["frame_idx"],
+        "time": row["time"],
+        "similarity": row["similarity"],
+        "video_filename": os.path.basename(row["path"]),
+        "video": row["path"],
+        "camera": row["camera"],
+        "timestamp": row["timestamp"],
+        "reference": row["reference"] or None,
+        "box": (row["x1"], row["y1"], row["x2"], row["y2"]),
+        "dominant_color": (row["color_r"], row["color_g"], row["color_b"]),
+    }
+
+def _event(row):
+    """A violence_events row in the format of detect_violence_in_video events, without the thumbnail"""
+    return {
+        "frame_idx": row["frame_idx"],
+        "end_frame": row["end_frame"],
+        "peak_frame": row["peak_frame"],
+        "time": row["time"],
+        "end_time": row["end_time"],
+        "timestamp": row["timestamp"],
+        "probability": row["probability"],
+        "video_filename": os.path.basename(row["path"]),
+        "video": row["path"],
+        "camera": row["camera"],
+    }
+
+
+class ResultSet:
+    """
+    A filtered, ordered query over sightings or violence events. len()
+    counts the matches in SQL, page() fetches one page, and iterating
+    streams rows in pages through a separate read connection, so reports
+    over millions of results hold one page at a time.
+    """
+    def __init__(self, db, table, where, args, order, page_size=500):
+        self.db = db
+        self.table = table
+        self._where = " AND ".join(where) or "1"
+        self._args = list(args)
+        self._order = ORDERS[order]
+        self._convert = _sighting if table == "sightings" else _event
+        self.page_size = page_size
+
+    def _sql(self, columns):
+        return (f"SELECT {columns} FROM {self.table} r JOIN videos v ON v.id = r.video_id "
+                f"WHERE {self._where}")
+
+    def __len__(self):
+        return self.db._query(self._sql("COUNT(*)"), self._args)[0][0]
+
+    def page(self, offset=0, limit=100):
+        rows = self.db._query(f"{self._sql('r.*, v.path, v.camera')} ORDER BY {self._order} LIMIT ? OFFSET ?",
+                              self._args + [int(limit), int(offset)])
+        return [self._convert(row) for row in rows]
+
+    def __iter__(self):
+        self.db.flush()
+        conn = _connect(self.db.path)
+        try:
+            cursor = conn.execute(f"{self._sql('r.*, v.path, v.camera')} ORDER BY {self._order}", self._args)
+            while True:
+                rows = cursor.fetchmany(self.page_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._convert(row)
+        finally:
+            conn.close()
+
+
+class ResultsDB:
+    """
+    Embedded SQLite database of every run's sightings and violence events,
+    indexed by video, time, identity (reference) and score. Pipeline
+    workers add results through a ResultsRun; rows are buffered and
+    written in batches of `batch_rows` with executemany. Per-face
+    similarities and per-clip probabilities below the thresholds stay in
+    the columnar score stores (see calibration.py).
+    """
+    def __init__(self, path=None, batch_rows=None):
+        self.path = path or os.path.join(config.INDEX_DIR, "results.db")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.batch_rows = config.RESULTS_BATCH_ROWS if batch_rows is None else batch_rows
+        self._conn = _connect(self.path)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = {"sightings": [], "violence_events": []}
+        self._video_ids = {}
+
+    def _query(self, sql, args=()):
+        self.flush()
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def start_run(self, kind, params=None, job_key=None, resume=False, references=None):
+        """
+        A ResultsRun for new results. With `resume`, the latest unfinished run
+        of the same `job_key` is continued, so a resumed checkpoint job keeps
+        the results it already wrote.
+        """
+        with self._lock:
+            row = None
+            if resume and job_key is not None:
+                row = self._conn.execute(
+                    "SELECT id FROM runs WHERE job_key = ? AND finished IS NULL ORDER BY id DESC LIMIT 1", (job_key,)
+                ).fetchone()
+            if row is not None:
+                run_id = row[0]
+            else:
+                run_id = self._conn.execute(
+                    "INSERT INTO runs (kind, job_key, params, started) VALUES (?, ?, ?, ?)",
+                    (kind, job_key, json.dumps(params or {}, default=str), time.time())
+                ).lastrowid
+            self._conn.commit()
+        return ResultsRun(self, run_id, references)
+
+    def video_id(self, path, metadata=None, camera=None):
+        """Id of a video, added (or its metadata filled in) on first use"""
+        path = os.path.abspath(path)
+        if path in self._video_ids:
+            return self._video_ids[path]
+        values = (camera, metadata.content_hash if metadata else None, metadata.start_time if metadata else None,
+                  metadata.fps if metadata else None, metadata.frame_count if metadata else None,
+                  metadata.duration if metadata else None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO videos (path, camera, content_hash, start_time, fps, frame_count, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+                "camera = COALESCE(excluded.camera, camera), content_hash = COALESCE(excluded.content_hash, content_hash), "
+                "start_time = COALESCE(excluded.start_time, start_time), fps = COALESCE(excluded.fps, fps), "
+                "frame_count = COALESCE(excluded.frame_count, frame_count), duration = COALESCE(excluded.duration, duration)",
+                (path,) + values
+            )
+            video_id = self._conn.execute("SELECT id FROM videos WHERE path = ?", (path,)).fetchone()[0]
+            self._conn.commit()
+            self._video_ids[path] = video_id
+        return video_id
+
+    def _add(self, table, rows):
+        with self._lock:
+            self._pending[table].extend(rows)
+            full = len(self._pending[table]) >= self.batch_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows in one transaction; rows already stored (e.g. by a resumed run) are skipped"""
+        with self._lock:
+            for table, columns in (("sightings", _SIGHTING_COLUMNS), ("violence_events", _EVENT_COLUMNS)):
+                rows, self._pending[table] = self._pending[table], []
+                if rows:
+                    self._conn.executemany(
+                        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                        rows
+                    )
+            self._conn.commit()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def runs(self, kind=None, limit=20):
+        """Most recent runs, newest first, with their result counts"""
+        where, args = ("WHERE kind = ?", [kind]) if kind else ("", [])
+        rows = self._query(
+            f"SELECT r.*, (SELECT COUNT(*) FROM sightings s WHERE s.run_id = r.id) AS sightings, "
+            f"(SELECT COUNT(*) FROM violence_events e WHERE e.run_id = r.id) AS violence_events "
+            f"FROM runs r {where} ORDER BY id DESC LIMIT ?", args + [limit]
+        )
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _filters(run_id, camera, start, end, video):
+        where, args = [], []
+        for clause, value in (("r.run_id = ?", run_id), ("v.camera = ?", camera), ("r.timestamp >= ?", start),
+                              ("r.timestamp <= ?", end), ("v.path = ?", video and os.path.abspath(video))):
+            if value is not None:
+                where.append(clause)
+                args.append(value)
+        return where, args
+
+    def sightings(self, run_id=None, camera=None, start=None, end=None, video=None, reference=None,
+                  min_similarity=None, order="similarity"):
+        """ResultSet of sightings; `start`/`end` are wall-clock epoch seconds"""
+        where, args = self._filters(run_id, camera, start, end, video)
+        if reference is not None:
+            where.append("r.reference = ?")
+            args.append(os.path.basename(reference))
+        if min_similarity is not None:
+            where.append("r.similarity >= ?")
+            args.append(min_similarity)
+        return ResultSet(self, "sightings", where, args, order)
+
+    def violence_events(self, run_id=None, camera=None, start=None, end=None, video=None,
+                        min_probability=None, order="timestamp"):
+        """ResultSet of violence events; `start`/`end` are wall-clock epoch seconds"""
+        where, args = self._filters(run_id, camera, start, end, video)
+        if min_probability is not None:
+            where.append("r.probability >= ?")
+            args.append(min_probability)
+        return ResultSet(self, "violence_events", where, args, order)
+
+
+class ResultsRun:
+    """Results of one pipeline run; add_* may be called from any worker thread"""
+    def __init__(self, db, run_id, references=None):
+        self.db = db
+        self.id = run_id
+        self.references = [os.path.basename(r) for r in references] if references else None
+
+    def _reference(self, det):
+        """Reference filename of a detection; '' rather than NULL when unknown, so duplicates are still ignored"""
+        ref = det.get("reference")
+        if ref is None or self.references is None or not isinstance(ref, int):
+            return "" if ref is None else str(ref)
+        return self.references[ref]
+
+    def add_sightings(self, video_path, detections, metadata=None, camera=None):
+        if not detections:
+            return
+        video_id = self.db.video_id(video_path, metadata, camera)
+        start_time = metadata.start_time if metadata else None
+        self.db._add("sightings", [(
+            self.id, video_id, int(det["frame_idx"]), float(det["time"]),
+            start_time + det["time"] if start_time is not None else None,
+            self._reference(det), float(det["similarity"]),
+            *(int(v) for v in det["box"]), *(int(v) for v in det.get("dominant_color", (0, 0, 0)))
+        ) for det in detections])
+
+    def add_violence_events(self, video_path, events, metadata=None, camera=None):
+        if not events:
+            return
+        video_id = self.db.video_id(video_path, metadata, camera)
+        start_time = metadata.start_time if metadata else None
+        self.db._add("violence_events", [(
+            self.id, video_id, int(ev["frame_idx"]), int(ev["end_frame"]), int(ev["peak_frame"]),
+            float(ev["time"]), float(ev["end_time"]),
+            start_time + ev["time"] if start_time is not None else None, float(ev["probability"])
+        ) for ev in events])
+
+    def flush(self):
+        self.db.flush()
+
+    def finish(self):
+        """Write what is buffered and mark the run finished"""
+        self.db.flush()
+        with self.db._lock:
+            self.db._conn.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.id))
+            self.db._conn.commit()
+
+    def sightings(self, **filters):
+        return self.db.sightings(run_id=self.id, **filters)
+
+    def violence_events(self, **filters):
+        return self.db.violence_events(run_id=self.id, **filters)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="List runs and page through stored results")
+    parser.add_argument("kind", nargs="?", choices=["runs", "sightings", "violence"], default="runs")
+    parser.add_argument("--run", type=int, help="Run id (default: all runs)")
+    parser.add_argument("--camera")
+    parser.add_argument("--reference")
+    parser.add_argument("--order", choices=sorted(ORDERS))
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--offset", type=int, default=0)
+    args = parser.parse_args()
+
+    db = ResultsDB()
+    if args.kind == "runs":
+        for run in db.runs(limit=args.limit):
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["started"]))
+            state = "finished" if run["finished"] else "unfinished"
+            print(f"{run['id']:>5}  {run['kind']:<15} {started}  {state:<10} "
+                  f"{run['sightings']} sightings, {run['violence_events']} violence events")
+    else:
+        if args.kind == "sightings":
+            results = db.sightings(args.run, args.camera, reference=args.reference, order=args.order or "similarity")
+        else:
+            results = db.violence_events(args.run, args.camera, order=args.order or "timestamp")
+        t0 = time.time()
+        total, page = len(results), results.page(args.offset, args.limit)
+        print(f"{total} {args.kind}, showing {args.offset + 1}-{args.offset + len(page)} "
+              f"({(time.time() - t0) * 1000:.1f} ms)")
+        for r in page:
+            score = r.get("similarity", r.get("probability"))
+            print(f"{r['camera'] or '':<12} {r['video_filename']:<30} frame {r['frame_idx']:<8} "
+                  f"{r['time']:>9.2f}s  {score:.3f}  {r.get('reference') or ''}")
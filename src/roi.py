@@ -0,0 +1,145 @@
+import os, json, hashlib, argparse
+import cv2
+import numpy as np
+
+from config import config
+
+### PER-CAMERA REGIONS OF INTEREST
+#
+# ROI_FILE maps camera names (see video_index.camera_name) to regions in
+# coordinates relative to the frame, so one definition fits every decode size:
+#   {"cam_3": {"rects": [[0.0, 0.25, 1.0, 1.0]],
+#              "polygons": [[[0.1, 0.3], [0.6, 0.3], [0.5, 0.95], [0.1, 0.95]]]}}
+# Rectangles are [x1, y1, x2, y2]; polygons are lists of [x, y] vertices.
+
+class RegionOfInterest:
+    """
+    The parts of a fixed camera view worth processing. Frames are cropped to
+    the bounding box of all regions, and pixels of that box outside every
+    region (an overlay, a wall between two regions) are blacked out, so
+    MTCNN and r3d_18 see fewer and more relevant pixels. Boxes found in a
+    cropped frame are mapped back to full-frame coordinates with shift().
+    """
+    def __init__(self, rects=(), polygons=()):
+        self.rects = [tuple(float(v) for v in rect) for rect in rects]
+        self.polygons = [np.asarray(poly, dtype=np.float32).reshape(-1, 2) for poly in polygons]
+        if not self.rects and not self.polygons:
+            raise ValueError("a region of interest needs at least one rectangle or polygon")
+        self._layouts = {}   # (width, height) -> (crop, mask)
+        self._masks = {}     # (width, height, out_width, out_height) -> mask
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(spec.get("rects", ()), spec.get("polygons", ()))
+
+    def layout(self, width, height):
+        """
+        ((x1, y1, x2, y2) crop in pixels of a width x height frame, uint8
+        mask of the crop), where the mask is None if the regions fill the crop
+        """
+        key = (width, height)
+        if key not in self._layouts:
+            full = np.zeros((height, width), dtype=np.uint8)
+            for x1, y1, x2, y2 in self.rects:
+                full[int(round(y1 * height)):int(round(y2 * height)), int(round(x1 * width)):int(round(x2 * width))] = 255
+            for poly in self.polygons:
+                cv2.fillPoly(full, [np.round(poly * (width, height)).astype(np.int32)], 255)
+            ys, xs = np.nonzero(full)
+            if not len(xs):
+                raise ValueError(f"region of interest is empty at {width}x{height}")
+            crop = (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+            mask = full[crop[1]:crop[3], crop[0]:crop[2]]
+            self._layouts[key] = (crop, None if mask.all() else np.ascontiguousarray(mask))
+        return self._layouts[key]
+
+    def fraction(self, width, height):
+        """Share of the frame's pixels that are processed"""
+        (x1, y1, x2, y2), _ = self.layout(width, height)
+        return (x2 - x1) * (y2 - y1) / float(width * height)
+
+    def apply(self, frame):
+        """The ROI of a full frame: a cropped view, or a masked copy if part of the crop is outside the regions"""
+        (x1, y1, x2, y2), mask = self.layout(frame.shape[1], frame.shape[0])
+        view = frame[y1:y2, x1:x2]
+        if mask is None:
+            return view
+        return np.bitwise_and(view, mask[..., None])
+
+    def output_mask(self, width, height, out_width, out_height):
+        """
+        Mask of the crop of a width x height source after resizing it to
+        out_width x out_height, or None; np.bitwise_and(frame, mask[..., None],
+        out=frame) blacks out a resized frame in place
+        """
+        key = (width, height, out_width, out_height)
+        if key not in self._masks:
+            _, mask = self.layout(width, height)
+            if mask is not None and mask.shape != (out_height, out_width):
+                mask = cv2.resize(mask, (out_width, out_height), interpolation=cv2.INTER_NEAREST)
+            self._masks[key] = mask
+        return self._masks[key]
+
+    def shift(self, frame_shape, batch_boxes, batch_points=None):
+        """Map per-frame MTCNN boxes (and landmarks) found in cropped frames back to the full frame"""
+        (x1, y1, _, _), _ = self.layout(frame_shape[1], frame_shape[0])
+        offset = np.array([x1, y1], dtype=np.float32)
+        boxes = [None if b is None else b + np.tile(offset, 2) for b in batch_boxes]
+        if batch_points is None:
+            return boxes
+        return boxes, [None if p is None else p + offset for p in batch_points]
+
+
+_rois = {"source": None, "cameras": {}}
+
+def load_rois(path=None):
+    """{camera: RegionOfInterest} from ROI_FILE, re-read when the file changes; {} without one"""
+    path = path or config.ROI_FILE
+    if not path or not os.path.exists(path):
+        return {}
+    mtime = os.path.getmtime(path)
+    if _rois["source"] != (path, mtime):
+        with open(path) as f:
+            specs = json.load(f)
+        _rois["cameras"] = {camera: RegionOfInterest.from_dict(spec) for camera, spec in specs.items()}
+        _rois["source"] = (path, mtime)
+    return _rois["cameras"]
+
+def roi_for(camera):
+    """The RegionOfInterest configured for `camera`, or None to process whole frames"""
+    return load_rois().get(camera)
+
+def roi_signature():
+    """Hash of the ROI configuration, so checkpointed results are not reused after it changes"""
+    path = config.ROI_FILE
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+if __name__ == '__main__':
+    from video_index import camera_name
+    from decoders import probe_video, read_frame_at
+
+    parser = argparse.ArgumentParser(description="Check the region of interest configured for a video's camera")
+    parser.add_argument("video")
+    parser.add_argument("--frame", type=int, default=0, help="Frame to draw the region on")
+    parser.add_argument("--out", help="Save the frame with the processed region highlighted")
+    args = parser.parse_args()
+
+    camera = camera_name(args.video)
+    roi = roi_for(camera)
+    if roi is None:
+        raise SystemExit(f"No region of interest for camera {camera!r} in {config.ROI_FILE}")
+    _, _, width, height = probe_video(args.video)
+    crop, mask = roi.layout(width, height)
+    kept = (mask > 0).mean() if mask is not None else 1.0
+    print(f"{camera}: crop {crop} of {width}x{height} ({roi.fraction(width, height):.0%} of the frame, "
+          f"{kept:.0%} of the crop unmasked)")
+    if args.out:
+        frame = read_frame_at(args.video, args.frame)
+        shown = (frame * 0.3).astype(np.uint8)
+        x1, y1, x2, y2 = crop
+        shown[y1:y2, x1:x2] = roi.apply(frame)
+        cv2.rectangle(shown, (x1, y1), (x2 - 1, y2 - 1), (0, 255, 0), 2)
+        cv2.imwrite(args.out, cv2.cvtColor(shown, cv2.COLOR_RGB2BGR))
+        print(f"Saved {args.out}")
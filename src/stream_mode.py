@@ -0,0 +1,332 @@
+import os, time, threading
+from contextlib import nullcontext
+from collections import deque
+import cv2
+import numpy as np
+
+from config import config
+from video_index import camera_name
+from missing_person_detection import detect_faces, embed_faces, match_faces
+from violence_detection import score_clips
+from violence_cascade import MotionEnergyGate
+from violence_events import ViolenceEventSegmenter
+from inference_server import FaceEmbeddingServer
+from face_quality import FaceQualityGate
+from roi import roi_for
+from resources import governor
+
+### REAL-TIME STREAM MODE
+
+class LatencyStats:
+    """End-to-end latency (capture to result) and drop counts for one camera"""
+    def __init__(self, history=1000):
+        self._latencies = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.service_time = 0.0   # Moving average of inference time, used to predict deadline misses
+
+    def record(self, capture_time, started):
+        now = time.monotonic()
+        with self._lock:
+            self._latencies.append(now - capture_time)
+            self.processed += 1
+            self.service_time = 0.8 * self.service_time + 0.2 * (now - started) if self.processed > 1 else now - started
+
+    def too_late(self, capture_time, budget):
+        """
+        True if work on an input captured at `capture_time` would finish past the budget.
+        The predicted inference time is capped at half the budget so a model that can
+        never meet it still processes the freshest inputs instead of dropping everything.
+        """
+        return time.monotonic() - capture_time + min(self.service_time, budget / 2) > budget
+
+    def drop(self, count=1):
+        with self._lock:
+            self.dropped += count
+
+    def summary(self):
+        with self._lock:
+            lat = np.array(self._latencies) if self._latencies else np.zeros(1)
+            return {
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "p50_ms": float(np.percentile(lat, 50) * 1000),
+                "p95_ms": float(np.percentile(lat, 95) * 1000),
+                "max_ms": float(lat.max() * 1000),
+            }
+
+
+class LatestFrame:
+    """Single-slot mailbox: a new frame replaces an unread one, which counts as dropped"""
+    def __init__(self, stats):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self._stats = stats
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self._stats.drop()
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=0.5):
+        with self._cond:
+            if self._item is None and not self._closed:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class CameraStream:
+    """
+    Reads one source (RTSP/HTTP URL or a local file) on its own thread.
+    Local files are replayed at their native frame rate to stand in for a
+    live camera. Every frame is stamped with its capture time and handed to
+    the face branch (one frame every STREAM_FACE_INTERVAL seconds, newest
+    only) and the violence branch (a short bounded queue of 112x112 frames;
+    the oldest are dropped when it is full). Violence frames are cut to the
+    camera's region of interest (by camera name in ROI_FILE) before scaling.
+    """
+    def __init__(self, source, camera=None, stop_event=None, violence_queue=64):
+        self.source = source
+        self._is_file = os.path.exists(str(source))
+        # Files are named like everywhere else (ROI_FILE, stores, checkpoints): by their directory
+        self.camera = camera or (camera_name(source) if self._is_file else os.path.basename(str(source)))
+        self.stop_event = stop_event or threading.Event()
+        self.face_stats = LatencyStats()
+        self.violence_stats = LatencyStats()
+        self.face_frames = LatestFrame(self.face_stats)
+        self.violence_frames = deque(maxlen=violence_queue)
+        self.violence_ready = threading.Event()
+        self.fps = 30.0
+        self.finished = threading.Event()
+        self.roi = roi_for(self.camera)
+
+    def run(self):
+        cap = cv2.VideoCapture(self.source)
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        start = time.monotonic()
+        frame_idx = 0
+        last_face = None
+        try:
+            while not self.stop_event.is_set():
+                if self._is_file:
+                    # Replay at native speed
+                    delay = start + frame_idx / self.fps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                captured = time.monotonic()
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                if last_face is None or captured - last_face >= config.STREAM_FACE_INTERVAL:
+                    last_face = captured
+                    self.face_frames.put((captured, frame_idx, rgb))
+                if len(self.violence_frames) == self.violence_frames.maxlen:
+                    self.violence_stats.drop()
+                region = self.roi.apply(rgb) if self.roi is not None else rgb
+                small = cv2.resize(region, config.VIOLENCE_DECODE_SIZE, interpolation=cv2.INTER_AREA)
+                self.violence_frames.append((captured, frame_idx, small))
+                self.violence_ready.set()
+                frame_idx += 1
+        finally:
+            cap.release()
+            self.finished.set()
+            self.face_frames.close()
+            self.violence_ready.set()
+
+
+class LiveMonitor:
+    """
+    Real-time monitoring of one or more streams under a latency budget.
+      - Each camera has a reader thread plus face and violence worker threads.
+      - Workers always take the newest input. An input is dropped instead of
+        processed when its age plus the branch's recent inference time would
+        exceed `latency_budget` seconds, so a slow model falls behind by
+        skipping frames and clips, never by queueing.
+      - Alerts are raised through `on_alert(alert)` as soon as a match or
+        violence event is seen, and per-camera latency is tracked.
+    """
+    def __init__(self, sources, device, mtcnn=None, resnet=None, ref_embeddings=None, violence_model=None,
+                 latency_budget=None, detection_threshold=None, violence_threshold=None, on_alert=None):
+        self.device = device
+        self.mtcnn, self.resnet = mtcnn, resnet
+        self.ref_embeddings = ref_embeddings
+        self.violence_model = violence_model
+        self.latency_budget = config.STREAM_LATENCY_BUDGET if latency_budget is None else latency_budget
+        self.detection_threshold = config.FACE_THRESH if detection_threshold is None else detection_threshold
+        self.violence_threshold = config.VIOLENCE_THRESH if violence_threshold is None else violence_threshold
+        self.on_alert = on_alert or print_alert
+        self.stop_event = threading.Event()
+        self.cameras = [CameraStream(src, stop_event=self.stop_event) for src in sources]
+        # Faces from all cameras share ResNet batches
+        self.embedder = FaceEmbeddingServer(resnet, device) if config.EMBED_SERVER and ref_embeddings is not None else None
+        self.quality_gate = FaceQualityGate(image_size=mtcnn.image_size) if config.FACE_QUALITY_GATE and mtcnn is not None else None
+        # With both branches live, each keeps to its share of the cores (CPU_SHARES)
+        both = ref_embeddings is not None and violence_model is not None
+        self._face_slot = governor.slot("faces") if both else nullcontext()
+        self._violence_slot = governor.slot("violence") if both else nullcontext()
+        self._threads = []
+
+    def _alert(self, camera, kind, capture_time, **details):
+        self.on_alert({
+            "camera": camera.camera,
+            "type": kind,
+            "latency_ms": (time.monotonic() - capture_time) * 1000,
+            "wall_time": time.time(),
+            **details,
+        })
+
+    def _face_worker(self, camera):
+        while not self.stop_event.is_set():
+            item = camera.face_frames.get()
+            if item is None:
+                if camera.face_frames.closed:
+                    break
+                continue
+            captured, frame_idx, rgb = item
+            if camera.face_stats.too_late(captured, self.latency_budget):
+                camera.face_stats.drop()
+                continue
+
+            started = time.monotonic()
+            with self._face_slot:
+                detected = detect_faces([(frame_idx, camera.fps, rgb)], self.mtcnn, self.quality_gate, camera.roi)
+                embedded = embed_faces(detected, self.resnet, self.device, self.embedder)
+                _, detections = match_faces(embedded, camera.camera, self.device, self.ref_embeddings,
+                                            self.detection_threshold)
+            camera.face_stats.record(captured, started)
+            if detections:
+                best = max(detections, key=lambda d: d['similarity'])
+                self._alert(camera, "missing_person", captured, frame_idx=frame_idx,
+                            similarity=best['similarity'], box=best['box'])
+
+    def _violence_worker(self, camera):
+        clip_length = 16
+        stride = config.STREAM_CLIP_STRIDE
+        gate = MotionEnergyGate() if config.VIOLENCE_CASCADE else None
+        clip = deque(maxlen=clip_length)
+        since_last = 0
+        capture_times = {}
+
+        def on_open(event):
+            captured = capture_times.get(event['peak_frame'], time.monotonic())
+            self._alert(camera, "violence", captured, frame_idx=event['frame_idx'], probability=event['probability'])
+
+        segmenter = ViolenceEventSegmenter(
+            camera.fps, self.violence_threshold, self.violence_threshold - config.VIOLENCE_HYSTERESIS,
+            window=config.VIOLENCE_SMOOTHING_WINDOW, reorder_frames=0, on_open=on_open
+        )
+
+        while not self.stop_event.is_set():
+            if not camera.violence_frames:
+                if camera.finished.is_set():
+                    break
+                camera.violence_ready.wait(0.5)
+                camera.violence_ready.clear()
+                continue
+            captured, frame_idx, small = camera.violence_frames.popleft()
+            if camera.violence_stats.too_late(captured, self.latency_budget):
+                # Could not be scored in time: drop it and restart the clip so it stays contiguous
+                camera.violence_stats.drop()
+                clip.clear()
+                since_last = 0
+                continue
+            clip.append((captured, frame_idx, small))
+            since_last += 1
+            if len(clip) < clip_length or since_last < stride:
+                continue
+            since_last = 0
+
+            frames = np.stack([f for _, _, f in clip])
+            first, last = clip[0][1], clip[-1][1]
+            newest = clip[-1][0]
+            capture_times = {first: newest}
+            started = time.monotonic()
+            if gate is not None and not gate([frames])[0]:
+                prob = 0.0
+            else:
+                with self._violence_slot:
+                    prob = float(score_clips([frames], self.violence_model, self.device)[0])
+            camera.violence_stats.record(newest, started)
+            segmenter.push(first, last, prob)
+        segmenter.finish()
+
+    def start(self):
+        for camera in self.cameras:
+            targets = [camera.run]
+            if self.ref_embeddings is not None:
+                targets.append(lambda c=camera: self._face_worker(c))
+            if self.violence_model is not None:
+                targets.append(lambda c=camera: self._violence_worker(c))
+            for target in targets:
+                t = threading.Thread(target=target, daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def wait(self, report_every=10.0):
+        """Block until every source ends or stop() is called, printing latency metrics periodically"""
+        last_report = time.monotonic()
+        try:
+            while any(t.is_alive() for t in self._threads):
+                time.sleep(min(report_every, 1.0))
+                if time.monotonic() - last_report >= report_every:
+                    last_report = time.monotonic()
+                    self.print_metrics()
+        except KeyboardInterrupt:
+            self.stop()
+        for t in self._threads:
+            t.join(timeout=5.0)
+        if self.embedder is not None:
+            self.embedder.close()
+        self.print_metrics()
+        if self.quality_gate is not None:
+            print(self.quality_gate.summary())
+
+    def metrics(self):
+        """Per-camera latency and drop statistics for each branch"""
+        return {
+            camera.camera: {"face": camera.face_stats.summary(), "violence": camera.violence_stats.summary()}
+            for camera in self.cameras
+        }
+
+    def print_metrics(self):
+        for name, branches in self.metrics().items():
+            for branch, m in branches.items():
+                if m["processed"] or m["dropped"]:
+                    print(f"[{name}] {branch}: {m['processed']} processed, {m['dropped']} dropped, "
+                          f"latency p50 {m['p50_ms']:.0f} ms / p95 {m['p95_ms']:.0f} ms / max {m['max_ms']:.0f} ms")
+
+
+def print_alert(alert):
+    when = time.strftime("%H:%M:%S", time.localtime(alert["wall_time"]))
+    if alert["type"] == "missing_person":
+        detail = f"missing person match (similarity {alert['similarity']:.2f})"
+    else:
+        detail = f"violence (probability {alert['probability']:.2f})"
+    print(f"[ALERT {when}] {alert['camera']}: {detail}, frame {alert['frame_idx']}, "
+          f"{alert['latency_ms']:.0f} ms after capture")
+
+def run_live_mode(sources, device, mtcnn=None, resnet=None, ref_embeddings=None, violence_model=None, on_alert=None):
+    """Monitor the given streams until they end or Ctrl+C is pressed"""
+    monitor = LiveMonitor(sources, device, mtcnn, resnet, ref_embeddings, violence_model, on_alert=on_alert).start()
+    print(f"Monitoring {len(sources)} stream(s) with a {monitor.latency_budget:.1f}s latency budget. Press Ctrl+C to stop.")
+    monitor.wait()
+    return monitor.metrics()
@@ -0,0 +1,142 @@
+import threading
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from config import config
+
+### PREALLOCATED TENSOR BUFFER POOL
+
+CLIP_SIZE = 112
+CLIP_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1, 1)
+CLIP_STD = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1, 1)
+
+
+class TensorPool:
+    """
+    Reusable CPU buffers for batch tensors such as face crops (N,3,160,160)
+    and clip batches (N,3,T,112,112).
+    acquire() returns an (n, ...) view of a pooled buffer whose row capacity
+    is n rounded up to a power of two, so batches of varying size share a
+    few buckets; release() hands the buffer back for the next batch. Once
+    every bucket has been used, batches are built without new allocations.
+    """
+    def __init__(self, enabled=True, pin_memory=False):
+        self.enabled = enabled
+        self.pin_memory = pin_memory
+        self._free = {}    # (capacity, item_shape, dtype) -> [buffer]
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.growth = 0        # Buffers allocated
+        self.reserved_bytes = 0
+        self.in_use_bytes = 0
+        self.peak_bytes = 0
+
+    @staticmethod
+    def _capacity(n):
+        return 1 << max(n - 1, 0).bit_length()
+
+    def acquire(self, n, item_shape, dtype=torch.float32):
+        """An uninitialized (n, *item_shape) tensor"""
+        key = (self._capacity(n), tuple(item_shape), dtype)
+        with self._lock:
+            self.requests += 1
+            free = self._free.get(key)
+            buffer = free.pop() if free else None
+            if buffer is not None:
+                self.hits += 1
+        if buffer is None:
+            buffer = torch.empty((key[0],) + key[1], dtype=dtype, pin_memory=self.pin_memory)
+            with self._lock:
+                self.growth += 1
+                if self.enabled:
+                    self.reserved_bytes += buffer.nbytes
+        with self._lock:
+            self.in_use_bytes += buffer.nbytes
+            self.peak_bytes = max(self.peak_bytes, self.in_use_bytes)
+        return buffer[:n]
+
+    def release(self, tensor):
+        """Return a tensor obtained from acquire(); it must not be used afterwards"""
+        buffer = tensor._base if tensor._base is not None else tensor
+        key = (len(buffer), tuple(buffer.shape[1:]), buffer.dtype)
+        with self._lock:
+            self.in_use_bytes -= buffer.nbytes
+            if self.enabled:
+                self._free.setdefault(key, []).append(buffer)
+
+    def summary(self):
+        with self._lock:
+            rate = self.hits / self.requests if self.requests else 0.0
+            return (f"{self.requests} buffers requested, {rate:.0%} reused, {self.growth} allocated, "
+                    f"peak {self.peak_bytes / 2**20:.1f} MiB in use, {self.reserved_bytes / 2**20:.1f} MiB pooled")
+
+
+# Shared by every pipeline in the process
+tensor_pool = TensorPool(enabled=config.TENSOR_POOL, pin_memory=config.DEVICE == "cuda")
+
+
+def crop_faces_into(frames, batch_boxes, mtcnn, pool=None):
+    """
+    Crop every detected face into one pooled (N,3,S,S) tensor, matching
+    MTCNN.extract (same margin, INTER_AREA resize and standardization) but
+    without a tensor per face. Returns (faces, counts), where counts[i] is
+    the number of faces of frames[i]; faces is None if there are none.
+    """
+    pool = pool or tensor_pool
+    counts = [0 if boxes is None else len(boxes) for boxes in batch_boxes]
+    total = sum(counts)
+    if not total:
+        return None, counts
+
+    size, margin = mtcnn.image_size, mtcnn.margin
+    crops = pool.acquire(total, (size, size, 3), torch.uint8)
+    crops_np = crops.numpy()
+    row = 0
+    for frame, boxes in zip(frames, batch_boxes):
+        if boxes is None:
+            continue
+        height, width = frame.shape[:2]
+        for box in boxes:
+            mx = margin * (box[2] - box[0]) / (size - margin)
+            my = margin * (box[3] - box[1]) / (size - margin)
+            x1, y1 = int(max(box[0] - mx / 2, 0)), int(max(box[1] - my / 2, 0))
+            x2, y2 = int(min(box[2] + mx / 2, width)), int(min(box[3] + my / 2, height))
+            cv2.resize(frame[y1:y2, x1:x2], (size, size), dst=crops_np[row], interpolation=cv2.INTER_AREA)
+            row += 1
+
+    faces = pool.acquire(total, (3, size, size))
+    faces.copy_(crops.permute(0, 3, 1, 2))
+    pool.release(crops)
+    if mtcnn.post_process:
+        faces.sub_(127.5).div_(128.0)
+    return faces, counts
+
+
+def clips_into(clips, pool=None):
+    """
+    Preprocess clips of (T,H,W,3) uint8 RGB frames into one pooled
+    (N,3,T,112,112) tensor, written in place: frames are resized only when
+    they were not decoded at 112x112, then scaled and normalized like
+    preprocess_clip.
+    """
+    pool = pool or tensor_pool
+    length = len(clips[0])
+    batch = pool.acquire(len(clips), (3, length, CLIP_SIZE, CLIP_SIZE))
+    for n, clip in enumerate(clips):
+        if isinstance(clip, np.ndarray) and clip.shape[1:3] == (CLIP_SIZE, CLIP_SIZE):
+            batch[n].copy_(torch.from_numpy(clip).permute(3, 0, 1, 2))
+            continue
+        for t, frame in enumerate(clip):
+            if frame.shape[:2] != (CLIP_SIZE, CLIP_SIZE):
+                frame = _resize_frame(frame)
+            batch[n, :, t].copy_(torch.from_numpy(frame).permute(2, 0, 1))
+    batch.div_(255).sub_(CLIP_MEAN).div_(CLIP_STD)
+    return batch
+
+
+def _resize_frame(frame):
+    # Same filter as transforms.Resize on a PIL image
+    return np.array(Image.fromarray(frame).resize((CLIP_SIZE, CLIP_SIZE), Image.BILINEAR))
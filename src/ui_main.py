@@ -1,7 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import queue
 import threading
+import cv2
 import torch
 from PIL import Image, ImageTk
 import numpy as np
@@ -11,6 +13,80 @@ import time
 from missing_person_detection import setup_missing_person_detection, process_video
 from violence_detection import load_violence_detection_model, detect_violence_in_video
 from report_generation import export_to_pdf, export_violence_report
+from reference_gallery import ReferenceGallery
+from attribute_index import AttributeStore
+from embedding_index import FaceEmbeddingStore
+from face_quality import FaceQualityGate
+from calibration import FaceScoreStore, ViolenceScoreStore, FaceScores, ViolenceScores
+from results_db import ResultsDB
+from video_index import VideoIndex, ProgressETA, camera_name
+from prefetch import prefetching, mark_opened
+from config import config
+
+class LiveUpdates:
+    """
+    Carries updates from the detection thread to the Tk thread, which drains
+    them every UI_POLL_MS with root.after; workers never touch Tk or open
+    OpenCV windows. Status, progress and detections go through a thread-safe
+    queue. Preview frames are rate-limited to UI_PREVIEW_FPS and downscaled
+    to UI_PREVIEW_WIDTH on the worker, and only the newest one is kept, so a
+    busy UI drops preview frames instead of holding up inference.
+    """
+    def __init__(self, fps=None, width=None):
+        self.queue = queue.Queue()
+        self.interval = 1.0 / (fps or config.UI_PREVIEW_FPS)
+        self.width = width or config.UI_PREVIEW_WIDTH
+        self._frame = None
+        self._last_frame = 0.0
+        self._lock = threading.Lock()
+
+    def post(self, kind, *args):
+        self.queue.put((kind,) + args)
+
+    def frame_due(self):
+        """Whether the next preview frame is due; callers check this before picking or copying a frame"""
+        return time.monotonic() - self._last_frame >= self.interval
+
+    def offer_frame(self, frame, boxes=(), label=None):
+        """Keep a downscaled copy of RGB `frame` with `boxes` and `label` drawn, if a preview frame is due"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_frame < self.interval:
+                return
+            self._last_frame = now
+        scale = min(1.0, self.width / frame.shape[1])
+        if scale < 1.0:
+            small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()  # The worker may reuse the frame's buffer
+        for x1, y1, x2, y2 in boxes:
+            cv2.rectangle(small, (int(x1 * scale), int(y1 * scale)), (int(x2 * scale), int(y2 * scale)), (0, 255, 0), 2)
+        if label:
+            cv2.putText(small, label, (8, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+        with self._lock:
+            self._frame = small
+
+    def take_frame(self):
+        """The newest preview frame since the last call, or None"""
+        with self._lock:
+            frame, self._frame = self._frame, None
+        return frame
+
+    def drain(self):
+        """All queued updates, oldest first"""
+        updates = []
+        while True:
+            try:
+                updates.append(self.queue.get_nowait())
+            except queue.Empty:
+                return updates
+
+def format_eta(seconds):
+    if seconds is None:
+        return "estimating..."
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
 
 class MissingPersonDetectionApp:
     def __init__(self, root):
@@ -22,18 +98,26 @@ class MissingPersonDetectionApp:
         # Variables
         self.ref_files = []
         self.video_files = []
-        self.detection_threshold = tk.DoubleVar(value=0.65)
+        self.detection_threshold = tk.DoubleVar(value=config.FACE_THRESH)
         self.frame_interval = tk.IntVar(value=60)
         self.use_gpu = tk.BooleanVar(value=torch.cuda.is_available())
         self.running = False
+        self.stop_event = threading.Event()  # Set to cancel running pipelines
         self.status_text = tk.StringVar(value="Ready")
         self.start_time = None  # To track the start time of detection
         self.num_detections = 0  # To count the number of detections
+        self.face_scores = None  # Stored scores of the last run, to preview other thresholds
+        self.violence_scores = None
+        self.threshold_effect = tk.StringVar(value="")
+        self.results = ResultsDB() if config.RESULTS_DB else None
+        self.results_run = None  # ResultsRun of the last run, for the results browser
+        self.updates = LiveUpdates()  # Filled by the detection thread, drained by poll_updates
         
         # Create UI
         self.create_header()
         self.create_main_frame()
         self.create_status_bar()
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
         
     def create_header(self):
         header_frame = tk.Frame(self.root, bg="#2c3e50", height=60)
@@ -116,9 +200,11 @@ class MissingPersonDetectionApp:
             to=0.95,
             resolution=0.01,
             orient=tk.HORIZONTAL,
-            bg="#f5f5f5"
+            bg="#f5f5f5",
+            command=self.preview_threshold
         )
         threshold_slider.pack(fill=tk.X)
+        tk.Label(threshold_frame, textvariable=self.threshold_effect, bg="#f5f5f5", fg="#7f8c8d").pack(anchor=tk.W)
 
         # Frame interval slider
         interval_frame = tk.Frame(parent, bg="#f5f5f5")
@@ -151,11 +237,22 @@ class MissingPersonDetectionApp:
             pady=10
         )
         self.run_button.pack(fill=tk.X, pady=5)
+
+        if self.results is not None:
+            tk.Button(
+                action_frame,
+                text="Browse Results",
+                command=self.show_results_browser,
+                bg="#3498db",
+                fg="white",
+                font=("Arial", 12),
+                pady=5
+            ).pack(fill=tk.X, pady=5)
         
         exit_button = tk.Button(
             action_frame,
             text="Exit",
-            command=self.root.destroy,
+            command=self.exit_app,
             bg="#e74c3c",
             fg="white",
             font=("Arial", 12),
@@ -229,6 +326,17 @@ class MissingPersonDetectionApp:
             height=10
         )
         self.preview_label.pack(fill=tk.BOTH, expand=True)
+
+        # Detections of the running job, newest first
+        live_frame = tk.LabelFrame(parent, text="Live Results", bg="#f5f5f5")
+        live_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        columns = ("kind", "video", "time", "score")
+        self.live_results = ttk.Treeview(live_frame, columns=columns, show="headings", height=6)
+        for column, width in zip(columns, (70, 200, 70, 70)):
+            self.live_results.heading(column, text=column.capitalize())
+            self.live_results.column(column, width=width, anchor=tk.W)
+        self.live_results.pack(fill=tk.BOTH, expand=True)
         
     def create_status_bar(self):
         status_frame = tk.Frame(self.root, bg="#ecf0f1", height=30)
@@ -237,7 +345,8 @@ class MissingPersonDetectionApp:
         self.progress_bar = ttk.Progressbar(
             status_frame,
             orient=tk.HORIZONTAL,
-            mode='indeterminate'
+            mode='determinate',
+            maximum=1.0
         )
         self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10, pady=5)
         
@@ -303,13 +412,80 @@ class MissingPersonDetectionApp:
 
         # Start detection in a separate thread
         self.running = True
+        self.stop_event.clear()
+        self.face_scores = self.violence_scores = None
+        self.threshold_effect.set("")
         self.run_button.config(state=tk.DISABLED)
-        self.progress_bar.start()
+        self.progress_bar.config(value=0)
+        self.live_results.delete(*self.live_results.get_children())
         self.status_text.set("Processing...")
+        self.updates.drain()  # Leftovers of a cancelled run
         
         detection_thread = threading.Thread(target=self.execute_detection)
         detection_thread.daemon = True
         detection_thread.start()
+        self.root.after(config.UI_POLL_MS, self.poll_updates)
+
+    def poll_updates(self):
+        """Apply the detection thread's updates on the Tk thread; reschedules itself until the run ends"""
+        progress = None
+        for update in self.updates.drain():
+            kind = update[0]
+            if kind == "status":
+                self.status_text.set(update[1])
+            elif kind == "progress":
+                progress = update[1:]  # Only the latest one is shown
+            elif kind == "detection":
+                self.live_results.insert("", 0, values=update[1:])
+                rows = self.live_results.get_children()
+                if len(rows) > config.UI_LIVE_ROWS:
+                    self.live_results.delete(*rows[config.UI_LIVE_ROWS:])
+            elif kind == "complete":
+                self.detection_complete()
+            elif kind == "error":
+                self.detection_error(update[1])
+
+        if progress is not None and self.running:
+            phase, done, total, eta = progress
+            self.progress_bar.config(value=min(done / total, 1.0))
+            self.status_text.set(f"{phase}: {done}/{total} frames ({done / total:.0%}), ETA {format_eta(eta)}")
+
+        frame = self.updates.take_frame()
+        if frame is not None:
+            photo = ImageTk.PhotoImage(Image.fromarray(frame))
+            self.preview_label.config(image=photo, text="")
+            self.preview_label.image = photo  # Keep a reference
+
+        if self.running:
+            self.root.after(config.UI_POLL_MS, self.poll_updates)
+
+    def face_callbacks(self, video_file, eta):
+        """on_progress and on_detections for process_video that post to the UI instead of drawing"""
+        def on_progress(frames_done):
+            eta.update(video_file, frames_done)
+            self.updates.post("progress", "Faces", eta.done_frames, eta.total_frames, eta.eta_seconds())
+
+        def on_detections(batch_info, detections):
+            for det in detections:
+                self.updates.post("detection", "Face", det['video_filename'], f"{det['time']:.2f}",
+                                  f"{det['similarity']:.3f}")
+            if not self.updates.frame_due():
+                return
+            # Prefer the batch's best match as the preview frame
+            best = max(detections, key=lambda d: d['similarity'], default=None)
+            frame_idx = best['frame_idx'] if best else batch_info[-1][0]
+            frame = best['frame_img'] if best else batch_info[-1][2]
+            boxes = [det['box'] for det in detections if det['frame_idx'] == frame_idx]
+            self.updates.offer_frame(frame, boxes)
+
+        return on_progress, on_detections
+
+    def violence_progress(self, video_file, eta):
+        """on_progress for detect_violence_in_video"""
+        def on_progress(frames_done):
+            eta.update(video_file, frames_done)
+            self.updates.post("progress", "Violence", eta.done_frames, eta.total_frames, eta.eta_seconds())
+        return on_progress
     
     def execute_detection(self):
         try:
@@ -328,95 +504,165 @@ class MissingPersonDetectionApp:
             device, mtcnn, resnet = setup_missing_person_detection()
         
             # Update status
-            self.root.after(0, lambda: self.status_text.set("Loading models..."))
-        
+            self.updates.post("status", "Loading models...")
+
+            gallery = None
             if mode in ["Full Pipeline", "Missing Person Only"]:
-                # Instead of calling load_reference_images(), process the selected files directly
-                ref_embeddings = []
-            
                 # Update status
-                self.root.after(0, lambda: self.status_text.set("Processing reference images..."))
-            
-                # Process reference images (adapted from your load_reference_images function)
-                for ref_filename in self.ref_files:
-                    ref_img = Image.open(ref_filename).convert("RGB")
-                    faces, probs = mtcnn(ref_img, return_prob=True)
-                    if faces is None or (hasattr(faces, '__len__') and len(faces) == 0):
-                        continue
-                    
-                    # Use highest probability face if multiple are detected
-                    ref_face = faces[int(np.argmax(probs))] if faces.ndim == 4 else faces
-                    with torch.no_grad():
-                        emb = resnet(
-                            ref_face.unsqueeze(0).to(device).half() if device.type=='cuda'
-                            else ref_face.unsqueeze(0).to(device)
-                        )
-                    ref_embeddings.append(emb)
-            
-                if not ref_embeddings:
+                self.updates.post("status", "Processing reference images...")
+
+                # Embed all reference faces in one batch (cached across runs)
+                gallery = ReferenceGallery(mtcnn, resnet, device).load(self.ref_files)
+                if not len(gallery):
                     raise Exception("No valid faces detected in the reference images.")
-                
-                # Convert reference embeddings to half precision if on GPU
-                if device.type == 'cuda':
-                    ref_embeddings = [emb.half() for emb in ref_embeddings]
+
+            # Detections go to the results database as they are found, not into lists of frames.
+            # Sightings name their reference by template index, i.e. by position in gallery.filenames
+            run = None
+            if self.results is not None:
+                run = self.results.start_run("ui", {"threshold": threshold, "frame_interval": frame_interval},
+                                             references=gallery.filenames if gallery is not None else None)
+                self.results_run = run
+
+            # Frame counts from the index give real progress and an ETA per phase
+            video_index = VideoIndex()
+            metadata = {vf: video_index.get(vf) for vf in self.video_files}
+        
+            if gallery is not None:
+                ref_embeddings = gallery.templates
+                face_score_store = FaceScoreStore(gallery.filenames) if config.SCORE_STORE else None
                 
                 # Process each video
                 all_detections = []
-                for video_file in self.video_files:
-                    self.root.after(0, lambda v=video_file: self.status_text.set(f"Processing video: {os.path.basename(v)}..."))
+                attribute_store = AttributeStore() if config.ATTRIBUTE_INDEX else None
+                embedding_store = FaceEmbeddingStore() if config.EMBEDDING_INDEX else None
+                quality_gate = FaceQualityGate(image_size=mtcnn.image_size) if config.FACE_QUALITY_GATE else None
+                eta = ProgressETA(list(metadata.values()))
+                with prefetching(self.video_files) as prefetcher:
+                    for video_file in self.video_files:
+                        if self.stop_event.is_set():
+                            break
+                        mark_opened(prefetcher, video_file)
+                        self.updates.post("status", f"Processing video: {os.path.basename(video_file)}...")
                 
-                    # Call your process_video function with our parameters
-                    detections = process_video(
-                        video_file, 
-                        mtcnn, 
-                        resnet, 
-                        device, 
-                        ref_embeddings, 
-                        frame_interval=frame_interval,
-                        detection_threshold=threshold
-                        # display_video=self.display_video.get()  # Pass the flag
-                    )
-                    all_detections.extend(detections)
-                    self.num_detections += len(detections)  # Update the detection count
+                        # Frames are drawn by poll_updates from throttled, downscaled copies, not on this thread
+                        on_progress, on_detections = self.face_callbacks(video_file, eta)
+                        detections = process_video(
+                            video_file, 
+                            mtcnn, 
+                            resnet, 
+                            device, 
+                            ref_embeddings, 
+                            frame_interval=frame_interval,
+                            detection_threshold=threshold,
+                            stop_event=self.stop_event,
+                            attribute_store=attribute_store,
+                            embedding_store=embedding_store,
+                            quality_gate=quality_gate,
+                            score_store=face_score_store,
+                            results=run,
+                            metadata=metadata[video_file],
+                            preview=False,
+                            on_progress=on_progress,
+                            on_detections=on_detections
+                        )
+                        if not self.stop_event.is_set():
+                            on_progress(metadata[video_file].frame_count)
+                        all_detections.extend(detections)
+                        self.num_detections += len(detections)  # Update the detection count
+
+                if attribute_store is not None:
+                    attribute_store.flush()
+                if embedding_store is not None:
+                    embedding_store.flush()
+                if quality_gate is not None:
+                    print(quality_gate.summary())
+                if face_score_store is not None:
+                    face_score_store.flush()
+                    self.face_scores = FaceScores(face_score_store, videos=self.video_files)
+                if run is not None:
+                    run.flush()
+                    all_detections = run.sightings(order="similarity")
+                    self.num_detections += len(all_detections)
                 
                 # Export results    
                 if all_detections:
-                    self.root.after(0, lambda: self.status_text.set("Generating report..."))
-                    all_detections.sort(key=lambda x: x['similarity'], reverse=True)
-                    export_to_pdf(all_detections, ref_filenames=self.ref_files)
+                    self.updates.post("status", "Generating report...")
+                    if run is None:
+                        all_detections.sort(key=lambda x: x['similarity'], reverse=True)
+                    export_to_pdf(all_detections, ref_filenames=gallery.filenames)
                 
             if mode in ["Full Pipeline", "Violence Only"]:
                 # Violence detection part
-                self.root.after(0, lambda: self.status_text.set("Detecting violence..."))
+                self.updates.post("status", "Detecting violence...")
             
                 # Load violence model
                 model = load_violence_detection_model(device)
+                violence_score_store = ViolenceScoreStore() if config.SCORE_STORE else None
             
                 # Process each video
-                for video_file in self.video_files:
-                    self.root.after(0, lambda v=video_file: self.status_text.set(f"Checking violence in: {os.path.basename(v)}..."))
-                    violence_detections = detect_violence_in_video(
-                        video_file, 
-                        model, 
-                        device, 
-                        threshold=threshold
-                        # display_video=self.display_video.get()  # Pass the flag
-                    )
-                    self.num_detections += len(violence_detections)  # Update the detection count
-                
-                    if violence_detections:
-                        export_violence_report(violence_detections, video_file)
+                eta = ProgressETA(list(metadata.values()))
+                with prefetching(self.video_files) as prefetcher:
+                    for video_file in self.video_files:
+                        if self.stop_event.is_set():
+                            break
+                        self.updates.post("status", f"Checking violence in: {os.path.basename(video_file)}...")
+                        mark_opened(prefetcher, video_file)
+                        violence_detections = detect_violence_in_video(
+                            video_file, 
+                            model, 
+                            device, 
+                            threshold=threshold,
+                            stop_event=self.stop_event,
+                            score_store=violence_score_store,
+                            metadata=metadata[video_file],
+                            preview=False,
+                            on_progress=self.violence_progress(video_file, eta)
+                        )
+                        self.num_detections += len(violence_detections)  # Update the detection count
+                        self.violence_progress(video_file, eta)(metadata[video_file].frame_count)
+                        for det in violence_detections:
+                            self.updates.post("detection", "Violence", os.path.basename(video_file),
+                                              f"{det['time']:.2f}", f"{det['probability']:.3f}")
+                        if violence_detections:
+                            # Keyframe of the most likely event, through the same throttle as face previews
+                            peak = max(violence_detections, key=lambda d: d['probability'])
+                            self.updates.offer_frame(peak['thumbnail'], label=f"Violence {peak['probability']:.2f}")
+                        if run is not None:
+                            run.add_violence_events(video_file, violence_detections, metadata[video_file],
+                                                    camera_name(video_file))
                 
-            self.root.after(0, self.detection_complete)
+                        if violence_detections:
+                            export_violence_report(violence_detections, video_file)
+
+                if violence_score_store is not None:
+                    violence_score_store.flush()
+                    self.violence_scores = ViolenceScores(violence_score_store, videos=self.video_files)
+
+            if run is not None:
+                run.finish()
+            self.updates.post("complete")
             
         except Exception as e:
-            self.root.after(0, lambda: self.detection_error(str(e)))
+            self.updates.post("error", str(e))
     
+    def preview_threshold(self, value=None):
+        """Show how many detections the last run would give at the slider's threshold, from its stored scores"""
+        threshold = self.detection_threshold.get()
+        counts = []
+        if self.face_scores is not None:
+            counts.append(f"{self.face_scores.count(threshold)} face matches")
+        if self.violence_scores is not None:
+            counts.append(f"{self.violence_scores.count(threshold)} violence events")
+        if counts:
+            self.threshold_effect.set(f"Last run at {threshold:.2f}: " + ", ".join(counts))
+
     def detection_complete(self):
-        self.progress_bar.stop()
+        self.progress_bar.config(value=self.progress_bar["maximum"])
         self.running = False
         self.run_button.config(state=tk.NORMAL)
         self.status_text.set("Detection completed")
+        self.preview_threshold()
 
          # Calculate the time taken
         time_taken = time.time() - self.start_time
@@ -438,6 +684,59 @@ class MissingPersonDetectionApp:
         else:
             messagebox.showinfo("Complete", f"Detection process completed successfully.\nTime taken: {time_taken_str}\nNumber of detections: {self.num_detections}")
 
+    def show_results_browser(self, page_size=50):
+        """Page through the sightings and violence events of the last run (or the latest stored run)"""
+        run_id = self.results_run.id if self.results_run is not None else None
+        if run_id is None:
+            runs = self.results.runs(limit=1)
+            if not runs:
+                messagebox.showinfo("Results", "No results stored yet.")
+                return
+            run_id = runs[0]["id"]
+
+        window = tk.Toplevel(self.root)
+        window.title(f"Results of run {run_id}")
+        window.geometry("760x480")
+        window.configure(bg="#f5f5f5")
+
+        controls = tk.Frame(window, bg="#f5f5f5", pady=5)
+        controls.pack(fill=tk.X, padx=10)
+        kind = tk.StringVar(value="Sightings")
+        ttk.Combobox(controls, textvariable=kind, values=["Sightings", "Violence"], state="readonly",
+                     width=12).pack(side=tk.LEFT)
+        page_text = tk.StringVar()
+        tk.Label(controls, textvariable=page_text, bg="#f5f5f5").pack(side=tk.LEFT, padx=10)
+
+        columns = ("camera", "video", "time", "score", "reference")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for column, width in zip(columns, (100, 260, 80, 80, 200)):
+            tree.heading(column, text=column.capitalize())
+            tree.column(column, width=width, anchor=tk.W)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        state = {"offset": 0, "total": 0}
+
+        def show(offset):
+            # Only the visible page is read; counts and ordering come from the database indexes
+            if kind.get() == "Sightings":
+                results = self.results.sightings(run_id, order="similarity")
+            else:
+                results = self.results.violence_events(run_id, order="probability")
+            state["total"] = len(results)
+            state["offset"] = max(0, min(offset, max(state["total"] - 1, 0) // page_size * page_size))
+            tree.delete(*tree.get_children())
+            for det in results.page(state["offset"], page_size):
+                score = det.get("similarity", det.get("probability"))
+                tree.insert("", tk.END, values=(det["camera"] or "", det["video_filename"], f"{det['time']:.2f}",
+                                                f"{score:.3f}", det.get("reference") or ""))
+            last = min(state["offset"] + page_size, state["total"])
+            page_text.set(f"{state['offset'] + 1 if state['total'] else 0}-{last} of {state['total']}")
+
+        kind.trace_add("write", lambda *_: show(0))
+        tk.Button(controls, text="Next", command=lambda: show(state["offset"] + page_size)).pack(side=tk.RIGHT)
+        tk.Button(controls, text="Prev", command=lambda: show(state["offset"] - page_size)).pack(side=tk.RIGHT)
+        show(0)
+
     def show_pdf_viewer(self, pdf_files):
         """Display a window with buttons to open available PDF reports"""
         pdf_window = tk.Toplevel(self.root)
@@ -511,8 +810,13 @@ class MissingPersonDetectionApp:
         except Exception as e:
             messagebox.showerror("Error", f"Could not open PDF: {e}")
     
+    def exit_app(self):
+        """Cancel any running detection pipeline and close the window"""
+        self.stop_event.set()
+        self.root.destroy()
+
     def detection_error(self, error_msg):
-        self.progress_bar.stop()
+        self.progress_bar.config(value=0)
         self.running = False
         self.run_button.config(state=tk.NORMAL)
         self.status_text.set("Error")
@@ -0,0 +1,186 @@
+import os, json, time, shutil, hashlib, subprocess, threading
+from dataclasses import dataclass, fields, asdict
+import cv2
+
+from config import config
+
+### VIDEO METADATA INDEX
+
+HASH_CHUNK = 1 << 20  # Bytes hashed from the start, middle and end of a file
+
+@dataclass
+class VideoMetadata:
+    path: str
+    size: int
+    mtime: float
+    content_hash: str
+    fps: float
+    frame_count: int
+    duration: float
+    width: int
+    height: int
+    codec: str
+
+    def as_probe(self):
+        """(fps, frame_count, width, height) as expected by the decoders"""
+        return self.fps, self.frame_count, self.width, self.height
+
+    @property
+    def start_time(self):
+        """Wall-clock start of the recording, assuming the file was closed when recording ended"""
+        return self.mtime - self.duration
+
+
+def camera_name(video_path):
+    """Camera a video came from: the name of the directory its files are dropped into"""
+    return os.path.basename(os.path.dirname(os.path.abspath(video_path)))
+
+def content_hash(path, size=None):
+    """
+    Hash a video's size plus its first, middle and last megabyte.
+    Reading whole multi-gigabyte files would cost as much as decoding them,
+    and any re-encode or truncation changes at least one sampled chunk.
+    """
+    size = os.path.getsize(path) if size is None else size
+    h = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(size // 2 - HASH_CHUNK // 2, 0), max(size - HASH_CHUNK, 0)}):
+            f.seek(offset)
+            h.update(f.read(HASH_CHUNK))
+    return h.hexdigest()
+
+def _probe_ffprobe(path):
+    """Probe stream info with ffprobe; only the container header is read"""
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=codec_name,width,height,avg_frame_rate,nb_frames,duration",
+         "-of", "json", path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    stream = json.loads(out)["streams"][0]
+    num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+    fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+    duration = float(stream.get("duration", 0) or 0)
+    frame_count = int(stream.get("nb_frames", 0) or 0) or int(round(duration * fps))
+    return fps, frame_count, duration, int(stream["width"]), int(stream["height"]), stream.get("codec_name", "")
+
+def _probe_opencv(path):
+    """Probe stream info with OpenCV"""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    cap.release()
+    codec = "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\x00 ")
+    duration = frame_count / fps if fps else 0.0
+    return fps, frame_count, duration, width, height, codec
+
+def probe(path):
+    """Probe a video file and return its VideoMetadata"""
+    stat = os.stat(path)
+    info = None
+    if shutil.which("ffprobe"):
+        try:
+            info = _probe_ffprobe(path)
+        except (subprocess.CalledProcessError, KeyError, IndexError, ValueError):
+            info = None
+    if info is None:
+        info = _probe_opencv(path)
+    fps, frame_count, duration, width, height, codec = info
+    if not fps:
+        fps = 30.0
+    return VideoMetadata(
+        path=os.path.abspath(path),
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        content_hash=content_hash(path, stat.st_size),
+        fps=fps,
+        frame_count=frame_count,
+        duration=duration or frame_count / fps,
+        width=width,
+        height=height,
+        codec=codec
+    )
+
+
+class VideoIndex:
+    """
+    Persistent cache of video metadata, stored as JSON.
+    Each file is probed once; entries are re-probed only when the file's
+    size or modification time changes.
+    """
+    def __init__(self, index_path=None):
+        self.index_path = index_path or os.path.join(config.INDEX_DIR, "video_index.json")
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                # Fields no longer probed are dropped rather than failing the load
+                names = {f.name for f in fields(VideoMetadata)}
+                self._entries = {k: VideoMetadata(**{n: v[n] for n in names if n in v})
+                                 for k, v in json.load(f).items()}
+
+    def get(self, path):
+        """Return metadata for `path`, probing and saving it if needed"""
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        with self._lock:
+            meta = self._entries.get(key)
+        if meta is not None and meta.size == stat.st_size and meta.mtime == stat.st_mtime:
+            return meta
+
+        meta = probe(key)
+        with self._lock:
+            self._entries[key] = meta
+        self.save()
+        return meta
+
+    def get_many(self, paths):
+        return [self.get(p) for p in paths]
+
+    def save(self):
+        """Write the index atomically"""
+        with self._lock:
+            data = {k: asdict(v) for k, v in self._entries.items()}
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    def schedule(self, paths):
+        """Order videos longest first, so long files don't start last and stall the run"""
+        return sorted(paths, key=lambda p: self.get(p).duration, reverse=True)
+
+
+class ProgressETA:
+    """Estimate remaining time from the frame counts in the index"""
+    def __init__(self, metadata):
+        self.total_frames = sum(m.frame_count for m in metadata) or 1
+        self.start_time = time.time()
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def update(self, video_path, frames_done):
+        """Record how many source frames of `video_path` have been processed"""
+        with self._lock:
+            self._done[video_path] = frames_done
+
+    @property
+    def done_frames(self):
+        with self._lock:
+            return sum(self._done.values())
+
+    @property
+    def fraction(self):
+        return min(self.done_frames / self.total_frames, 1.0)
+
+    def eta_seconds(self):
+        """Seconds left at the throughput seen so far, or None before the first update"""
+        done = self.done_frames
+        if not done:
+            return None
+        rate = done / (time.time() - self.start_time)
+        return max(self.total_frames - done, 0) / rate
@@ -0,0 +1,121 @@
+import os, csv, argparse, threading
+import numpy as np
+import torch
+
+from config import config
+
+### MOTION-ENERGY PRE-CLASSIFIER
+
+def motion_energy(clips, pixel_threshold=15, subsample=2):
+    """
+    Cheap per-clip motion score for a (N,T,H,W,3) uint8 batch: the fraction of
+    pixels whose grey level changes by more than `pixel_threshold` between
+    consecutive frames, averaged over the clip. Static scenes score ~0.
+    """
+    clips = np.asarray(clips)[:, :, ::subsample, ::subsample]
+    grey = clips.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    diffs = np.abs(np.diff(grey, axis=1))
+    return (diffs > pixel_threshold).mean(axis=(1, 2, 3))
+
+
+class MotionEnergyGate:
+    """
+    First stage of the violence cascade: only windows whose motion energy
+    reaches `pass_threshold` are sent to the 3D CNN. Keeps pass-through counts.
+    """
+    def __init__(self, pass_threshold=None, pixel_threshold=15):
+        self.pass_threshold = config.VIOLENCE_CASCADE_THRESH if pass_threshold is None else pass_threshold
+        self.pixel_threshold = pixel_threshold
+        self.total = 0
+        self.passed = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, clips):
+        """Return a boolean mask of the clips that pass to the full model"""
+        mask = motion_energy(clips, self.pixel_threshold) >= self.pass_threshold
+        with self._lock:
+            self.total += len(mask)
+            self.passed += int(mask.sum())
+        return mask
+
+    @property
+    def pass_rate(self):
+        return self.passed / self.total if self.total else 0.0
+
+    def summary(self):
+        return f"Cascade: {self.passed}/{self.total} clips passed to r3d_18 ({self.pass_rate:.1%})"
+
+
+### EVALUATION ON A LABELLED SET
+
+def load_labels(labels_path):
+    """Read `video_path,label` rows (label 1 = violent); relative paths are resolved against the CSV"""
+    base = os.path.dirname(os.path.abspath(labels_path))
+    with open(labels_path, newline="") as f:
+        return [(os.path.join(base, row[0]), int(row[1])) for row in csv.reader(f)
+                if row and not row[0].startswith("#")]
+
+def evaluate_cascade(labels_path, model, device, pass_thresholds, threshold=0.65, clip_length=16, overlap=8):
+    """
+    Score every clip of a labelled set with both the gate and the full model,
+    then report for each pass-through threshold:
+      - the fraction of clips the gate sends to r3d_18,
+      - the fraction of clips the full model flags that the gate would drop,
+      - video-level recall on violent videos with and without the cascade.
+    """
+    from violence_detection import iter_video_clips, score_clips
+
+    per_video = []
+    for video_path, label in load_labels(labels_path):
+        energies, probs = [], []
+        batch = []
+        for clip, _, _ in iter_video_clips(video_path, clip_length, overlap):
+            batch.append(clip)
+            if len(batch) == config.VIOLENCE_BATCH_SIZE:
+                energies.append(motion_energy(batch))
+                probs.append(score_clips(batch, model, device))
+                batch = []
+        if batch:
+            energies.append(motion_energy(batch))
+            probs.append(score_clips(batch, model, device))
+        if energies:
+            per_video.append((label, np.concatenate(energies), np.concatenate(probs)))
+        print(f"Scored {os.path.basename(video_path)}")
+
+    if not per_video:
+        print("No clips found in the labelled set.")
+        return []
+
+    violent = [v for v in per_video if v[0] == 1]
+    full_recall = np.mean([(p > threshold).any() for _, _, p in violent]) if violent else float("nan")
+    results = []
+    print(f"\n{'pass thr':>9} {'pass rate':>10} {'flagged dropped':>16} {'recall':>8} {'full recall':>12}")
+    for pass_threshold in pass_thresholds:
+        total = sum(len(e) for _, e, _ in per_video)
+        passed = sum(int((e >= pass_threshold).sum()) for _, e, _ in per_video)
+        flagged = sum(int((p > threshold).sum()) for _, _, p in per_video)
+        dropped = sum(int(((p > threshold) & (e < pass_threshold)).sum()) for _, e, p in per_video)
+        recall = (np.mean([((p > threshold) & (e >= pass_threshold)).any() for _, e, p in violent])
+                  if violent else float("nan"))
+        row = {
+            "pass_threshold": pass_threshold,
+            "pass_rate": passed / total,
+            "flagged_dropped": dropped / flagged if flagged else 0.0,
+            "recall": recall,
+            "full_recall": full_recall,
+        }
+        results.append(row)
+        print(f"{pass_threshold:>9.3f} {row['pass_rate']:>10.1%} {row['flagged_dropped']:>16.1%} "
+              f"{recall:>8.1%} {full_recall:>12.1%}")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the motion-energy cascade on a labelled video set")
+    parser.add_argument("labels", help="CSV of video_path,label (1 = violent)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.005, 0.01, 0.02, 0.05, 0.1])
+    parser.add_argument("--threshold", type=float, default=config.VIOLENCE_THRESH)
+    args = parser.parse_args()
+
+    from violence_detection import load_violence_detection_model
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    evaluate_cascade(args.labels, load_violence_detection_model(device), device, args.thresholds, args.threshold)
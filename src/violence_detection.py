@@ -7,11 +7,26 @@ from PIL import Image
 import torchvision.models.video as models
 import torchvision.transforms as transforms
 import torch.nn as nn
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Import from your custom modules
+from collections import OrderedDict
+import threading
+
+from config import config
 from utils import select_files
+from decoders import open_decoder, read_frame_at, probe_video
+from pipeline import StagedPipeline, PipelineStage
+from violence_events import segment_events, EventTimeline
+from violence_cascade import MotionEnergyGate
+from video_index import VideoIndex, camera_name
+from checkpoint import JobCheckpoint
 from report_generation import export_violence_report
+from tensor_pool import tensor_pool, clips_into
+from calibration import ViolenceScoreStore
+from roi import roi_for, roi_signature
+from results_db import ResultsDB
+from prefetch import prefetching, mark_opened
+from resources import governor
 
 ### SECTION 3: VIOLENCE DETECTION
 
@@ -26,6 +41,105 @@ class ViolenceDetectionModel(nn.Module):
     def forward(self, x):
         return self.base_model(x)
 
+class FeatureRingBuffer:
+    """Fixed-capacity cache of recent chunk features; the oldest entries are evicted first"""
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+
+class SharedFeatureViolenceModel(nn.Module):
+    """
+    Violence model that runs the r3d_18 backbone once per short chunk of
+    frames and classifies each window with a lightweight temporal head
+    (mean of its chunk features followed by the classifier layer).
+    Chunk features are cached in a ring buffer keyed by source frame range,
+    so overlapping windows only pay for the head.
+    """
+    def __init__(self, base=None, chunk_length=8, cache_size=256):
+        super(SharedFeatureViolenceModel, self).__init__()
+        self.base = base if base is not None else ViolenceDetectionModel()
+        self.chunk_length = chunk_length
+        self.cache = FeatureRingBuffer(cache_size)
+
+    def features(self, x):
+        """Backbone features (N,512) for chunks of shape (N,3,T,H,W)"""
+        net = self.base.base_model
+        x = net.stem(x)
+        x = net.layer4(net.layer3(net.layer2(net.layer1(x))))
+        return net.avgpool(x).flatten(1)
+
+    def head(self, chunk_features):
+        """Classify windows from their (N,C,512) chunk features"""
+        return self.base.base_model.fc(chunk_features.mean(dim=1))
+
+    def _chunks(self, x):
+        t = x.shape[2]
+        return [x[:, :, i:i + self.chunk_length] for i in range(0, t - self.chunk_length + 1, self.chunk_length)]
+
+    def forward(self, x):
+        # Uncached path: same input and output as ViolenceDetectionModel
+        chunks = self._chunks(x)
+        feats = self.features(torch.cat(chunks, dim=0)).reshape(len(chunks), x.shape[0], -1)
+        return self.head(feats.transpose(0, 1))
+
+    def forward_cached(self, x, spans, stream):
+        """
+        Classify windows (N,3,T,H,W) whose frames cover the source ranges in
+        `spans` [(first, last), ...]; `stream` identifies the video.
+        """
+        num_chunks = x.shape[2] // self.chunk_length
+        keys, found, missing = [], {}, {}
+        for n, (first, last) in enumerate(spans):
+            frame_step = (last - first) / max(x.shape[2] - 1, 1)
+            for c in range(num_chunks):
+                chunk_first = first + int(round(c * self.chunk_length * frame_step))
+                chunk_last = first + int(round(((c + 1) * self.chunk_length - 1) * frame_step))
+                key = (stream, chunk_first, chunk_last)
+                keys.append(key)
+                if key in found or key in missing:
+                    continue
+                feat = self.cache.get(key)
+                if feat is None:
+                    missing[key] = (n, c)
+                else:
+                    found[key] = feat
+
+        if missing:
+            # Compute every uncached chunk in one backbone pass
+            batch = torch.stack([
+                x[n, :, c * self.chunk_length:(c + 1) * self.chunk_length] for n, c in missing.values()
+            ])
+            for key, feat in zip(missing, self.features(batch)):
+                self.cache.put(key, feat)
+                found[key] = feat
+
+        feats = torch.stack([found[key] for key in keys]).reshape(len(spans), num_chunks, -1)
+        return self.head(feats)
+
 def preprocess_clip(clip):
     """Preprocess video clip for violence detection"""
     transform = transforms.Compose([
@@ -45,83 +159,313 @@ def preprocess_clip(clip):
 
     return clip_tensor
 
-def extract_video_clips(video_path, clip_length=16, overlap=8):
-    """Extract clips from a video with optional overlap"""
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
+def iter_video_clips(video_path, clip_length=16, overlap=8, frame_step=1, start_frame=0, end_frame=None,
+                     backend=None, size=None, fps=None, metadata=None, roi=None):
+    """
+    Yield (clip, first_frame_idx, last_frame_idx) for clips of `clip_length` frames.
+    Frames are decoded straight into preallocated clip arrays of shape
+    (clip_length, H, W, 3); the overlapping tail of each clip is copied into
+    the next one instead of being decoded again. `frame_step` samples every
+    n-th frame, and decoding can be limited to [start_frame, end_frame).
+    With a `roi` (RegionOfInterest), frames are cropped to it before scaling
+    and pixels outside its regions are blacked out.
+    """
+    probe = metadata.as_probe() if metadata is not None else probe_video(video_path)
+    crop = roi.layout(probe[2], probe[3])[0] if roi is not None else None
+    decoder = open_decoder(
+        video_path,
+        backend=backend or config.VIOLENCE_DECODER,
+        size=size if size is not None else config.VIOLENCE_DECODE_SIZE,
+        frame_step=frame_step,
+        fps=fps if fps is not None else config.VIOLENCE_DECODE_FPS,
+        metadata=probe,
+        start_frame=start_frame,
+        crop=crop
+    )
+    mask = roi.output_mask(probe[2], probe[3], decoder.width, decoder.height) if roi is not None else None
+    step = clip_length - overlap if 0 < overlap < clip_length else clip_length
+
+    clip = np.empty((clip_length, decoder.height, decoder.width, 3), dtype=np.uint8)
+    frame_indices = []
+    filled = 0
+    try:
+        while True:
+            frame_idx = decoder.read_into(clip[filled])
+            if frame_idx is None or (end_frame is not None and frame_idx >= end_frame):
+                break
+            if mask is not None:
+                np.bitwise_and(clip[filled], mask[..., None], out=clip[filled])
+            frame_indices.append(frame_idx)
+            filled += 1
+
+            if filled == clip_length:
+                yield clip, frame_indices[0], frame_indices[-1]
 
+                next_clip = np.empty_like(clip)
+                keep = clip_length - step
+                if keep > 0:
+                    next_clip[:keep] = clip[step:]
+                clip = next_clip
+                frame_indices = frame_indices[step:]
+                filled = keep
+    finally:
+        decoder.close()
+
+def extract_video_clips(video_path, clip_length=16, overlap=8, backend=None, size=None, fps=None, metadata=None):
+    """Extract clips from a video with optional overlap"""
     clips = []
     clip_start_times = []
-    buffer = []
+    for clip, first, _ in iter_video_clips(video_path, clip_length, overlap, backend=backend, size=size, fps=fps, metadata=metadata):
+        clips.append(clip)
+        clip_start_times.append(first)
+    src_fps = metadata.fps if metadata is not None else probe_video(video_path)[0]
+    return clips, clip_start_times, src_fps
 
-    frame_count = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
+def load_violence_detection_model(device, shared_features=None):
+    """Load or create violence detection model"""
+    print("Setting up Violence Detection Model...")
+    governor.apply()
+    shared_features = config.VIOLENCE_SHARED_FEATURES if shared_features is None else shared_features
+    if shared_features:
+        model = SharedFeatureViolenceModel(
+            chunk_length=config.VIOLENCE_FEATURE_CHUNK, cache_size=config.VIOLENCE_FEATURE_CACHE
+        ).to(device)
+    else:
+        model = ViolenceDetectionModel().to(device)
+    model.eval()
+    return model
+
+def score_clips(clips, model, device, spans=None, stream=None):
+    """
+    Return the violence probability of each clip, scoring them in one batched forward pass.
+    With a SharedFeatureViolenceModel, passing each clip's (first, last) source frame
+    `spans` and a `stream` id reuses cached chunk features of overlapping clips.
+    Clips are preprocessed straight into a pooled batch tensor.
+    """
+    batch = clips_into(clips)
+    try:
+        clip_tensor = batch.to(device)
+        with torch.no_grad():
+            if spans is not None and isinstance(model, SharedFeatureViolenceModel):
+                outputs = model.forward_cached(clip_tensor, spans, stream)
+            else:
+                outputs = model(clip_tensor)
+            probabilities = torch.nn.functional.softmax(outputs, dim=1)
+        return probabilities[:, 1].cpu().numpy()  # Assuming class 1 is violence
+    finally:
+        tensor_pool.release(batch)
+
+def detect_violence_in_clip(clip, start_time, fps, model, device, threshold=None):
+    """Detect violence in a single clip (threshold defaults to config.VIOLENCE_THRESH)"""
+    threshold = config.VIOLENCE_THRESH if threshold is None else threshold
+    violence_prob = float(score_clips([clip], model, device)[0])
+    if violence_prob > threshold:
+        time_in_seconds = start_time / fps
+        return {
+            'time': time_in_seconds,
+            'probability': violence_prob,
+            'frame_idx': start_time,
+            'thumbnail': clip[0]  # First frame as thumbnail
+        }
+    return None
+
+def _batched(clip_iter, batch_size):
+    batch = []
+    for item in clip_iter:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def scan_clips(clip_iter, model, device, batch_size=None, stop_event=None, stream=None, gate=None, on_progress=None):
+    """
+    Score clips from `clip_iter` with decoding and inference overlapped.
+    With a `gate` (e.g. MotionEnergyGate), only clips it passes reach the
+    full model; the rest score 0. `on_progress(frames_done)` is called as
+    batches complete. Returns a list of
+    (first_frame_idx, last_frame_idx, probability).
+    """
+    def score(batch):
+        clips = [clip for clip, _, _ in batch]
+        spans = [(first, last) for _, first, last in batch]
+        keep = gate(clips) if gate is not None else np.ones(len(batch), dtype=bool)
+        probs = np.zeros(len(batch), dtype=np.float32)
+        if keep.any():
+            idx = np.nonzero(keep)[0]
+            probs[idx] = score_clips([clips[i] for i in idx], model, device,
+                                     spans=[spans[i] for i in idx], stream=stream)
+        return [(first, last, float(p)) for (first, last), p in zip(spans, probs)]
+
+    pipeline = StagedPipeline(
+        _batched(clip_iter, batch_size or config.VIOLENCE_BATCH_SIZE),
+        [PipelineStage("score", score, config.VIOLENCE_SCORE_WORKERS)],
+        queue_size=config.PIPELINE_QUEUE_SIZE,
+        stop_event=stop_event,
+        name="violence"
+    )
+    scores = []
+    with pipeline:
+        for batch_scores in pipeline:
+            scores.extend(batch_scores)
+            if on_progress is not None and batch_scores:
+                on_progress(max(last for _, last, _ in batch_scores) + 1)
+    scores.sort()
+    return scores
+
+def interest_regions(scores, interest_threshold, pad, frame_count=None):
+    """Merge padded [first, last] spans of clips scoring above `interest_threshold` into frame ranges"""
+    regions = []
+    for first, last, prob in sorted(scores):
+        if prob < interest_threshold:
+            continue
+        start = max(first - pad, 0)
+        end = last + pad + 1
+        if frame_count:
+            end = min(end, frame_count)
+        if regions and start <= regions[-1][1]:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    return [tuple(r) for r in regions]
+
+def segmented_scan(video_path, model, device, metadata, clip_length=16, overlap=8, frame_step=1, start=0, end=None,
+                   stop_event=None, gate=None, checkpoint=None, label="full", roi=None, on_progress=None):
+    """
+    Scan [start, end) in segments of about CHECKPOINT_SEGMENT_FRAMES frames.
+    Segment boundaries are aligned to the clip stride, so the clips produced
+    are the same as for a single pass. With a `checkpoint`, finished segments
+    are journaled and skipped when a job is resumed. Without an `end` the
+    scan reads to the end of the file: the index's frame count is only the
+    container's estimate, so it places segment boundaries but never cuts
+    off the tail.
+    """
+    step = clip_length - overlap if 0 < overlap < clip_length else clip_length
+    stride = step * frame_step
+    limit = metadata.frame_count if end is None else end
+    if checkpoint is None or not limit or start >= limit:
+        bounds = [(start, end)]
+    else:
+        size = max(config.CHECKPOINT_SEGMENT_FRAMES // stride, 1) * stride
+        bounds = [(s, min(s + size, limit)) for s in range(start, limit, size)]
+        if end is None:
+            bounds[-1] = (bounds[-1][0], None)
+
+    scores = []
+    for seg_start, seg_end in bounds:
+        key = f"{label}:{seg_start}-{'eof' if seg_end is None else seg_end}"
+        cached = checkpoint.segment(metadata.content_hash, key) if checkpoint is not None else None
+        if cached is not None:
+            scores.extend(cached)
+            if on_progress is not None:
+                on_progress(metadata.frame_count if seg_end is None else seg_end)
+            continue
+        # Clips start inside the segment but may run into the next one
+        clip_end = None
+        if seg_end is not None:
+            clip_end = seg_end + (clip_length - step) * frame_step
+            if end is not None:
+                clip_end = min(clip_end, end)
+        seg_scores = scan_clips(
+            iter_video_clips(video_path, clip_length, overlap, frame_step=frame_step,
+                             start_frame=seg_start, end_frame=clip_end, metadata=metadata, roi=roi),
+            model, device, stop_event=stop_event, stream=video_path, gate=gate, on_progress=on_progress
+        )
+        if stop_event is not None and stop_event.is_set():
+            scores.extend(seg_scores)
             break
+        if checkpoint is not None:
+            checkpoint.save_segment(metadata.content_hash, key, seg_scores)
+        scores.extend(seg_scores)
+    return scores
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        buffer.append(rgb_frame)
+def adaptive_clip_scores(video_path, model, device, metadata, clip_length=16, overlap=8, stop_event=None, gate=None, checkpoint=None, roi=None, on_progress=None):
+    """
+    Coarse-to-fine scan:
+      1. Score sparse clips that sample every VIOLENCE_COARSE_FRAME_STEP-th frame
+         without overlap, so each clip covers a wide span of the video.
+      2. Re-scan only the regions scoring above VIOLENCE_INTEREST_THRESH with dense,
+         overlapping, full temporal resolution clips.
+    Progress is reported for the coarse pass, which covers the whole video.
+    Returns (coarse_scores, dense_scores).
+    """
+    coarse_step = config.VIOLENCE_COARSE_FRAME_STEP
+    coarse = segmented_scan(
+        video_path, model, device, metadata, clip_length, overlap=0, frame_step=coarse_step,
+        stop_event=stop_event, gate=gate, checkpoint=checkpoint, label="coarse", roi=roi, on_progress=on_progress
+    )
 
-        if len(buffer) == clip_length:
-            clips.append(buffer.copy())
-            clip_start_times.append(frame_count - clip_length + 1)
+    regions = interest_regions(coarse, config.VIOLENCE_INTEREST_THRESH, pad=clip_length, frame_count=metadata.frame_count)
+    dense = []
+    for start, end in regions:
+        dense.extend(segmented_scan(
+            video_path, model, device, metadata, clip_length, overlap, start=start, end=end,
+            stop_event=stop_event, gate=gate, checkpoint=checkpoint, label="dense", roi=roi
+        ))
 
-            if overlap > 0:
-                buffer = buffer[clip_length - overlap:]
-            else:
-                buffer = []
+    step = clip_length - overlap if 0 < overlap < clip_length else clip_length
+    full_scan = max((metadata.frame_count - clip_length) // step + 1, 1)
+    print(f"Adaptive scan: {len(coarse)} coarse + {len(dense)} dense clips "
+          f"({len(regions)} regions) vs {full_scan} for a dense scan")
+    return coarse, dense
 
-        frame_count += 1
+def detect_violence_in_video(video_path, model, device, threshold=None, metadata=None, adaptive=None, stop_event=None, checkpoint=None, preview=True, score_store=None, on_progress=None):
+    """
+    Detect violence in a video file; `threshold` defaults to config.VIOLENCE_THRESH.
+    With `adaptive` (default config.VIOLENCE_ADAPTIVE) only regions flagged by
+    a sparse coarse pass are scanned densely, and with config.VIOLENCE_CASCADE
+    a motion-energy gate screens clips before r3d_18. Clip scores are ordered,
+    smoothed and segmented with hysteresis into events, each with a start,
+    end, peak probability and a single full-resolution keyframe thumbnail.
+    With a `checkpoint` (JobCheckpoint), scan segments finished by an earlier
+    run are reused instead of re-scored. `preview=False` skips the playback window.
+    With a `score_store` (ViolenceScoreStore), every clip probability is
+    recorded for threshold calibration. Clips only cover the camera's region
+    of interest, if one is configured in ROI_FILE. `on_progress(frames_done)`
+    is called as the scan advances through the video.
+    """
+    threshold = config.VIOLENCE_THRESH if threshold is None else threshold
+    if metadata is None:
+        metadata = VideoIndex().get(video_path)
+    adaptive = config.VIOLENCE_ADAPTIVE if adaptive is None else adaptive
+    fps = metadata.fps
+    gate = MotionEnergyGate() if config.VIOLENCE_CASCADE else None
+    roi = roi_for(camera_name(video_path))
 
-    cap.release()
-    return clips, clip_start_times, fps
+    if adaptive:
+        _, scores = adaptive_clip_scores(video_path, model, device, metadata, stop_event=stop_event, gate=gate,
+                                         checkpoint=checkpoint, roi=roi, on_progress=on_progress)
+    else:
+        scores = segmented_scan(video_path, model, device, metadata, stop_event=stop_event, gate=gate,
+                                checkpoint=checkpoint, roi=roi, on_progress=on_progress)
+    if gate is not None:
+        print(gate.summary())
+    if score_store is not None:
+        score_store.add(camera_name(video_path), os.path.abspath(video_path), metadata.start_time, fps, scores)
 
-def load_violence_detection_model(device):
-    """Load or create violence detection model"""
-    print("Setting up Violence Detection Model...")
-    model = ViolenceDetectionModel().to(device)
-    model.eval()
-    return model
+    violence_detections = segment_events(
+        scores, fps,
+        enter_threshold=threshold,
+        exit_threshold=threshold - config.VIOLENCE_HYSTERESIS,
+        window=config.VIOLENCE_SMOOTHING_WINDOW
+    )
 
-def detect_violence_in_clip(clip, start_time, fps, model, device, threshold=0.65):
-    """Detect violence in a single clip"""
-    clip_tensor = preprocess_clip(clip)
-    clip_tensor = clip_tensor.to(device)
-
-    with torch.no_grad():
-        outputs = model(clip_tensor)
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
-        violence_prob = probabilities[0][1].item()  # Assuming class 1 is violence
-
-        if violence_prob > threshold:
-            time_in_seconds = start_time / fps
-            return {
-                'time': time_in_seconds,
-                'probability': violence_prob,
-                'frame_idx': start_time,
-                'thumbnail': clip[0]  # First frame as thumbnail
-            }
-    return None
+    # Clips are decoded at model resolution; fetch one full-resolution keyframe per event
+    for det in violence_detections:
+        det['thumbnail'] = read_frame_at(video_path, det['peak_frame'])
+    violence_detections = [det for det in violence_detections if det['thumbnail'] is not None]
 
-def detect_violence_in_video(video_path, model, device, threshold=0.65):
-    """Detect violence in a video file using multi-threading"""
-    clips, clip_start_times, fps = extract_video_clips(video_path)
-
-    violence_detections = []
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(detect_violence_in_clip, clip, start_time, fps, model, device, threshold)
-            for clip, start_time in zip(clips, clip_start_times)
-        ]
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                violence_detections.append(result)
+    if preview:
+        preview_events(video_path, violence_detections)
+    return violence_detections
 
+def preview_events(video_path, violence_detections):
+    """Play the video with the detected events overlaid; 'q' closes the window"""
     # Open a window to display the video
     cv2.namedWindow("Violence Detection", cv2.WINDOW_NORMAL)
     cap = cv2.VideoCapture(video_path)
+    timeline = EventTimeline(violence_detections)
     frame_idx = 0
 
     while True:
@@ -130,9 +474,9 @@ def detect_violence_in_video(video_path, model, device, threshold=0.65):
             break
 
         # Display the frame with detection information
-        for det in violence_detections:
-            if det['frame_idx'] == frame_idx:
-                cv2.putText(frame, f"Violence Detected: {det['probability']:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        det = timeline.active(frame_idx)
+        if det is not None:
+            cv2.putText(frame, f"Violence Detected: {det['probability']:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
         cv2.imshow("Violence Detection", frame)
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
@@ -141,22 +485,56 @@ def detect_violence_in_video(video_path, model, device, threshold=0.65):
 
     cap.release()
     cv2.destroyAllWindows()
-    return violence_detections
 
 def run_violence_detection(video_files):
     """Main function to run the violence detection pipeline"""
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model = load_violence_detection_model(device)
 
-    for video_file in video_files:
-        print(f"Analyzing {video_file} for violence...")
-        violence_detections = detect_violence_in_video(video_file, model, device)
+    video_index = VideoIndex()
+    score_store = ViolenceScoreStore() if config.SCORE_STORE else None
+    # Every setting that changes clip scores or events; a resumed run only reuses output computed under them
+    checkpoint = JobCheckpoint("violence", {
+        "shared_features": config.VIOLENCE_SHARED_FEATURES and config.VIOLENCE_FEATURE_CHUNK,
+        "threshold": config.VIOLENCE_THRESH,
+        "hysteresis": config.VIOLENCE_HYSTERESIS,
+        "smoothing": config.VIOLENCE_SMOOTHING_WINDOW,
+        "adaptive": config.VIOLENCE_ADAPTIVE and (config.VIOLENCE_COARSE_FRAME_STEP, config.VIOLENCE_INTEREST_THRESH),
+        "cascade": config.VIOLENCE_CASCADE and config.VIOLENCE_CASCADE_THRESH,
+        "decode": (config.VIOLENCE_DECODER, config.VIOLENCE_DECODE_SIZE, config.VIOLENCE_DECODE_FPS),
+        "roi": roi_signature(),
+    })
+    results = None
+    if config.RESULTS_DB:
+        results = ResultsDB().start_run("violence", {"threshold": config.VIOLENCE_THRESH},
+                                        job_key=os.path.basename(checkpoint.path), resume=checkpoint.resumed)
+    scheduled = video_index.schedule(video_files)
+    pending = [vf for vf in scheduled if not checkpoint.is_done(video_index.get(vf).content_hash)]
+    with prefetching(pending) as prefetcher:
+        for video_file in scheduled:
+            meta = video_index.get(video_file)
+            if checkpoint.is_done(meta.content_hash):
+                print(f"Skipping {video_file}: already analyzed")
+                continue
+            mark_opened(prefetcher, video_file)
+            print(f"Analyzing {video_file} for violence ({meta.duration:.0f}s, {meta.frame_count} frames)...")
+            violence_detections = detect_violence_in_video(video_file, model, device, config.VIOLENCE_THRESH, metadata=meta,
+                                                           checkpoint=checkpoint, score_store=score_store)
+            if results is not None:
+                results.add_violence_events(video_file, violence_detections, meta, camera_name(video_file))
 
-        if violence_detections:
-            print(f"Found {len(violence_detections)} violent clips in {video_file}")
-            export_violence_report(violence_detections, video_file)
-        else:
-            print(f"No violence detected in {video_file}")
+            if violence_detections:
+                print(f"Found {len(violence_detections)} violent events in {video_file}")
+                export_violence_report(violence_detections, video_file)
+            else:
+                print(f"No violence detected in {video_file}")
+            checkpoint.mark_done(meta.content_hash)
 
+    if score_store is not None:
+        score_store.flush()
+    if results is not None:
+        results.finish()
+    checkpoint.close(completed=True)
+    print(f"Tensor pool: {tensor_pool.summary()}")
     print("Violence detection complete!")
     return
\ No newline at end of file
@@ -0,0 +1,116 @@
+import heapq
+from collections import deque
+
+### VIOLENCE EVENT SEGMENTATION
+
+class ViolenceEventSegmenter:
+    """
+    Streaming post-processor that turns clip scores into violence events.
+      - Scores may arrive out of order; they are held in a small reorder
+        buffer and processed by start frame once `reorder_frames` newer
+        frames have been seen.
+      - Probabilities are smoothed with a moving average over `window` clips.
+      - Hysteresis: an event starts when the smoothed score reaches
+        `enter_threshold` and ends when it drops below `exit_threshold`,
+        or when consecutive clips are more than `max_gap` frames apart.
+    Each event is a dict with 'time', 'end_time', 'frame_idx', 'end_frame',
+    'probability' (peak raw clip probability) and 'peak_frame', the single
+    keyframe used for thumbnails. `on_open(event)` is called as soon as an
+    event starts, before its end is known.
+    """
+    def __init__(self, fps, enter_threshold=0.65, exit_threshold=0.5, window=3, max_gap=32, reorder_frames=64, on_open=None):
+        self.fps = fps or 30.0
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = min(exit_threshold, enter_threshold)
+        self.window = max(1, window)
+        self.max_gap = max_gap
+        self.reorder_frames = reorder_frames
+        self.on_open = on_open
+        self._pending = []     # Heap of (first, last, prob)
+        self._newest = None
+        self._recent = deque(maxlen=self.window)
+        self._last_frame = None
+        self._event = None
+        self.events = []
+
+    def push(self, first, last, prob):
+        """Add one clip score; returns the events closed by it"""
+        heapq.heappush(self._pending, (first, last, prob))
+        self._newest = first if self._newest is None else max(self._newest, first)
+        closed = []
+        while self._pending and self._pending[0][0] <= self._newest - self.reorder_frames:
+            closed.extend(self._process(*heapq.heappop(self._pending)))
+        return closed
+
+    def finish(self):
+        """Flush buffered scores and close any open event; returns the events closed"""
+        closed = []
+        while self._pending:
+            closed.extend(self._process(*heapq.heappop(self._pending)))
+        closed.extend(self._close())
+        return closed
+
+    def _process(self, first, last, prob):
+        closed = []
+        if self._last_frame is not None and first > self._last_frame + self.max_gap:
+            # Gap in coverage (e.g. between adaptive re-scan regions): restart smoothing
+            closed.extend(self._close())
+            self._recent.clear()
+        self._last_frame = last if self._last_frame is None else max(self._last_frame, last)
+
+        self._recent.append((first, prob))
+        smoothed = sum(p for _, p in self._recent) / len(self._recent)
+
+        if self._event is None:
+            if smoothed >= self.enter_threshold:
+                # Backdate the start to the earliest clip in the window that was already elevated
+                start = min((f for f, p in self._recent if p >= self.exit_threshold), default=first)
+                self._event = {
+                    'frame_idx': start,
+                    'end_frame': last,
+                    'probability': prob,
+                    'peak_frame': first,
+                }
+                if self.on_open is not None:
+                    self.on_open(dict(self._event, time=start / self.fps))
+        elif smoothed < self.exit_threshold:
+            closed.extend(self._close())
+        else:
+            self._event['end_frame'] = max(self._event['end_frame'], last)
+            if prob > self._event['probability']:
+                self._event['probability'] = prob
+                self._event['peak_frame'] = first
+        return closed
+
+    def _close(self):
+        if self._event is None:
+            return []
+        event = self._event
+        self._event = None
+        event['time'] = event['frame_idx'] / self.fps
+        event['end_time'] = event['end_frame'] / self.fps
+        self.events.append(event)
+        return [event]
+
+
+def segment_events(scores, fps, enter_threshold, exit_threshold, window=3, max_gap=32):
+    """Segment an iterable of (first, last, prob) clip scores into events"""
+    segmenter = ViolenceEventSegmenter(fps, enter_threshold, exit_threshold, window, max_gap)
+    for first, last, prob in scores:
+        segmenter.push(first, last, prob)
+    segmenter.finish()
+    return segmenter.events
+
+
+class EventTimeline:
+    """Look up the event active at a frame while frames are visited in order, in O(1) amortized time"""
+    def __init__(self, events):
+        self.events = sorted(events, key=lambda e: e['frame_idx'])
+        self._pos = 0
+
+    def active(self, frame_idx):
+        while self._pos < len(self.events) and self.events[self._pos]['end_frame'] < frame_idx:
+            self._pos += 1
+        if self._pos < len(self.events) and self.events[self._pos]['frame_idx'] <= frame_idx:
+            return self.events[self._pos]
+        return None
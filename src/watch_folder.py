@@ -0,0 +1,323 @@
+import os, sys, json, time, select, struct, ctypes, ctypes.util, argparse, threading
+import torch
+
+from config import config
+from video_index import VideoIndex, camera_name
+from decoders import read_frame_at
+from results_db import ResultsDB
+
+### WATCH-FOLDER DAEMON
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct("iIII")
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+def scan_videos(directories):
+    """Every video file below `directories`"""
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if is_video(name):
+                    yield os.path.join(root, name)
+
+
+class InotifyWatcher:
+    """Report touched video files using Linux inotify (via libc, no extra dependency)"""
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, directories):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = directories
+        self._dirs = {}
+        for directory in directories:
+            for root, _, _ in os.walk(directory):
+                self._watch(root)
+
+    def _watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._dirs[wd] = path
+
+    def poll(self, timeout):
+        """Wait up to `timeout` seconds; returns the set of touched video paths"""
+        touched = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return touched
+        data = os.read(self._fd, 1 << 16)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: fall back to a full scan
+                touched.update(scan_videos(self.directories))
+                continue
+            if wd not in self._dirs or not name:
+                continue
+            path = os.path.join(self._dirs[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # A new camera directory: watch it and pick up anything already in it
+                    for root, _, _ in os.walk(path):
+                        self._watch(root)
+                    touched.update(scan_videos([path]))
+            elif is_video(path):
+                touched.add(path)
+        return touched
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Report new or modified video files by rescanning the directories"""
+    def __init__(self, directories, interval=None):
+        self.directories = directories
+        self.interval = config.WATCH_POLL_INTERVAL if interval is None else interval
+        self._seen = self._snapshot()
+
+    def _snapshot(self):
+        snapshot = {}
+        for path in scan_videos(self.directories):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._snapshot()
+        touched = {path for path, sig in snapshot.items() if self._seen.get(path) != sig}
+        self._seen = snapshot
+        return touched
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    """
+    Yield video files under `directories` that are new or have changed,
+    once they are complete: a file is reported only after its size and
+    modification time have not changed for `settle_seconds`, so recordings
+    still being written are not picked up half-way. Existing files are
+    reported on start-up. Uses inotify where available, polling otherwise.
+    """
+    def __init__(self, directories, settle_seconds=None, use_inotify=True):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.settle_seconds = config.WATCH_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self._watcher = None
+        if use_inotify:
+            try:
+                self._watcher = InotifyWatcher(self.directories)
+                print("Watching with inotify")
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({e}); falling back to polling")
+        if self._watcher is None:
+            self._watcher = PollingWatcher(self.directories)
+            print(f"Polling every {self._watcher.interval:g}s")
+        self._pending = {path: None for path in scan_videos(self.directories)}
+
+    def _settled(self, now):
+        ready = []
+        for path, last in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            sig = (stat.st_size, stat.st_mtime)
+            if last is None or last[0] != sig:
+                self._pending[path] = (sig, now)
+            elif now - last[1] >= self.settle_seconds and stat.st_size > 0:
+                del self._pending[path]
+                ready.append(path)
+        return ready
+
+    def __call__(self, stop_event):
+        try:
+            while not stop_event.is_set():
+                for path in self._watcher.poll(1.0):
+                    self._pending.setdefault(path, None)
+                for path in sorted(self._settled(time.monotonic())):
+                    yield path
+        finally:
+            self._watcher.close()
+
+
+class WatchDaemon:
+    """
+    Long-running incremental indexer. Models are loaded once and kept warm;
+    every new or changed video (by content hash) is processed exactly once:
+      - faces are matched against the reference gallery, if one is given,
+        and clothing colours go into the attribute store,
+      - violence is scored and segmented into events,
+      - results are added to the results database and reports are refreshed,
+        so new footage is searchable minutes after it lands.
+    """
+    def __init__(self, directories, reference_files=None, violence=True, state_path=None, report_dir=None):
+        self.directories = directories
+        self.reference_files = list(reference_files or [])
+        self.violence = violence
+        self.state_path = state_path or os.path.join(config.INDEX_DIR, "watch_state.json")
+        self.report_dir = report_dir or os.path.join(config.OUTPUT_DIR, "watch")
+        os.makedirs(self.report_dir, exist_ok=True)
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        self.video_index = VideoIndex()
+        self.results = ResultsDB()
+        self.run_results = None   # The daemon's ResultsRun, started with the models
+        self.stop_event = threading.Event()
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def load_models(self):
+        """Load every model once; they stay resident for the lifetime of the daemon"""
+        from missing_person_detection import setup_missing_person_detection
+        from reference_gallery import ReferenceGallery
+        from attribute_index import AttributeStore
+        from embedding_index import FaceEmbeddingStore
+        from face_quality import FaceQualityGate
+        from calibration import FaceScoreStore, ViolenceScoreStore
+        from violence_detection import load_violence_detection_model
+
+        self.device, self.mtcnn, self.resnet = setup_missing_person_detection()
+        self.templates = None
+        self.reference_names = []  # Images a face was found in; sightings index templates by position here
+        self.face_scores = None
+        if self.reference_files:
+            gallery = ReferenceGallery(self.mtcnn, self.resnet, self.device).load(self.reference_files)
+            self.templates = gallery.templates
+            self.reference_names = gallery.filenames
+            self.face_scores = FaceScoreStore(gallery.filenames) if config.SCORE_STORE else None
+        self.attribute_store = AttributeStore() if config.ATTRIBUTE_INDEX else None
+        self.embedding_store = FaceEmbeddingStore() if config.EMBEDDING_INDEX else None
+        self.quality_gate = FaceQualityGate(image_size=self.mtcnn.image_size) if config.FACE_QUALITY_GATE else None
+        self.violence_model = load_violence_detection_model(self.device) if self.violence else None
+        self.violence_scores = ViolenceScoreStore() if config.SCORE_STORE and self.violence else None
+        # All sightings of the daemon go to one open-ended run, continued across restarts
+        self.run_results = self.results.start_run("watch", job_key="watch", resume=True,
+                                                  references=self.reference_names)
+
+    def process(self, path):
+        """Process one video unless a file with the same content was already processed"""
+        from missing_person_detection import process_video
+        from violence_detection import detect_violence_in_video
+        from report_generation import export_violence_report
+
+        meta = self.video_index.get(path)
+        if meta.content_hash in self.state:
+            return False
+        camera = camera_name(path)
+        print(f"New footage: {path} ({meta.duration:.0f}s)")
+        started = time.time()
+        sightings, events = 0, []
+
+        if self.templates is not None or self.attribute_store is not None or self.embedding_store is not None:
+            # Without references the face pass still indexes clothing colours and embeddings
+            templates = self.templates if self.templates is not None else torch.zeros((1, 512), device=self.device)
+            threshold = config.FACE_THRESH if self.templates is not None else 2.0
+            process_video(
+                path, self.mtcnn, self.resnet, self.device, templates, config.FRAME_INTERVAL, config.BATCH_SIZE,
+                threshold, stop_event=self.stop_event, metadata=meta,
+                attribute_store=self.attribute_store, embedding_store=self.embedding_store, preview=False,
+                quality_gate=self.quality_gate, score_store=self.face_scores, results=self.run_results
+            )
+            for store in (self.attribute_store, self.embedding_store, self.face_scores, self.run_results):
+                if store is not None:
+                    store.flush()
+            sightings = len(self.run_results.sightings(video=path))
+        if self.violence_model is not None:
+            events = detect_violence_in_video(
+                path, self.violence_model, self.device, config.VIOLENCE_THRESH, metadata=meta,
+                stop_event=self.stop_event, preview=False, score_store=self.violence_scores
+            )
+            if self.violence_scores is not None:
+                self.violence_scores.flush()
+        if self.stop_event.is_set():
+            return False  # Interrupted: process it again next time
+
+        self.run_results.add_violence_events(path, events, meta, camera)
+        self.run_results.flush()
+        if events:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            export_violence_report(events, path, os.path.join(self.report_dir, f"violence_{camera}_{stem}.pdf"),
+                                   open_viewer=False)
+        if sightings:
+            self.refresh_sightings_report()
+
+        self.state[meta.content_hash] = {
+            "path": path,
+            "processed_at": time.time(),
+            "sightings": sightings,
+            "violence_events": len(events),
+        }
+        self._save_state()
+        print(f"Indexed {os.path.basename(path)} in {time.time() - started:.1f}s: "
+              f"{sightings} sightings, {len(events)} violence events")
+        return True
+
+    def refresh_sightings_report(self, limit=100):
+        """Rebuild the cumulative sightings report from the results database (strongest matches first)"""
+        from report_generation import export_to_pdf
+
+        detections = []
+        for det in self.run_results.sightings(order="similarity").page(0, limit):
+            det['frame_img'] = read_frame_at(det['video'], det['frame_idx'], config.FACE_DECODE_WIDTH)
+            if det['frame_img'] is not None:
+                detections.append(det)
+        if detections:
+            export_to_pdf(detections, os.path.join(self.report_dir, "sightings.pdf"),
+                          ref_filenames=self.reference_names, open_viewer=False)
+
+    def run(self, use_inotify=True):
+        """Watch the directories until interrupted"""
+        self.load_models()
+        watcher = FolderWatcher(self.directories, use_inotify=use_inotify)
+        print(f"Watching {', '.join(self.directories)}. Press Ctrl+C to stop.")
+        try:
+            for path in watcher(self.stop_event):
+                try:
+                    self.process(path)
+                except Exception as e:
+                    # One unreadable file must not take the daemon down
+                    print(f"Failed to process {path}: {e}")
+        except KeyboardInterrupt:
+            self.stop_event.set()
+        print("Watcher stopped.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Watch camera folders and index new footage as it lands")
+    parser.add_argument("directories", nargs="+")
+    parser.add_argument("--references", nargs="*", default=[], help="Reference images of the missing person")
+    parser.add_argument("--no-violence", action="store_true")
+    parser.add_argument("--poll", action="store_true", help="Poll instead of using inotify")
+    args = parser.parse_args()
+    WatchDaemon(args.directories, args.references, violence=not args.no_violence).run(use_inotify=not args.poll)